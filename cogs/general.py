@@ -32,6 +32,7 @@ class GeneralCog(commands.Cog, name="ทั่วไป"):
             "**คำสั่ง Prefix `s!`:**\n"
             "`s!play <ชื่อเพลง/URL>` หรือ `s!p <ชื่อเพลง/URL>` - เล่นเพลงหรือเพิ่มเข้าคิว\n"
             "`s!skip` หรือ `s!s` - ข้ามเพลงปัจจุบัน\n"
+            "`s!seek <เวลา>` - เลื่อนไปยังตำแหน่งในเพลง (เช่น `1:30`, `+15`, `-10`)\n"
             "`s!stop` - หยุดเล่นเพลงและล้างคิว\n"
             "`s!pause` - หยุดเล่นเพลงชั่วคราว\n"
             "`s!resume` - เล่นเพลงต่อจากที่หยุดไว้\n"
@@ -39,6 +40,10 @@ class GeneralCog(commands.Cog, name="ทั่วไป"):
             "`s!nowplaying` หรือ `s!np` - แสดงเพลงที่กำลังเล่นอยู่\n"
             "`s!loop` หรือ `s!l` - เปลี่ยนโหมดการเล่นวน\n"
             "`s!clear` หรือ `s!clr` - ล้างคิวเพลงทั้งหมด\n"
+            "`s!remove <ลำดับ>` หรือ `s!rm` - ลบเพลงออกจากคิว\n"
+            "`s!move <จาก> <ไป>` หรือ `s!mv` - ย้ายลำดับเพลงในคิว\n"
+            "`s!shuffle` หรือ `s!sh` - สุ่มลำดับเพลงในคิว\n"
+            "`s!eta [ลำดับ]` - ดูเวลาโดยประมาณจนถึงเพลงของคุณ\n"
             "`s!join` - ให้บอทเข้าร่วมช่องเสียง\n"
             "`s!leave` หรือ `s!dc` - ให้บอทออกจากช่องเสียง"
         )
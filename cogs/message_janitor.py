@@ -0,0 +1,113 @@
+# cogs/message_janitor.py
+# Collects message deletions per channel for a short window and removes them with
+# one bulk-delete call instead of one REST call per message, so clearing user
+# queries in the music channel doesn't crowd the panel edits out of the
+# channel's rate-limit bucket. Also owns the bot-wide expiry queue that deletes
+# temporary replies (see jukebox.expiry.send_temporary).
+import asyncio
+import os
+import time
+
+import discord
+from discord.ext import commands
+
+from jukebox.expiry import MessageExpiryQueue
+
+JANITOR_BATCH_WINDOW = float(os.getenv("JANITOR_BATCH_WINDOW", 1.0)) # รวบรวมข้อความที่จะลบในช่องเดียวกันภายในช่วงเวลานี้
+BULK_DELETE_MAX = 100 # ข้อจำกัดของ Discord ต่อหนึ่ง bulk delete
+BULK_DELETE_MAX_AGE = 14 * 24 * 3600 - 60 # bulk delete ใช้ไม่ได้กับข้อความที่เก่ากว่า 14 วัน (เผื่อไว้ 1 นาที)
+EXPIRY_DB = os.path.join("data", "message_expiry.db") # ข้อความชั่วคราวที่รอลบ (อยู่รอดข้ามการรีสตาร์ท)
+
+
+class MessageJanitorCog(commands.Cog, name="MessageJanitorCog"):
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+        self._pending = {} # channel_id -> [message_id, ...] ที่รอลบในรอบถัดไป
+        self._flush_tasks = {} # channel_id -> task ที่รอครบช่วงเวลาแล้วลบ
+        self.counters = {'queued': 0, 'deleted': 0, 'bulk_calls': 0, 'single_calls': 0, 'bulk_fallbacks': 0, 'bulk_not_permitted': 0, 'failed': 0}
+        self.expiry = None; self._expiry_wakeup = asyncio.Event(); self._expiry_task = None
+
+    async def cog_load(self):
+        self.expiry = MessageExpiryQueue(EXPIRY_DB)
+        if self.expiry.restored: print(f"[JANITOR] Restored {self.expiry.restored} pending message deletion(s) from '{EXPIRY_DB}'")
+        self._expiry_task = asyncio.get_running_loop().create_task(self._expiry_loop())
+
+    async def cog_unload(self):
+        if self._expiry_task: self._expiry_task.cancel()
+        for task in self._flush_tasks.values(): task.cancel()
+        self._flush_tasks.clear()
+        for channel_id in list(self._pending): await self._delete_batch(channel_id, self._pending.pop(channel_id))
+        if self.expiry is not None: self.expiry.close() # ที่ยังไม่ถึงเวลาจะถูกลบหลังเริ่มบอทใหม่
+
+    def expire_later(self, message: discord.Message, delay: float):
+        """Delete `message` after `delay` seconds (one shared timer for every temporary message)."""
+        if self.expiry.add(message.channel.id, message.id, time.time() + max(0.0, float(delay))): self._expiry_wakeup.set()
+
+    async def _expiry_loop(self):
+        await self.bot.wait_until_ready()
+        while True:
+            self._expiry_wakeup.clear()
+            for channel_id, message_id in self.expiry.pop_due(time.time()): self.delete_ids_soon(channel_id, message_id) # รวมเป็น bulk ต่อช่อง
+            next_due = self.expiry.next_due()
+            try: await asyncio.wait_for(self._expiry_wakeup.wait(), None if next_due is None else max(0.0, next_due - time.time()))
+            except asyncio.TimeoutError: pass
+
+    @commands.Cog.listener()
+    async def on_raw_message_delete(self, payload: discord.RawMessageDeleteEvent):
+        if self.expiry is not None: self.expiry.cancel(payload.message_id) # ถูกลบไปแล้วด้วยวิธีอื่น: ไม่ต้องรอลบอีก
+
+    @commands.Cog.listener()
+    async def on_raw_bulk_message_delete(self, payload: discord.RawBulkMessageDeleteEvent):
+        if self.expiry is None: return
+        for message_id in payload.message_ids: self.expiry.cancel(message_id) # ผู้ดูแล purge ไปแล้ว: ไม่ต้องเก็บไว้จน 404
+
+    def delete_soon(self, message: discord.Message):
+        """Queue `message` for deletion without waiting for it (returns immediately)."""
+        self.delete_ids_soon(message.channel.id, message.id)
+
+    def delete_ids_soon(self, channel_id: int, message_id: int):
+        self.counters['queued'] += 1
+        self._pending.setdefault(channel_id, []).append(message_id)
+        task = self._flush_tasks.get(channel_id)
+        if task is None or task.done(): self._flush_tasks[channel_id] = asyncio.get_running_loop().create_task(self._flush_after_window(channel_id))
+
+    async def _flush_after_window(self, channel_id: int):
+        try:
+            await asyncio.sleep(JANITOR_BATCH_WINDOW)
+            while self._pending.get(channel_id): # ข้อความที่เข้ามาระหว่างลบจะไปรอบถัดไปของ task เดิม
+                await self._delete_batch(channel_id, self._pending.pop(channel_id))
+        finally:
+            if self._flush_tasks.get(channel_id) is asyncio.current_task(): del self._flush_tasks[channel_id]
+
+    def _can_bulk_delete(self, channel_id: int) -> bool:
+        # bulk delete ใช้ได้เฉพาะในช่องของ guild ที่บอทมีสิทธิ์ Manage Messages
+        channel = self.bot.get_channel(channel_id); guild = getattr(channel, 'guild', None)
+        return guild is not None and channel.permissions_for(guild.me).manage_messages
+
+    async def _delete_batch(self, channel_id: int, message_ids: list):
+        message_ids = list(dict.fromkeys(message_ids)); cutoff = time.time() - BULK_DELETE_MAX_AGE
+        if not self._can_bulk_delete(channel_id):
+            if len(message_ids) > 1: self.counters['bulk_not_permitted'] += 1
+            recent = []; singles = message_ids # ลบทีละข้อความ (ข้อความของบอทเองลบได้โดยไม่ต้องมีสิทธิ์)
+        else:
+            recent = [mid for mid in message_ids if discord.utils.snowflake_time(mid).timestamp() > cutoff]
+            singles = [mid for mid in message_ids if discord.utils.snowflake_time(mid).timestamp() <= cutoff]
+        for start in range(0, len(recent), BULK_DELETE_MAX):
+            chunk = recent[start:start + BULK_DELETE_MAX]
+            if len(chunk) < 2: singles.extend(chunk); continue # bulk delete ต้องมีอย่างน้อย 2 ข้อความ
+            try: await self.bot.http.delete_messages(channel_id, chunk); self.counters['bulk_calls'] += 1; self.counters['deleted'] += len(chunk)
+            except discord.HTTPException as e: # เช่น ไม่มีสิทธิ์ Manage Messages หรือบางข้อความหายไปแล้ว: ลบทีละข้อความแทน
+                self.counters['bulk_fallbacks'] += 1; singles.extend(chunk)
+                print(f"[JANITOR {channel_id}] Bulk delete of {len(chunk)} messages failed ({e}), deleting one by one")
+        for message_id in singles:
+            try: await self.bot.http.delete_message(channel_id, message_id); self.counters['single_calls'] += 1; self.counters['deleted'] += 1
+            except discord.NotFound: pass # ถูกลบไปแล้ว
+            except discord.HTTPException as e: self.counters['failed'] += 1; print(f"[JANITOR {channel_id}] Could not delete message {message_id}: {e}")
+
+    def stats(self) -> dict:
+        return {'batch_window': JANITOR_BATCH_WINDOW, **self.counters, 'pending': sum(len(ids) for ids in self._pending.values()),
+                **({f"expiry_{k}": v for k, v in self.expiry.stats().items()} if self.expiry is not None else {})}
+
+
+async def setup(bot: commands.Bot):
+    await bot.add_cog(MessageJanitorCog(bot))
@@ -2,10 +2,24 @@
 import discord
 from discord.ext import commands
 import yt_dlp
+import aiohttp
 import asyncio
 import math
 import traceback
 import json
+import os
+import time
+
+from jukebox.cache import ExtractionCache, stream_expiry, STREAM_EXPIRY_MARGIN_SECONDS
+from jukebox.extractor import create_extraction_pool
+from jukebox.formats import select_format, DEFAULT_TARGET_KBPS
+from jukebox.expiry import send_temporary
+from jukebox.audio_cache import AudioDiskCache
+from jukebox.audio import PrimedAudioSource, FrameCountingSource, read_after, FRAME_SECONDS
+from jukebox.player import GuildPlayer, LoopMode
+from jukebox.queue_pages import QueuePageRenderer
+from jukebox.replay import ReplayBudget, FrameRecording, RecordingSource, ReplaySource
+from jukebox.urls import classify_url, video_url, SINGLE, MIX
 
 YDL_OPTIONS_SINGLE_SONG = {
     'format': 'bestaudio/best', 
@@ -33,55 +47,100 @@ YDL_OPTIONS_PLAYLIST_DETECTED = {
     'source_address': '0.0.0.0',
     'forcejson': True,
 }
+YTDL_WORKERS = int(os.getenv("YTDL_WORKERS", 4))
+YTDL_EXTRACTION_MODE = os.getenv("YTDL_EXTRACTION_MODE", "thread").lower() # "thread" หรือ "process" (แยก yt-dlp ไปรันใน worker process)
+YTDL_JOB_TIMEOUT = float(os.getenv("YTDL_JOB_TIMEOUT", 60))
+YTDL_WORKER_MAX_JOBS = int(os.getenv("YTDL_WORKER_MAX_JOBS", 200))
+PLAYLIST_RESOLVE_CONCURRENCY = max(1, int(os.getenv("PLAYLIST_RESOLVE_CONCURRENCY", 4)))
+STREAM_LOOKAHEAD = max(1, int(os.getenv("STREAM_LOOKAHEAD", 3))) # resolve stream URL ล่วงหน้าเฉพาะ N เพลงถัดไปในคิว
+PREFETCH_LEAD_SECONDS = float(os.getenv("PREFETCH_LEAD_SECONDS", 8)) # เปิด FFmpeg ของเพลงถัดไปล่วงหน้ากี่วินาทีก่อนเพลงปัจจุบันจบ
+PLAYLIST_PAGE_SIZE = max(1, int(os.getenv("PLAYLIST_PAGE_SIZE", 100))) # ดึงรายการเพลย์ลิสต์ทีละหน้า (playlist_items)
+PLAYLIST_PAGE_WATERMARK = int(os.getenv("PLAYLIST_PAGE_WATERMARK", 25)) # ดึงหน้าถัดไปเมื่อคิวเหลือน้อยกว่านี้
+EXTRACTION_CACHE_MAX_ENTRIES = int(os.getenv("EXTRACTION_CACHE_MAX_ENTRIES", 1024))
+EXTRACTION_CACHE_MAX_MB = int(os.getenv("EXTRACTION_CACHE_MAX_MB", 32))
+AUDIO_CACHE_MAX_MB = int(os.getenv("AUDIO_CACHE_MAX_MB", 0)) # เก็บไฟล์เสียงของเพลงที่เล่นบ่อยไว้บนดิสก์ (0 = ปิด)
+AUDIO_CACHE_DIR = os.getenv("AUDIO_CACHE_DIR", os.path.join("data", "audio_cache"))
+AUDIO_CACHE_MIN_PLAYS = int(os.getenv("AUDIO_CACHE_MIN_PLAYS", 3)) # เล่นครบกี่ครั้งถึงจะดาวน์โหลดเก็บไว้
+AUDIO_CACHE_FILL_CONCURRENCY = max(1, int(os.getenv("AUDIO_CACHE_FILL_CONCURRENCY", 2)))
+LOOP_REPLAY_GUILD_MB = float(os.getenv("LOOP_REPLAY_GUILD_MB", 16)) # เก็บเฟรม Opus ของเพลงที่วน (LoopMode.SONG) ในหน่วยความจำได้ต่อ guild (0 = ปิด)
+LOOP_REPLAY_TOTAL_MB = float(os.getenv("LOOP_REPLAY_TOTAL_MB", 256)) # รวมทุก guild; เกินนี้บันทึกลงไฟล์ชั่วคราวแทน
+STREAM_RESUME_ATTEMPTS = int(os.getenv("STREAM_RESUME_ATTEMPTS", 3)) # สตรีมหลุดกลางเพลง: เปิดใหม่ที่ตำแหน่งเดิมได้กี่ครั้งต่อเพลง (0 = ข้ามไปเพลงถัดไปเหมือนเดิม)
+STREAM_RESUME_MARGIN_SECONDS = 5 # จบก่อนความยาวเพลงไม่เกินนี้ถือว่าเล่นจบปกติ
+PLAYBACK_MODE = os.getenv("PLAYBACK_MODE", "auto").lower() # "auto" (ส่ง Opus ต่อโดยไม่ decode เมื่อทำได้) หรือ "pcm" (decode + ปรับเสียงทุกเพลง)
+VOICE_SIGNAL_TYPE = 'music' # ใช้ตอนสร้าง Opus encoder ของ discord.py (เฉพาะ source แบบ PCM)
 FFMPEG_OPTIONS = {
     'before_options': '-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5',
     'options': '-vn'
 }
 
-class LoopMode:
-    NONE = 0; SONG = 1; QUEUE = 2
-    TEXT = {NONE: "ปิด", SONG: "เพลงเดียว", QUEUE: "ทั้งคิว"}
+def _format_duration(seconds: int) -> str:
+    m, s = divmod(int(seconds), 60); h, m = divmod(m, 60)
+    return f"{h:d}:{m:02d}:{s:02d}" if h else f"{m:02d}:{s:02d}"
+
+def _parse_timestamp(text: str):
+    # "90", "1:30", "1:02:03" -> วินาที (None ถ้าอ่านไม่ได้)
+    try: parts = [float(part) for part in text.strip().split(':')]
+    except ValueError: return None
+    if not 1 <= len(parts) <= 3 or any(part < 0 for part in parts): return None
+    seconds = 0.0
+    for part in parts: seconds = seconds * 60 + part
+    return seconds
+
 
 class MusicCog(commands.Cog, name="MusicCog"):
     def __init__(self, bot: commands.Bot):
-        self.bot = bot; self.voice_clients = {}; self.song_queue = {}; self.current_song = {}
-        self.auto_leave_tasks = {}; self.playlist_processing_tasks = {}; self.active_playlist_summaries = {}
-        self.loop_mode = {}; self.guild_volumes = {}; self.is_guild_muted = {}
+        self.bot = bot; self.players = {}; self.pending_resolves = {}
+        self.extraction_pool = create_extraction_pool({'single_song': YDL_OPTIONS_SINGLE_SONG, 'search': YDL_OPTIONS_SEARCH, 'playlist_detected': YDL_OPTIONS_PLAYLIST_DETECTED},
+                                                      mode=YTDL_EXTRACTION_MODE, max_workers=YTDL_WORKERS, job_timeout=YTDL_JOB_TIMEOUT, max_jobs_per_worker=YTDL_WORKER_MAX_JOBS)
+        self.extraction_cache = ExtractionCache(max_entries=EXTRACTION_CACHE_MAX_ENTRIES, max_bytes=EXTRACTION_CACHE_MAX_MB * 1024 * 1024)
+        self.jit_stats = {'lookahead_resolved': 0, 'lookahead_failed': 0, 'resolved_at_play': 0, 'refreshed_expired': 0}
+        self.prefetch_stats = {'primed': 0, 'used': 0, 'discarded': 0, 'failed': 0}
+        self.ttfa_stats = {} # url kind -> time from request to first audio
+        self.playback_stats = {'started_passthrough': 0, 'started_pcm': 0, 'switched_to_pcm': 0, 'switched_to_passthrough': 0, 'switch_failed': 0}
+        self._cpu_sample = (time.monotonic(), time.process_time())
+        self.format_stats = {} # codec ของ format ที่เลือก -> [count, total_score]
+        self.audio_cache = AudioDiskCache(AUDIO_CACHE_DIR, AUDIO_CACHE_MAX_MB * 1024 * 1024, min_plays=AUDIO_CACHE_MIN_PLAYS) if AUDIO_CACHE_MAX_MB > 0 else None
+        self._audio_cache_fills = asyncio.Semaphore(AUDIO_CACHE_FILL_CONCURRENCY); self._audio_cache_session = None
+        self.replay_budget = ReplayBudget(int(LOOP_REPLAY_GUILD_MB * 1024 * 1024), int(LOOP_REPLAY_TOTAL_MB * 1024 * 1024))
+        self.replay_stats = {'recorded': 0, 'replays': 0, 'discarded': 0}
+        self.position_stats = {'seeks': 0, 'seek_failed': 0, 'seek_total_ms': 0.0, 'resumed_after_drop': 0, 'resume_gave_up': 0}
+        self.queue_pages = QueuePageRenderer() # ใช้ร่วมกันระหว่าง s!queue และปุ่ม Queue บน panel
+        self.playlist_page_stats = {'pages_fetched': 0, 'entries_queued': 0, 'feeds_finished': 0, 'page_errors': 0}
 
     async def _call_panel_update(self, guild_id: int): # ... (เหมือนเดิม)
         try:
             music_panel_cog = self.bot.get_cog("MusicPanelCog")
-            if music_panel_cog and hasattr(music_panel_cog, "update_music_panel"):
-                self.bot.loop.create_task(music_panel_cog.update_music_panel(guild_id))
+            if music_panel_cog and hasattr(music_panel_cog, "request_panel_update"): music_panel_cog.request_panel_update(guild_id)
         except Exception as e: print(f"Error trying to call panel update for guild {guild_id}: {e}")
-    def _get_song_queue(self, guild_id: int): # ... (เหมือนเดิม)
-        if guild_id not in self.song_queue: self.song_queue[guild_id] = []
-        return self.song_queue[guild_id]
-    def _cleanup_guild_data(self, guild_id: int): # ... (เหมือนเดิม)
-        if guild_id in self.voice_clients: del self.voice_clients[guild_id]
-        if guild_id in self.song_queue: self.song_queue[guild_id].clear()
-        if guild_id in self.current_song: self.current_song[guild_id] = None
-        if self.auto_leave_tasks.get(guild_id) and not self.auto_leave_tasks[guild_id].done(): self.auto_leave_tasks[guild_id].cancel()
-        if guild_id in self.auto_leave_tasks: del self.auto_leave_tasks[guild_id]
-        if self.playlist_processing_tasks.get(guild_id) and not self.playlist_processing_tasks[guild_id].done(): self.playlist_processing_tasks[guild_id].cancel()
-        if guild_id in self.playlist_processing_tasks: del self.playlist_processing_tasks[guild_id]
-        if guild_id in self.active_playlist_summaries: del self.active_playlist_summaries[guild_id]
-        if guild_id in self.loop_mode: del self.loop_mode[guild_id]
-        if guild_id in self.is_guild_muted: del self.is_guild_muted[guild_id]
+    def cog_unload(self):
+        for player in self.players.values(): player.release()
+        self.players.clear(); self.extraction_pool.shutdown()
+        if self.audio_cache: self.audio_cache.save_index()
+        if self._audio_cache_session and not self._audio_cache_session.closed: self.bot.loop.create_task(self._audio_cache_session.close())
+    def _get_player(self, guild_id: int) -> GuildPlayer: # สร้าง player เมื่อจำเป็นเท่านั้น (ใช้ self.players.get สำหรับการอ่านอย่างเดียว)
+        player = self.players.get(guild_id)
+        if player is None: player = self.players[guild_id] = GuildPlayer(guild_id)
+        return player
+    def _voice_client(self, guild_id: int):
+        player = self.players.get(guild_id)
+        return player.voice_client if player else None
+    def _get_song_queue(self, guild_id: int):
+        player = self.players.get(guild_id)
+        return player.queue if player else []
+    def _cleanup_guild_data(self, guild_id: int): # ปล่อย player ทั้งก้อนเมื่อบอทออกจากช่องเสียง
+        player = self.players.pop(guild_id, None)
+        if player: player.release()
         print(f"Cleaned up music data for guild {guild_id}")
         self.bot.loop.create_task(self._call_panel_update(guild_id))
     async def _schedule_auto_leave(self, guild_or_ctx, delay: int, reason: str = "inactivity"): # ... (เหมือนเดิม)
         guild_id = guild_or_ctx.id if isinstance(guild_or_ctx, discord.Guild) else guild_or_ctx.guild.id
-        if self.auto_leave_tasks.get(guild_id) and not self.auto_leave_tasks[guild_id].done():
-            self.auto_leave_tasks[guild_id].cancel(); 
-            if guild_id in self.auto_leave_tasks: del self.auto_leave_tasks[guild_id]
+        player = self._get_player(guild_id); player.cancel_auto_leave()
         async def leave_task():
             await asyncio.sleep(delay)
-            current_task_in_map = self.auto_leave_tasks.get(guild_id)
-            if current_task_in_map != asyncio.current_task(): return
-            vc = self.voice_clients.get(guild_id); queue = self._get_song_queue(guild_id)
+            if player.auto_leave_task != asyncio.current_task() or self.players.get(guild_id) is not player: return
+            vc = player.voice_client; queue = player.queue
             if vc and vc.is_connected():
-                is_looping_queue_and_empty = (self.loop_mode.get(guild_id, LoopMode.NONE) == LoopMode.QUEUE and not queue)
+                is_looping_queue_and_empty = (player.loop_mode == LoopMode.QUEUE and not queue)
                 if not vc.is_playing() and not vc.is_paused() and not queue and not is_looping_queue_and_empty :
                     message_on_leave = f"🎵 ออกจากช่องเสียงเนื่องจาก {reason} เป็นเวลา {delay} วินาที"
                     if reason == "queue_empty": message_on_leave = f"🎵 คิวเพลงว่างเป็นเวลา {delay} วินาที จึงออกจากช่องเสียง"
@@ -91,58 +150,308 @@ class MusicCog(commands.Cog, name="MusicCog"):
                         guild = guild_or_ctx
                         if guild.system_channel and guild.system_channel.permissions_for(guild.me).send_messages: channel_to_send = guild.system_channel
                     if channel_to_send:
-                        try: await channel_to_send.send(message_on_leave, delete_after=30)
+                        try: await send_temporary(self.bot, channel_to_send, message_on_leave, delete_after=30)
                         except discord.HTTPException: print(f"Failed to send auto-leave message to channel in guild {guild_id}")
                     else: print(f"Bot auto-disconnected from guild {guild_id} due to {reason}. (No suitable ctx/channel to send message)")
                     await vc.disconnect()
                 else: print(f"Auto-leave for guild {guild_id} ({reason}) aborted: Conditions no longer met.")
-            if guild_id in self.auto_leave_tasks and self.auto_leave_tasks.get(guild_id) == asyncio.current_task(): del self.auto_leave_tasks[guild_id]
-        new_task = self.bot.loop.create_task(leave_task()); self.auto_leave_tasks[guild_id] = new_task
+            if player.auto_leave_task == asyncio.current_task(): player.auto_leave_task = None
+        player.auto_leave_task = self.bot.loop.create_task(leave_task())
     async def _play_next(self, guild_id: int, text_channel_for_notif: discord.TextChannel = None, silent_mode: bool = False): # ... (เหมือนเดิม)
-        queue = self._get_song_queue(guild_id); vc = self.voice_clients.get(guild_id)
-        current_loop_mode = self.loop_mode.get(guild_id, LoopMode.NONE); song_that_just_finished = self.current_song.get(guild_id)
-        if self.auto_leave_tasks.get(guild_id) and not self.auto_leave_tasks[guild_id].done():
-            self.auto_leave_tasks[guild_id].cancel()
-            if guild_id in self.auto_leave_tasks: del self.auto_leave_tasks[guild_id]
+        player = self.players.get(guild_id)
+        if player is None:
+            await self._call_panel_update(guild_id); return
+        if player.starting_playback: return # กำลัง resolve เพลงถัดไปอยู่แล้ว
+        queue = player.queue; vc = player.voice_client
+        current_loop_mode = player.loop_mode; song_that_just_finished = player.current_song
+        resume_at = player.resume_at; player.resume_at = None
+        player.cancel_auto_leave()
         if not vc or not vc.is_connected():
-            self.current_song[guild_id] = None
-            if not queue and not self.active_playlist_summaries.get(guild_id) and not silent_mode and text_channel_for_notif:
-                await text_channel_for_notif.send("🎶 **ไม่มีเพลงในคิวแล้ว** และบอทไม่ได้อยู่ในช่องเสียง", delete_after=15)
+            player.current_song = None
+            if not queue and not silent_mode and text_channel_for_notif:
+                await send_temporary(self.bot, text_channel_for_notif, "🎶 **ไม่มีเพลงในคิวแล้ว** และบอทไม่ได้อยู่ในช่องเสียง", delete_after=15)
             await self._call_panel_update(guild_id); return
         if song_that_just_finished:
-            if current_loop_mode == LoopMode.SONG: queue.insert(0, song_that_just_finished)
+            if resume_at is not None: queue.appendleft(song_that_just_finished) # สตรีมหลุดกลางเพลง: เล่นเพลงเดิมต่อจากตำแหน่งที่หลุด
+            elif current_loop_mode == LoopMode.SONG: queue.appendleft(song_that_just_finished)
             elif current_loop_mode == LoopMode.QUEUE: queue.append(song_that_just_finished)
+        if not queue and player.playlist_feeds: # คิวหมดก่อนหน้าถัดไปของเพลย์ลิสต์มาถึง: รอหน้าถัดไปก่อน
+            player.current_song = None; player.starting_playback = True
+            try:
+                while not queue and player.playlist_feeds and self.players.get(guild_id) is player:
+                    self._maybe_pull_playlist_page(player, force=True)
+                    if player.playlist_feed_task: await asyncio.wait({player.playlist_feed_task})
+            finally: player.starting_playback = False
+            if self.players.get(guild_id) is not player: return
+            vc = player.voice_client
+            if not vc or not vc.is_connected() or vc.is_playing() or vc.is_paused(): return
         if not queue:
-            self.current_song[guild_id] = None
-            if not self.active_playlist_summaries.get(guild_id) and not silent_mode and text_channel_for_notif:
-                 await text_channel_for_notif.send("🎶 **ไม่มีเพลงในคิวแล้ว**", delete_after=15)
+            player.current_song = None
+            if not silent_mode and text_channel_for_notif:
+                 await send_temporary(self.bot, text_channel_for_notif, "🎶 **ไม่มีเพลงในคิวแล้ว**", delete_after=15)
             if vc and vc.is_connected() and current_loop_mode != LoopMode.QUEUE :
                  await self._schedule_auto_leave(vc.guild, delay=60, reason="queue_empty")
             await self._call_panel_update(guild_id); return
         if vc.is_playing() or vc.is_paused(): return
-        song_info = queue.pop(0); self.current_song[guild_id] = song_info
+        self._cancel_prefetch(player, keep_primed=True) # primed source (ถ้ามี) จะถูกตรวจว่าตรงกับเพลงที่จะเล่นด้านล่าง
+        song_info = queue.popleft(); player.current_song = song_info
+        start_seconds = resume_at if resume_at is not None and song_info is song_that_just_finished else 0.0
+        if not start_seconds: player.resume_attempts = 0
+        elif player.primed and player.primed[0] is song_info and player.discard_primed(): self.prefetch_stats['discarded'] += 1 # source ของเพลงนี้ที่เตรียมไว้เริ่มจากต้นเพลง; ของเพลงถัดไปเก็บไว้ใช้ต่อ
+        self._maybe_pull_playlist_page(player)
+        if player.replay is not None and player.replay.song is not song_info and player.discard_replay(): self.replay_stats['discarded'] += 1 # เปลี่ยนเพลงแล้ว
+        if self._needs_stream_resolve(song_info) and not self._replay_for(player, song_info): # เพลงยังไม่ได้ resolve (หรือ URL หมดอายุแล้ว) ต้องรอก่อนเล่น
+            self.jit_stats['resolved_at_play' if not song_info.get('stream_url') else 'refreshed_expired'] += 1
+            player.starting_playback = True
+            try: resolved = await self._ensure_song_resolved(song_info, player)
+            finally: player.starting_playback = False
+            if player.current_song is not song_info or self.players.get(guild_id) is not player: return # ถูก stop/clear ระหว่างรอ
+            if not resolved:
+                print(f"[JIT {guild_id}] Could not resolve stream for '{song_info.get('title')}'. Skipping.")
+                if not silent_mode and text_channel_for_notif:
+                    try: await send_temporary(self.bot, text_channel_for_notif, f"⚠️ ข้ามเพลง **{song_info.get('title', 'Unknown')}** (ไม่สามารถดึง URL สตรีมได้)", delete_after=10)
+                    except discord.HTTPException: pass
+                player.current_song = None
+                self.bot.loop.create_task(self._play_next(guild_id, text_channel_for_notif, silent_mode)); return
+            vc = player.voice_client
+            if not vc or not vc.is_connected() or vc.is_playing() or vc.is_paused(): return
+        self._refill_lookahead(guild_id)
         class MinimalCtxForAfter:
             def __init__(self, bot, guild, channel): self.bot = bot; self.guild = guild; self.channel = channel
         fake_after_ctx = MinimalCtxForAfter(self.bot, vc.guild, text_channel_for_notif)
         try:
-            audio_source_url = song_info['stream_url']
-            guild_volume_settings = self.guild_volumes.get(guild_id, {}) 
-            current_volume_float = guild_volume_settings.get('current', 0.7)
-            volume_to_apply = 0.0 if self.is_guild_muted.get(guild_id, False) else current_volume_float
-            source = discord.PCMVolumeTransformer(discord.FFmpegPCMAudio(audio_source_url, **FFMPEG_OPTIONS), volume=volume_to_apply)
-            vc.play(source, after=lambda e: self.bot.loop.create_task(self._check_after_play(fake_after_ctx, guild_id, text_channel_for_notif, silent_mode, e)))
+            audio_source = (None if start_seconds else self._take_primed_source(player, song_info)) or self._open_audio_source(player, song_info, start_seconds)
+            if isinstance(audio_source, ReplaySource): self.replay_stats['replays'] += 1
+            elif not start_seconds: audio_source = self._maybe_record(player, song_info, audio_source)
+            source = FrameCountingSource(self._wrap_for_playback(player, audio_source), start_seconds=start_seconds)
+            self.playback_stats['started_passthrough' if source.is_opus() else 'started_pcm'] += 1
+            vc.play(source, after=lambda e: self.bot.loop.create_task(self._check_after_play(fake_after_ctx, guild_id, text_channel_for_notif, silent_mode, e, song_info)),
+                    bitrate=self._target_kbps(player), signal_type=VOICE_SIGNAL_TYPE) # encoder ของ discord.py (ใช้เฉพาะ PCM) เข้ารหัสที่ bitrate ของช่องเสียง แทนค่าเริ่มต้น 128 kbps
+            player.position_source = source; self._schedule_prefetch(player, song_info)
+            if start_seconds: await self._call_panel_update(guild_id); return # เล่นต่อหลังสตรีมหลุด: ไม่นับเป็นการเล่นใหม่/ไม่แจ้งซ้ำ
+            self._maybe_fill_audio_cache(song_info)
             if not silent_mode and text_channel_for_notif:
-                try: await text_channel_for_notif.send(f"🎶 กำลังเล่น: **{song_info['title']}**", delete_after=song_info.get('duration', 600))
+                try: await send_temporary(self.bot, text_channel_for_notif, f"🎶 กำลังเล่น: **{song_info['title']}**", delete_after=song_info.get('duration', 600))
                 except discord.HTTPException as e: print(f"Failed to send 'Now playing' message to {text_channel_for_notif.name}: {e}")
             await self._call_panel_update(guild_id)
         except Exception as e:
             print(f"Error in _play_next trying to play {song_info.get('title', 'Unknown')}: {e}"); traceback.print_exc()
             if not silent_mode and text_channel_for_notif:
-                try: await text_channel_for_notif.send(f"เกิดข้อผิดพลาดในการเล่นเพลง: {e}", delete_after=10)
+                try: await send_temporary(self.bot, text_channel_for_notif, f"เกิดข้อผิดพลาดในการเล่นเพลง: {e}", delete_after=10)
                 except discord.HTTPException as he: print(f"Failed to send error message in _play_next: {he}")
-            self.current_song[guild_id] = None; await self._call_panel_update(guild_id)
+            player.current_song = None; await self._call_panel_update(guild_id)
             self.bot.loop.create_task(self._play_next(guild_id, text_channel_for_notif, silent_mode))
-    async def _check_after_play(self, ctx_like_object, guild_id: int, text_channel_for_notif: discord.TextChannel = None, silent_mode: bool = False, error_obj=None): # ... (เหมือนเดิม)
+    def _wants_passthrough(self, player: GuildPlayer, song_info: dict) -> bool:
+        # ส่งแพ็กเก็ต Opus ของต้นทางตรงไปยัง Discord ได้เฉพาะเมื่อไม่ต้องแตะตัวเสียง (ความดัง 100%, ไม่ mute)
+        return PLAYBACK_MODE == "auto" and player.applied_volume == 1.0 and ((song_info.get('acodec') or '').startswith('opus') or self._replay_for(player, song_info) is not None)
+
+    def _open_audio_source(self, player: GuildPlayer, song_info: dict, start_seconds: float = 0.0) -> discord.AudioSource:
+        replay = self._replay_for(player, song_info)
+        if replay: return ReplaySource(replay, start_frame=int(start_seconds / FRAME_SECONDS), decode=not self._wants_passthrough(player, song_info)) # ไม่มี FFmpeg/network เลย
+        local_path = self.audio_cache.lookup(song_info) if self.audio_cache else None # ไฟล์ในแคชมาก่อนเสมอ
+        before_options = ("" if local_path else FFMPEG_OPTIONS['before_options']) + (f" -ss {start_seconds:.2f}" if start_seconds > 0 else "")
+        audio_input = local_path or song_info['stream_url']
+        if self._wants_passthrough(player, song_info): # FFmpeg แค่ demux: ไม่มี decode/encode ทั้งใน FFmpeg และใน Python
+            return discord.FFmpegOpusAudio(audio_input, codec='copy', before_options=before_options.strip() or None, options=FFMPEG_OPTIONS['options'])
+        return discord.FFmpegPCMAudio(audio_input, before_options=before_options.strip() or None, options=FFMPEG_OPTIONS['options'])
+
+    def _replay_for(self, player: GuildPlayer, song_info: dict):
+        replay = player.replay
+        return replay if replay is not None and replay.song is song_info and replay.complete else None
+
+    def _maybe_record(self, player: GuildPlayer, song_info: dict, audio_source: discord.AudioSource) -> discord.AudioSource:
+        # บันทึกเฉพาะเมื่อเริ่มเพลงในโหมดวนเพลงเดียว (รอบแรกยังเล่นจาก FFmpeg ตามปกติ)
+        if LOOP_REPLAY_GUILD_MB <= 0 or player.loop_mode != LoopMode.SONG or self._replay_for(player, song_info): return audio_source
+        if player.discard_replay(): self.replay_stats['discarded'] += 1 # บันทึกเดิมไม่ครบ (ข้าม/สลับโหมดกลางเพลง)
+        encoder = None
+        if not audio_source.is_opus(): encoder = discord.opus.Encoder(); encoder.set_bitrate(self._target_kbps(player)) # PCM: เข้ารหัสเก็บเป็น Opus
+        player.replay = FrameRecording(song_info, player.guild_id, self.replay_budget); self.replay_stats['recorded'] += 1
+        return RecordingSource(audio_source, player.replay, encoder)
+
+    def _replay_stats(self) -> dict:
+        recordings = [p.replay for p in self.players.values() if p.replay is not None]
+        return {**self.replay_stats, 'completed_recordings': sum(1 for r in recordings if r.complete), 'active_recordings': len(recordings),
+                'spilled_to_disk': sum(1 for r in recordings if r.spilled), 'memory_bytes': self.replay_budget.used,
+                'largest_guild_bytes': self.replay_budget.largest_guild(), 'guild_cap_bytes': self.replay_budget.guild_cap, 'total_cap_bytes': self.replay_budget.total_cap}
+
+    def _maybe_fill_audio_cache(self, song_info: dict):
+        if not self.audio_cache or not song_info.get('duration') or not song_info.get('stream_url'): return # live stream ไม่เก็บ
+        if self.audio_cache.record_play(song_info): self.bot.loop.create_task(self._fill_audio_cache(song_info))
+
+    async def _fill_audio_cache(self, song_info: dict):
+        # ดาวน์โหลดเบื้องหลังด้วย session แยก ไม่เกี่ยวกับการเล่นเพลงที่กำลังดำเนินอยู่
+        async with self._audio_cache_fills:
+            if self._audio_cache_session is None or self._audio_cache_session.closed:
+                self._audio_cache_session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=None, sock_connect=15, sock_read=30))
+            await self.audio_cache.fill(song_info, self._audio_cache_session)
+
+    def _wrap_for_playback(self, player: GuildPlayer, audio_source: discord.AudioSource) -> discord.AudioSource:
+        return audio_source if audio_source.is_opus() else discord.PCMVolumeTransformer(audio_source, volume=player.applied_volume)
+
+    def _target_kbps(self, player: GuildPlayer = None) -> float:
+        vc = player.voice_client if player else None
+        return max(16, min(512, vc.channel.bitrate // 1000)) if vc and vc.channel else DEFAULT_TARGET_KBPS
+
+    def _choose_stream(self, data: dict, target_kbps: float):
+        # -> (stream URL, ข้อมูล format สำหรับเก็บใน song_info); ใช้ร่วมกันทุกเส้นทางที่ resolve เพลง
+        fmt, score = select_format(data, target_kbps)
+        if fmt is None: fmt = data # ไม่มี formats ให้เลือก (เช่น direct URL): ใช้ URL ที่ yt-dlp เลือกให้
+        codec = (fmt.get('acodec') or 'unknown').split('.')[0]; entry = self.format_stats.setdefault(codec, [0, 0.0])
+        entry[0] += 1; entry[1] += score or 0.0
+        return fmt.get('url'), {'acodec': fmt.get('acodec'), 'format_id': fmt.get('format_id'), 'format_score': score}
+
+    def _apply_volume(self, player: GuildPlayer):
+        vc = player.voice_client; source = vc.source if vc and vc.is_connected() else None
+        if not isinstance(source, FrameCountingSource) or not player.current_song: return
+        if not source.is_opus(): source.source.volume = player.applied_volume # PCMVolumeTransformer
+        if source.is_opus() != self._wants_passthrough(player, player.current_song) and not (player.source_switch_task and not player.source_switch_task.done()):
+            player.source_switch_task = self.bot.loop.create_task(self._switch_playback_mode(player))
+        if player.primed and player.primed[1].is_opus() != self._wants_passthrough(player, player.primed[0]): self._reset_prefetch(player)
+
+    async def _switch_playback_mode(self, player: GuildPlayer):
+        # เปิดเพลงปัจจุบันใหม่อีกโหมดที่ตำแหน่งเดิม แล้วสลับ vc.source (เพลงเดิมยังเล่นต่อระหว่างเตรียม)
+        loop = asyncio.get_running_loop()
+        while True:
+            vc = player.voice_client; current = vc.source if vc and vc.is_connected() else None; song = player.current_song
+            if not isinstance(current, FrameCountingSource) or not song or current.is_opus() == self._wants_passthrough(player, song): return
+            frames_at_open = current.frames; audio_source = self._open_audio_source(player, song, start_seconds=current.position)
+            try:
+                first_frame = await loop.run_in_executor(None, audio_source.read)
+                behind = current.frames - frames_at_open # เฟรมที่เพลงเดิมเล่นไปแล้วระหว่างรอ FFmpeg ตัวใหม่
+                if first_frame and behind > 0: first_frame = await loop.run_in_executor(None, read_after, audio_source, behind - 1) # ตามให้ทันตำแหน่งปัจจุบัน
+            except BaseException: audio_source.cleanup(); raise
+            if not first_frame or vc.source is not current or player.current_song is not song:
+                audio_source.cleanup()
+                if not first_frame: self.playback_stats['switch_failed'] += 1; print(f"[PLAYBACK {player.guild_id}] Could not reopen '{song.get('title')}' for a mode switch"); return
+                continue
+            self._swap_playing_source(player, current, audio_source, first_frame, current.position)
+            self.playback_stats['switched_to_passthrough' if vc.source.is_opus() else 'switched_to_pcm'] += 1
+            print(f"[PLAYBACK {player.guild_id}] Switched '{song.get('title')}' to {'Opus passthrough' if vc.source.is_opus() else 'PCM'} at {current.position:.1f}s")
+
+    def _swap_playing_source(self, player: GuildPlayer, current: FrameCountingSource, audio_source: discord.AudioSource, first_frame: bytes, start_seconds: float):
+        # แทน source ที่กำลังเล่นด้วย source ที่เปิดไว้แล้ว (ได้เฟรมแรกแล้ว) โดยไม่หยุดเพลง/ไม่เรียก after callback
+        vc = player.voice_client; was_paused = vc.is_paused()
+        if not audio_source.is_opus() and not vc.encoder: # vc.play() สร้าง encoder เฉพาะเมื่อ source แรกเป็น PCM: เพลงที่เริ่มแบบ passthrough ยังไม่มี
+            vc.encoder = discord.opus.Encoder(bitrate=self._target_kbps(player), signal_type=VOICE_SIGNAL_TYPE)
+        new_source = player.position_source = FrameCountingSource(self._wrap_for_playback(player, PrimedAudioSource(audio_source, first_frame)), start_seconds=start_seconds)
+        audio_player = getattr(vc, '_player', None)
+        if was_paused and audio_player is not None: # vc.source = ... (set_source) จะ resume ชั่วครู่จนเฟรมหลุดออกไป: thread เสียงรออยู่ จึงแค่เปลี่ยน source ให้อ่านเมื่อ resume
+            with audio_player._lock: audio_player.source = new_source
+        else: vc.source = new_source
+        self.bot.loop.call_later(1.0, current.cleanup) # thread เสียงอาจยังอ่านเฟรมสุดท้ายจาก source เดิมอยู่
+
+    def _current_position(self, player: GuildPlayer):
+        """Seconds into the current song, counted from the frames actually sent (None if nothing is playing)."""
+        source = player.position_source if player and player.current_song else None
+        return source.position if source is not None else None
+
+    def playback_position(self, guild_id: int):
+        # สำหรับ panel: (ตำแหน่งปัจจุบัน, ความยาวเพลง) หรือ None
+        player = self.players.get(guild_id); position = self._current_position(player)
+        return (position, player.current_song.get('duration') or 0) if position is not None else None
+
+    async def player_seek(self, guild_id: int, seconds: float, relative: bool = False) -> str:
+        # เปิด FFmpeg ใหม่ด้วย -ss ฝั่ง input (กระโดดไปตำแหน่งนั้นเลย ไม่ต้อง decode ตั้งแต่ต้นเพลง) แล้วสลับ source ที่กำลังเล่น
+        player = self.players.get(guild_id); vc = player.voice_client if player else None; song = player.current_song if player else None
+        current = vc.source if vc and vc.is_connected() else None
+        if not song or not isinstance(current, FrameCountingSource): return "ไม่มีเพลงกำลังเล่นอยู่"
+        duration = song.get('duration') or 0
+        if not duration: return "เพลงนี้เป็นไลฟ์สตรีมหรือไม่ทราบความยาว จึงเลื่อนตำแหน่งไม่ได้"
+        target = max(0.0, min(duration - 1.0, (current.position + seconds) if relative else seconds))
+        started_at = time.perf_counter()
+        if self._needs_stream_resolve(song) and not self._replay_for(player, song) and not await self._ensure_song_resolved(song, player):
+            self.position_stats['seek_failed'] += 1; return "ไม่สามารถดึง URL สตรีมของเพลงนี้ได้"
+        audio_source = self._open_audio_source(player, song, start_seconds=target)
+        try: first_frame = await asyncio.get_running_loop().run_in_executor(None, audio_source.read)
+        except BaseException: audio_source.cleanup(); raise
+        if not first_frame or vc.source is not current or player.current_song is not song: # เปิดไม่สำเร็จ หรือเพลงเปลี่ยน/ถูก seek ซ้อนระหว่างรอ
+            audio_source.cleanup(); self.position_stats['seek_failed'] += 1
+            return "เลื่อนตำแหน่งไม่สำเร็จ กรุณาลองใหม่อีกครั้ง"
+        self._swap_playing_source(player, current, audio_source, first_frame, target)
+        elapsed_ms = (time.perf_counter() - started_at) * 1000; self.position_stats['seeks'] += 1; self.position_stats['seek_total_ms'] += elapsed_ms
+        print(f"[SEEK {guild_id}] '{song.get('title')}' {current.position:.1f}s -> {target:.1f}s in {elapsed_ms:.0f}ms")
+        self._schedule_prefetch(player, song); await self._call_panel_update(guild_id) # เพลงถัดไปไม่เปลี่ยน: เก็บ source ที่เตรียมไว้ เริ่มจับเวลาเตรียมใหม่ตามตำแหน่งใหม่
+        return f"⏩ เลื่อนไปที่ {_format_duration(target)} / {_format_duration(duration)}"
+
+    def _resume_offset(self, player: GuildPlayer, finished_song: dict, error_obj):
+        # สตรีมของเพลงหลุดกลางเพลง (FFmpeg จบก่อนเวลาหรือเกิด error) โดยไม่ได้มาจาก skip/stop: คืนตำแหน่งที่ควรเล่นต่อ
+        source = player.position_source; duration = finished_song.get('duration') or 0
+        if STREAM_RESUME_ATTEMPTS <= 0 or not duration or player.current_song is not finished_song or source is None: return None
+        if not (source.ended or error_obj) or not source.frames or source.position >= duration - STREAM_RESUME_MARGIN_SECONDS: return None
+        if player.resume_attempts >= STREAM_RESUME_ATTEMPTS: self.position_stats['resume_gave_up'] += 1; return None
+        return source.position
+
+    def _playback_mode_stats(self) -> dict:
+        sources = [p.voice_client.source for p in self.players.values() if p.voice_client and isinstance(p.voice_client.source, FrameCountingSource)]
+        passthrough = sum(1 for source in sources if source.is_opus())
+        now = (time.monotonic(), time.process_time()); (wall_before, cpu_before) = self._cpu_sample; self._cpu_sample = now
+        cpu_pct = 100.0 * (now[1] - cpu_before) / (now[0] - wall_before) if now[0] > wall_before else 0.0 # CPU ของ process บอท (ไม่รวม FFmpeg)
+        return {'mode': PLAYBACK_MODE, 'passthrough_streams': passthrough, 'pcm_streams': len(sources) - passthrough, **self.playback_stats,
+                'bot_cpu_pct_since_last': round(cpu_pct, 1), 'cpu_pct_per_stream': round(cpu_pct / len(sources), 2) if sources else None}
+
+    def _peek_next_song(self, player: GuildPlayer):
+        # เพลงที่ _play_next จะเล่นต่อจากเพลงปัจจุบัน (ตาม loop mode)
+        current = player.current_song
+        if player.loop_mode == LoopMode.SONG and current: return current
+        if player.queue: return player.queue[0]
+        if player.loop_mode == LoopMode.QUEUE and current: return current
+        return None
+
+    def _schedule_prefetch(self, player: GuildPlayer, playing_song: dict):
+        self._cancel_prefetch(player, keep_primed=True)
+        if PREFETCH_LEAD_SECONDS <= 0: return
+        player.prefetch_task = self.bot.loop.create_task(self._prefetch_worker(player, playing_song))
+
+    async def _prefetch_worker(self, player: GuildPlayer, playing_song: dict):
+        duration = playing_song.get('duration') or 0
+        if not duration: return # live stream หรือไม่ทราบความยาว
+        while True: # ตำแหน่งจากจำนวนเฟรมที่ส่งไปจริง: ช่วง pause และการ seek ถูกนับถูกต้องเอง
+            await asyncio.sleep(1.0)
+            vc = player.voice_client
+            if player.current_song is not playing_song or not vc or not vc.is_connected(): return
+            if (self._current_position(player) or 0.0) >= duration - PREFETCH_LEAD_SECONDS: break
+        next_song = self._peek_next_song(player)
+        if not next_song or (player.primed and player.primed[0] is next_song): return
+        if player.replay is not None and player.replay.song is next_song: return # วนเพลงเดียว: เล่นซ้ำจากเฟรมที่บันทึกไว้ ไม่ต้องเปิด FFmpeg ล่วงหน้า
+        if self._needs_stream_resolve(next_song) and not self._replay_for(player, next_song):
+            if not await self._ensure_song_resolved(next_song, player): return
+            player.queue.refresh(next_song, STREAM_LOOKAHEAD) or player.queue.refresh(next_song) # ชื่อ/ความยาวจริงอาจเปลี่ยนหลัง resolve
+        if player.current_song is not playing_song or self._peek_next_song(player) is not next_song: return
+        audio_source = self._open_audio_source(player, next_song)
+        try: first_frame = await asyncio.get_running_loop().run_in_executor(None, audio_source.read) # รอจน FFmpeg เชื่อมต่อและได้เฟรมแรก
+        except BaseException: audio_source.cleanup(); raise
+        if not first_frame or player.current_song is not playing_song or self._peek_next_song(player) is not next_song:
+            audio_source.cleanup(); self.prefetch_stats['failed' if not first_frame else 'discarded'] += 1; return
+        if player.discard_primed(): self.prefetch_stats['discarded'] += 1
+        player.primed = (next_song, PrimedAudioSource(audio_source, first_frame)); self.prefetch_stats['primed'] += 1
+        print(f"[PREFETCH {player.guild_id}] Primed next track '{next_song.get('title')}'")
+
+    def _take_primed_source(self, player: GuildPlayer, song_info: dict):
+        primed = player.primed; player.primed = None
+        if not primed: return None
+        primed_song, primed_source = primed
+        if primed_song is song_info and not self._needs_stream_resolve(primed_song) and not self._replay_for(player, song_info) and primed_source.is_opus() == self._wants_passthrough(player, song_info): # volume อาจเปลี่ยนหลังเตรียมไว้
+            self.prefetch_stats['used'] += 1; return primed_source
+        primed_source.cleanup(); self.prefetch_stats['discarded'] += 1
+        return None
+
+    def _cancel_prefetch(self, player: GuildPlayer, keep_primed: bool = False):
+        task = player.prefetch_task; player.prefetch_task = None
+        if task and not task.done() and task is not asyncio.current_task(): task.cancel()
+        if not keep_primed and player.discard_primed(): self.prefetch_stats['discarded'] += 1
+
+    def _reset_prefetch(self, player: GuildPlayer):
+        # เพลงถัดไปเปลี่ยน (แก้คิว/เปลี่ยน loop mode): ทิ้ง source ที่เตรียมไว้แล้วเริ่มนับใหม่สำหรับเพลงปัจจุบัน
+        self._cancel_prefetch(player)
+        vc = player.voice_client
+        if player.current_song and vc and vc.is_connected() and (vc.is_playing() or vc.is_paused()): self._schedule_prefetch(player, player.current_song)
+
+    async def _check_after_play(self, ctx_like_object, guild_id: int, text_channel_for_notif: discord.TextChannel = None, silent_mode: bool = False, error_obj=None, finished_song: dict = None): # ... (เหมือนเดิม)
+        player = self.players.get(guild_id); resume_at = self._resume_offset(player, finished_song, error_obj) if player and finished_song else None
+        if resume_at is not None: # เล่นต่อจากจุดที่หลุดแทนการข้ามไปเพลงถัดไป
+            player.resume_at = resume_at; player.resume_attempts += 1; self.position_stats['resumed_after_drop'] += 1
+            print(f"[RESUME {guild_id}] Stream of '{finished_song.get('title')}' ended at {resume_at:.1f}s of {finished_song.get('duration')}s ({error_obj or 'early EOF'}); reopening there (attempt {player.resume_attempts}/{STREAM_RESUME_ATTEMPTS})")
+            await self._play_next(guild_id, text_channel_for_notif, silent_mode); return
         if error_obj:
             print(f"!!! Player event/error in guild {guild_id} !!!"); print(f"    Error Object (str): {str(error_obj)}"); print(f"    Error Object (repr): {repr(error_obj)}"); print(f"    Error Object (type): {type(error_obj)}")
             error_message_to_send = str(error_obj).strip()
@@ -150,105 +459,178 @@ class MusicCog(commands.Cog, name="MusicCog"):
             if not silent_mode:
                 channel_to_notify = text_channel_for_notif if text_channel_for_notif else (ctx_like_object.channel if ctx_like_object and hasattr(ctx_like_object, 'channel') and ctx_like_object.channel else None)
                 if channel_to_notify:
-                    try: await channel_to_notify.send(user_facing_error_message, delete_after=10)
+                    try: await send_temporary(self.bot, channel_to_notify, user_facing_error_message, delete_after=10)
                     except discord.HTTPException as e_send: print(f"Error sending player error/event message to Discord: {e_send}")
         await self._play_next(guild_id, text_channel_for_notif, silent_mode)
-    async def _fetch_song_data(self, query_or_url: str, ydl_opts: dict): # ... (เหมือนเดิม)
-        loop = asyncio.get_event_loop(); 
+    async def _fetch_song_data(self, query_or_url: str, ydl_opts: dict, overrides: dict = None): # ผ่าน extraction cache ก่อนเรียก yt-dlp (ยกเว้นมี overrides)
+        cached = self.extraction_cache.get(query_or_url, ydl_opts) if not overrides else None
+        if cached is not None: print(f"[YTDL_CACHE] Hit: '{query_or_url}' -> {cached.get('title')}"); return cached
         try:
-            print(f"[YTDL_FETCH] Query: '{query_or_url}', Opts: extract_flat={ydl_opts.get('extract_flat')}, default_search={ydl_opts.get('default_search')}")
-            data = await loop.run_in_executor(None, lambda: yt_dlp.YoutubeDL(ydl_opts).extract_info(query_or_url, download=False))
+            print(f"[YTDL_FETCH] Query: '{query_or_url}', Profile: {self.extraction_pool.profile_name(ydl_opts)}, Overrides: {overrides}, Queue depth: {self.extraction_pool.queue_depth}")
+            started_at = time.perf_counter()
+            data = await self.extraction_pool.extract(query_or_url, ydl_opts, overrides)
+            print(f"[YTDL_FETCH] Done in {time.perf_counter() - started_at:.2f}s: '{query_or_url}'")
+            if not overrides: self.extraction_cache.put(query_or_url, ydl_opts, data)
             return data
         except Exception as e: print(f"YTDL Error for query '{query_or_url}': {e}"); traceback.print_exc(); raise
-    async def _process_playlist_entries_background(self, guild_id: int, member_who_requested: discord.Member, text_channel_for_reply: discord.TextChannel, original_playlist_title: str, silent_mode: bool = False): # ... (เหมือนเดิม + แก้ไขการดึง stream URL)
-        playlist_summary_data = self.active_playlist_summaries.get(guild_id)
-        if not playlist_summary_data or not playlist_summary_data['entries']:
-            if guild_id in self.active_playlist_summaries: del self.active_playlist_summaries[guild_id]; return
-        entries_to_process = list(playlist_summary_data['entries']); queue = self._get_song_queue(guild_id); songs_added_count = 0
-        current_processing_task = self.playlist_processing_tasks.get(guild_id)
-        if current_processing_task != asyncio.current_task(): return
-        print(f"Background processing starting for playlist '{original_playlist_title}' in guild {guild_id} with {len(entries_to_process)} entries.")
-        for i, entry_summary in enumerate(entries_to_process):
-            if guild_id not in self.voice_clients or asyncio.current_task().cancelled():
-                if guild_id in self.active_playlist_summaries: del self.active_playlist_summaries[guild_id]
-                print(f"Playlist processing for '{original_playlist_title}' stopped or cancelled early."); return
-            video_url_from_summary = entry_summary.get('url'); video_title_summary = entry_summary.get('title', f"เพลงที่ {i + 1 + len(queue)} จาก '{original_playlist_title}'")
-            if not video_url_from_summary: continue
-            try:
-                song_data = await self._fetch_song_data(video_url_from_summary, YDL_OPTIONS_SINGLE_SONG)
-                if not song_data: print(f"[YTDL_DEBUG BG] No song_data for {video_title_summary} ({video_url_from_summary})"); continue
-                stream_url = song_data.get('url')
-                if not stream_url:
-                    formats = song_data.get('formats', []); selected_format = None
-                    for f_data in formats:
-                        if f_data.get('acodec') and f_data.get('acodec') != 'none' and f_data.get('url'):
-                            if f_data.get('vcodec') == 'none' or not f_data.get('vcodec'): selected_format = f_data; break
-                            if not selected_format: selected_format = f_data
-                    if selected_format: stream_url = selected_format.get('url')
-                if stream_url:
-                    song_info = {'title': song_data.get('title', video_title_summary), 'stream_url': stream_url, 'webpage_url': song_data.get('webpage_url', video_url_from_summary), 'duration': song_data.get('duration', 0), 'uploader': song_data.get('uploader', 'Unknown Uploader'), 'requester': member_who_requested, 'thumbnail': song_data.get('thumbnail')}
-                    queue.append(song_info); songs_added_count += 1
-                    active_entries_list = self.active_playlist_summaries.get(guild_id, {}).get('entries', [])
-                    entry_id_to_remove = entry_summary.get('id'); url_to_remove = entry_summary.get('url')
-                    for idx, summ_entry in enumerate(active_entries_list):
-                        if (entry_id_to_remove and summ_entry.get('id') == entry_id_to_remove) or \
-                           (not entry_id_to_remove and summ_entry.get('url') == url_to_remove):
-                            active_entries_list.pop(idx); break 
-                    await self._call_panel_update(guild_id)
-                else: print(f"[YTDL_DEBUG BG] Could not get stream URL for {video_title_summary} ({video_url_from_summary}) even after checking formats.")
-            except Exception as e: print(f"Error processing playlist entry {video_title_summary} ({video_url_from_summary}): {e}"); traceback.print_exc()
-            await asyncio.sleep(0.1)
-        if songs_added_count > 0 and not silent_mode and text_channel_for_reply:
-            try: await text_channel_for_reply.send(f"✅ เพลงที่เหลือจากเพลย์ลิสต์ **'{original_playlist_title}'** ({songs_added_count} เพลง) ถูกเพิ่มเข้าคิวแล้ว", delete_after=15)
-            except discord.HTTPException: pass
-        if guild_id in self.active_playlist_summaries: del self.active_playlist_summaries[guild_id]
-        if self.playlist_processing_tasks.get(guild_id) == asyncio.current_task(): del self.playlist_processing_tasks[guild_id]
-        print(f"Finished background processing for playlist '{original_playlist_title}' in guild {guild_id}.")
-        await self._call_panel_update(guild_id)
+    def _make_pending_entry(self, entry_summary: dict, member_who_requested: discord.Member, fallback_title: str) -> dict:
+        # รายการในคิวที่ยังไม่ได้ resolve stream URL (จะ resolve เมื่อใกล้ถึงคิวเล่น)
+        return {'id': entry_summary.get('id'), 'title': entry_summary.get('title') or fallback_title, 'stream_url': None,
+                'webpage_url': entry_summary.get('url') or entry_summary.get('webpage_url'), 'duration': int(entry_summary.get('duration') or 0),
+                'uploader': entry_summary.get('uploader', 'Unknown Uploader'), 'requester': member_who_requested, 'thumbnail': None}
+
+    def _needs_stream_resolve(self, song_info: dict) -> bool:
+        if self.audio_cache and self.audio_cache.contains(song_info): return False # เล่นจากไฟล์บนดิสก์ ไม่ต้องใช้ stream URL
+        stream_url = song_info.get('stream_url')
+        if not stream_url: return True
+        expires_at = stream_expiry(stream_url)
+        return bool(expires_at and expires_at - STREAM_EXPIRY_MARGIN_SECONDS <= time.time())
+
+    async def _resolve_song_entry(self, song_info: dict, target_kbps: float = DEFAULT_TARGET_KBPS) -> bool:
+        video_url_from_summary = song_info.get('webpage_url'); video_title_summary = song_info.get('title', 'Unknown')
+        if not video_url_from_summary: return False
+        try:
+            song_data = await self._fetch_song_data(video_url_from_summary, YDL_OPTIONS_SINGLE_SONG)
+            if not song_data: print(f"[YTDL_DEBUG JIT] No song_data for {video_title_summary} ({video_url_from_summary})"); return False
+            stream_url, format_fields = self._choose_stream(song_data, target_kbps)
+            if not stream_url: print(f"[YTDL_DEBUG JIT] Could not get stream URL for {video_title_summary} ({video_url_from_summary}) even after checking formats."); return False
+            song_info.update({'title': song_data.get('title', video_title_summary), 'stream_url': stream_url, 'webpage_url': song_data.get('webpage_url', video_url_from_summary), 'duration': song_data.get('duration') or song_info.get('duration', 0), 'uploader': song_data.get('uploader', 'Unknown Uploader'), 'thumbnail': song_data.get('thumbnail'), **format_fields})
+            return True
+        except Exception as e: print(f"Error resolving queue entry {video_title_summary} ({video_url_from_summary}): {e}"); traceback.print_exc(); return False
+
+    async def _ensure_song_resolved(self, song_info: dict, player: GuildPlayer = None) -> bool:
+        # look-ahead กับ _play_next อาจขอ resolve เพลงเดียวกันพร้อมกัน ให้ใช้ task เดียวกัน
+        key = id(song_info); task = self.pending_resolves.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._resolve_song_entry(song_info, self._target_kbps(player))); self.pending_resolves[key] = task
+            task.add_done_callback(lambda _t, key=key: self.pending_resolves.pop(key, None))
+        return await asyncio.shield(task)
+
+    def _refill_lookahead(self, guild_id: int):
+        player = self.players.get(guild_id)
+        if not player: return
+        task = player.lookahead_task
+        if task and not task.done(): return # task ที่รันอยู่จะตรวจคิวซ้ำเองจนครบหน้าต่าง
+        queue = player.queue
+        if not queue or not any(self._needs_stream_resolve(s) for s in queue[:STREAM_LOOKAHEAD]): return
+        player.lookahead_task = self.bot.loop.create_task(self._lookahead_worker(player))
+
+    async def _lookahead_worker(self, player: GuildPlayer):
+        guild_id = player.guild_id; attempted = {} # id -> เพลงที่ลองแล้วในรอบนี้ (ถือ reference ไว้ id จึงไม่ถูกใช้ซ้ำ): URL ที่ได้มาอาจใกล้หมดอายุจน _needs_stream_resolve ยังเป็นจริง
+        while True:
+            queue = player.queue
+            if not queue or not player.voice_client or self.players.get(guild_id) is not player: break
+            targets = [s for s in queue[:STREAM_LOOKAHEAD] if id(s) not in attempted and self._needs_stream_resolve(s)][:PLAYLIST_RESOLVE_CONCURRENCY]
+            if not targets: break
+            attempted.update((id(s), s) for s in targets)
+            results = await asyncio.gather(*(self._ensure_song_resolved(s, player) for s in targets))
+            for song_info, resolved in zip(targets, results):
+                if resolved: self.jit_stats['lookahead_resolved'] += 1; queue.refresh(song_info, STREAM_LOOKAHEAD) or queue.refresh(song_info); continue # duration จริงอาจต่างจากข้อมูลเพลย์ลิสต์; หาทั้งคิวเฉพาะเมื่อถูกย้ายออกจากหัวคิวระหว่างรอ
+                self.jit_stats['lookahead_failed'] += 1
+                print(f"[JIT {guild_id}] Dropping '{song_info.get('title')}' from queue: stream could not be resolved.")
+                queue.remove(song_info, STREAM_LOOKAHEAD) or queue.remove(song_info)
+        if player.lookahead_task is asyncio.current_task(): player.lookahead_task = None
+
+    @staticmethod
+    def _page_overrides(start: int) -> dict:
+        return {'playlist_items': f"{start}-{start + PLAYLIST_PAGE_SIZE - 1}"}
+
+    async def _playlist_pages(self, playlist_url: str, start: int, total: int = None):
+        # async generator: ดึงรายการเพลย์ลิสต์ทีละหน้าเมื่อถูกขอเท่านั้น จึงไม่ต้องถือรายการทั้งหมดไว้ในหน่วยความจำ
+        while not total or start <= total:
+            data = await self._fetch_song_data(playlist_url, YDL_OPTIONS_PLAYLIST_DETECTED, self._page_overrides(start))
+            entries = [e for e in ((data or {}).get('entries') or []) if e]
+            if not entries: return
+            yield entries
+            total = total or (data or {}).get('playlist_count'); start += PLAYLIST_PAGE_SIZE
+
+    def _maybe_pull_playlist_page(self, player: GuildPlayer, force: bool = False):
+        if not player.playlist_feeds or (player.playlist_feed_task and not player.playlist_feed_task.done()): return
+        if not force and len(player.queue) >= PLAYLIST_PAGE_WATERMARK and player.loop_mode != LoopMode.QUEUE: return
+        player.playlist_feed_task = self.bot.loop.create_task(self._pull_playlist_page(player))
+
+    async def _pull_playlist_page(self, player: GuildPlayer):
+        feed = player.playlist_feeds[0]
+        try: entries = await anext(feed['pages'])
+        except StopAsyncIteration: entries = None
+        except Exception as e: print(f"[PLAYLIST {player.guild_id}] Page fetch failed for '{feed['title']}': {e}"); self.playlist_page_stats['page_errors'] += 1; entries = None
+        if player.playlist_feed_task is asyncio.current_task(): player.playlist_feed_task = None
+        if self.players.get(player.guild_id) is not player or not player.playlist_feeds or player.playlist_feeds[0] is not feed: return
+        if entries is None:
+            player.playlist_feeds.pop(0); self.playlist_page_stats['feeds_finished'] += 1
+            print(f"[PLAYLIST {player.guild_id}] Finished paging '{feed['title']}' ({feed['next_number'] - 1} entries)")
+        else:
+            was_empty = not player.queue
+            player.queue.extend(self._make_pending_entry(entry, feed['member'], f"เพลงที่ {feed['next_number'] + i} จาก '{feed['title']}'") for i, entry in enumerate(entries) if entry.get('url') or entry.get('webpage_url'))
+            feed['next_number'] += len(entries); self.playlist_page_stats['pages_fetched'] += 1; self.playlist_page_stats['entries_queued'] += len(entries)
+            print(f"[PLAYLIST {player.guild_id}] Queued page of {len(entries)} from '{feed['title']}' (queue now {len(player.queue)})")
+            if was_empty: self._reset_prefetch(player)
+            self._refill_lookahead(player.guild_id); await self._call_panel_update(player.guild_id)
+        if len(player.queue) < PLAYLIST_PAGE_WATERMARK: self._maybe_pull_playlist_page(player)
+
+    def _record_time_to_first_audio(self, url_kind: str, seconds: float):
+        stats = self.ttfa_stats.setdefault(url_kind, {'count': 0, 'total_ms': 0.0, 'last_ms': 0.0})
+        stats['count'] += 1; stats['last_ms'] = round(seconds * 1000, 1); stats['total_ms'] += seconds * 1000
+        print(f"[TTFA] {url_kind}: {seconds:.2f}s from request to first audio")
+
+    async def _enqueue_mix_remainder(self, player: GuildPlayer, mix_url: str, seed_id: str, member: discord.Member):
+        # รายการ Mix (flat) ดึงหลังจากเพลงแรกเริ่มเล่นแล้ว จึงไม่ถ่วงเวลาเริ่มเล่น
+        try: mix_data = await self._fetch_song_data(mix_url, YDL_OPTIONS_PLAYLIST_DETECTED)
+        except Exception as e: print(f"[MIX {player.guild_id}] Could not list mix '{mix_url}': {e}"); return
+        if self.players.get(player.guild_id) is not player or not mix_data or mix_data.get('_type') != 'playlist': return
+        mix_title = mix_data.get('title', 'Mix')
+        entries = [self._make_pending_entry(entry, member, f"เพลงที่ {i + 1} จาก '{mix_title}'") for i, entry in enumerate(mix_data.get('entries') or [])
+                   if (entry.get('url') or entry.get('webpage_url')) and entry.get('id') != seed_id]
+        if not entries: return
+        player.queue.extend(entries); print(f"[MIX {player.guild_id}] Queued {len(entries)} tracks from '{mix_title}'")
+        self._refill_lookahead(player.guild_id); self._reset_prefetch(player)
+        await self._call_panel_update(player.guild_id)
 
     async def _process_and_play_query(self, guild: discord.Guild, member: discord.Member, text_channel: discord.TextChannel, voice_channel: discord.VoiceChannel, query: str, processing_msg: discord.Message = None, silent_mode: bool = False):
-        guild_id = guild.id
-        current_vc = self.voice_clients.get(guild_id)
+        guild_id = guild.id; player = self._get_player(guild_id); requested_at = time.perf_counter()
+        current_vc = player.voice_client
 
         # ... (ส่วนเชื่อมต่อ VC และ cancel auto-leave เหมือนเดิม) ...
         if not current_vc or not current_vc.is_connected() or current_vc.channel != voice_channel:
             if current_vc and current_vc.is_connected(): await current_vc.move_to(voice_channel)
             else:
-                try: current_vc = await voice_channel.connect(); self.voice_clients[guild_id] = current_vc
+                try: current_vc = await voice_channel.connect(); player.voice_client = current_vc
                 except Exception as e:
                     err_msg = f"ไม่สามารถเข้าร่วมช่องเสียง: {e}"
                     if not silent_mode:
                         if processing_msg: await processing_msg.edit(content=err_msg)
-                        else: await text_channel.send(err_msg, delete_after=10)
+                        else: await send_temporary(self.bot, text_channel, err_msg, delete_after=10)
                     return
         
-        if self.auto_leave_tasks.get(guild_id) and not self.auto_leave_tasks[guild_id].done():
-            self.auto_leave_tasks[guild_id].cancel(); 
-            if guild_id in self.auto_leave_tasks: del self.auto_leave_tasks[guild_id]
+        player.cancel_auto_leave()
 
         try:
             print(f"[PROCESS_QUERY {guild_id}] Initial query: '{query}' by {member.name}")
             is_url = query.startswith(('http://', 'https://', 'www.'))
             
             first_song_to_play_data = None # This will store the FULL data for the first song
+            url_kind = classify_url(query) if is_url else 'search'; mix_url = None; playlist_feed = None; playlist_total = None
             is_playlist = False
             playlist_entries_summary = []
             playlist_title = ""
 
-            # Cleanup previous playlist tasks for this guild first
-            if self.active_playlist_summaries.get(guild_id): del self.active_playlist_summaries[guild_id]
-            if self.playlist_processing_tasks.get(guild_id):
-                if not self.playlist_processing_tasks[guild_id].done(): self.playlist_processing_tasks[guild_id].cancel()
-                if guild_id in self.playlist_processing_tasks: del self.playlist_processing_tasks[guild_id]
-
-            if is_url:
-                print(f"[PROCESS_QUERY {guild_id}] Query is URL. Detecting playlist: {query}")
-                playlist_check_data = await self._fetch_song_data(query, YDL_OPTIONS_PLAYLIST_DETECTED)
+            if is_url and url_kind == SINGLE: # รูปแบบ URL บอกชัดว่าเป็นเพลงเดียว ไม่ต้อง probe เพลย์ลิสต์
+                print(f"[PROCESS_QUERY {guild_id}] URL classified as single track. Fetching directly: {query}")
+                first_song_to_play_data = await self._fetch_song_data(query, YDL_OPTIONS_SINGLE_SONG)
+            elif is_url and url_kind == MIX and video_url(query): # เล่นเพลงตั้งต้นของ Mix ก่อน แล้วค่อยดึงรายการ Mix ตามมา
+                print(f"[PROCESS_QUERY {guild_id}] URL classified as mix. Playing seed video first: {query}")
+                first_song_to_play_data = await self._fetch_song_data(video_url(query), YDL_OPTIONS_SINGLE_SONG); mix_url = query
+            elif is_url:
+                print(f"[PROCESS_QUERY {guild_id}] Query is URL ({url_kind}). Detecting playlist: {query}")
+                playlist_check_data = await self._fetch_song_data(query, YDL_OPTIONS_PLAYLIST_DETECTED, self._page_overrides(1)) # หน้าแรกเท่านั้น
                 if playlist_check_data and playlist_check_data.get('_type') == 'playlist' and 'entries' in playlist_check_data and playlist_check_data['entries']:
                     is_playlist = True
                     playlist_entries_summary = playlist_check_data.get('entries', [])
-                    playlist_title = playlist_check_data.get('title', query)
-                    print(f"[PROCESS_QUERY {guild_id}] Playlist detected. Title: '{playlist_title}', Entries: {len(playlist_entries_summary)}")
+                    playlist_title = playlist_check_data.get('title', query); playlist_total = playlist_check_data.get('playlist_count')
+                    if len(playlist_entries_summary) >= PLAYLIST_PAGE_SIZE and (not playlist_total or playlist_total > PLAYLIST_PAGE_SIZE):
+                        playlist_feed = {'title': playlist_title, 'member': member, 'next_number': len(playlist_entries_summary) + 1,
+                                         'pages': self._playlist_pages(query, PLAYLIST_PAGE_SIZE + 1, playlist_total)}
+                    print(f"[PROCESS_QUERY {guild_id}] Playlist detected. Title: '{playlist_title}', Entries: {len(playlist_entries_summary)} of {playlist_total or '?'}")
                     
                     first_entry_summary = playlist_entries_summary[0]
                     first_song_webpage_url = first_entry_summary.get('url') 
@@ -260,12 +642,16 @@ class MusicCog(commands.Cog, name="MusicCog"):
                         err_msg = f"เพลงแรกในเพลย์ลิสต์ `{playlist_title}` ไม่มีข้อมูล URL"
                         if not silent_mode:
                             if processing_msg: await processing_msg.edit(content=err_msg)
-                            else: await text_channel.send(err_msg, delete_after=10)
-                        return # No need to cleanup active_playlist_summaries as it's not set yet for this path
+                            else: await send_temporary(self.bot, text_channel, err_msg, delete_after=10)
+                        return
                 else: # URL is not a playlist, treat as a single song URL
                     is_playlist = False
-                    print(f"[PROCESS_QUERY {guild_id}] URL is not a playlist. Fetching full data for single song URL: {query}")
-                    first_song_to_play_data = await self._fetch_song_data(query, YDL_OPTIONS_SINGLE_SONG)
+                    if playlist_check_data and (playlist_check_data.get('url') or playlist_check_data.get('formats')):
+                        print(f"[PROCESS_QUERY {guild_id}] URL is not a playlist. Probe already returned full data, reusing it: {query}")
+                        first_song_to_play_data = playlist_check_data
+                    else:
+                        print(f"[PROCESS_QUERY {guild_id}] URL is not a playlist. Fetching full data for single song URL: {query}")
+                        first_song_to_play_data = await self._fetch_song_data(query, YDL_OPTIONS_SINGLE_SONG)
             else: # Query is not a URL, so it's a search term
                 print(f"[PROCESS_QUERY {guild_id}] Query is a search term. Searching: '{query}'")
                 # YDL_OPTIONS_SEARCH should return full data for the first search result
@@ -288,7 +674,7 @@ class MusicCog(commands.Cog, name="MusicCog"):
                         # ... (send error) ...
                         if not silent_mode:
                             if processing_msg: await processing_msg.edit(content=err_msg)
-                            else: await text_channel.send(err_msg, delete_after=10)
+                            else: await send_temporary(self.bot, text_channel, err_msg, delete_after=10)
                         return
                 elif searched_data: # Search result is a single video, searched_data IS first_song_to_play_data
                     print(f"[PROCESS_QUERY {guild_id}] Search result is single video: '{searched_data.get('title', 'N/A')}'")
@@ -297,15 +683,14 @@ class MusicCog(commands.Cog, name="MusicCog"):
                     err_msg = f"ไม่พบผลลัพธ์สำหรับ: `{query}`"
                     if not silent_mode:
                         if processing_msg: await processing_msg.edit(content=err_msg)
-                        else: await text_channel.send(err_msg, delete_after=10)
+                        else: await send_temporary(self.bot, text_channel, err_msg, delete_after=10)
                     return
 
             if not first_song_to_play_data:
                 err_msg = f"ไม่สามารถดึงข้อมูลเพลงสำหรับ: `{query}` (final check after processing logic)"
                 if not silent_mode:
                     if processing_msg: await processing_msg.edit(content=err_msg)
-                    else: await text_channel.send(err_msg, delete_after=10)
-                # No active_playlist_summaries to clean if first_song_to_play_data is None here without being a playlist before
+                    else: await send_temporary(self.bot, text_channel, err_msg, delete_after=10)
                 return
             
             # --- DEBUG PRINT FOR THE FINAL DATA ---
@@ -321,29 +706,18 @@ class MusicCog(commands.Cog, name="MusicCog"):
             print("---- END YTDL_FINAL_DATA ----\n")
             # --- END DEBUG PRINT ---
 
-            stream_url = first_song_to_play_data.get('url') 
+            stream_url, format_fields = self._choose_stream(first_song_to_play_data, self._target_kbps(player))
             extracted_title = first_song_to_play_data.get('title', 'Untitled Song')
             if not extracted_title or extracted_title.lower() == 'videoplayback' or "video playback" in extracted_title.lower():
                 if not is_url: extracted_title = query # Use search query as title if yt-dlp title is bad
             
-            if not stream_url:
-                print(f"[YTDL_DEBUG {guild_id}] No top-level 'url' for '{extracted_title}'. Trying 'formats'.")
-                formats = first_song_to_play_data.get('formats', [])
-                if not formats: print(f"[YTDL_DEBUG {guild_id}] 'formats' list is empty for '{extracted_title}'.")
-                selected_format = None
-                for f_data in formats:
-                    if f_data.get('acodec') and f_data.get('acodec') != 'none' and f_data.get('url'):
-                        if f_data.get('vcodec') == 'none' or not f_data.get('vcodec'): selected_format = f_data; print(f"[YTDL_DEBUG {guild_id}] Selected audio-only format: id={f_data.get('format_id')}"); break 
-                        if not selected_format: selected_format = f_data; print(f"[YTDL_DEBUG {guild_id}] Tentatively selected audio format: id={f_data.get('format_id')}")
-                if selected_format: stream_url = selected_format.get('url')
-                else: print(f"[YTDL_DEBUG {guild_id}] No suitable format in 'formats' for '{extracted_title}'.")
-            
+            print(f"[YTDL_DEBUG {guild_id}] Selected format id={format_fields['format_id']} acodec={format_fields['acodec']} score={format_fields['format_score']} for '{extracted_title}'")
+
             if not stream_url:
                 err_msg = f"ไม่สามารถรับ URL สตรีมสำหรับเพลง: ``{extracted_title}``"
                 if not silent_mode:
                     if processing_msg: await processing_msg.edit(content=err_msg)
-                    else: await text_channel.send(err_msg, delete_after=10)
-                if is_playlist and guild_id in self.active_playlist_summaries: del self.active_playlist_summaries[guild_id] # Clear if playlist was set
+                    else: await send_temporary(self.bot, text_channel, err_msg, delete_after=10)
                 return
 
             thumbnail_url = first_song_to_play_data.get('thumbnail')
@@ -361,41 +735,32 @@ class MusicCog(commands.Cog, name="MusicCog"):
 
 
             first_song_info = {
+                'id': first_song_to_play_data.get('id'),
                 'title': extracted_title, 
                 'stream_url': stream_url, 
                 'webpage_url': final_webpage_url,
                 'duration': first_song_to_play_data.get('duration', 0), 
                 'uploader': first_song_to_play_data.get('uploader', 'Unknown Uploader'), 
                 'requester': member, 
-                'thumbnail': thumbnail_url
+                'thumbnail': thumbnail_url,
+                **format_fields # acodec 'opus' = เล่นแบบ passthrough ได้
             }
-            current_song_queue = self._get_song_queue(guild_id); current_song_queue.append(first_song_info)
+            current_song_queue = player.queue; current_song_queue.append(first_song_info)
+            if is_playlist: # เพลงที่เหลือเข้าคิวทันทีแบบยังไม่ resolve แล้วค่อย resolve ล่วงหน้าทีละ STREAM_LOOKAHEAD เพลง
+                current_song_queue.extend(self._make_pending_entry(entry, member, f"เพลงที่ {i + 2} จาก '{playlist_title}'") for i, entry in enumerate(playlist_entries_summary[1:]) if entry.get('url') or entry.get('webpage_url'))
             
-            if is_playlist: # If it was determined to be a playlist earlier
-                self.active_playlist_summaries[guild_id] = {'title': playlist_title, 'entries': list(playlist_entries_summary), 'requester': member}
-                first_entry_summary_to_remove = playlist_entries_summary[0]
-                active_entries = self.active_playlist_summaries[guild_id]['entries']
-                if active_entries:
-                    entry_id_to_remove = first_entry_summary_to_remove.get('id'); url_to_remove = first_entry_summary_to_remove.get('url')
-                    for idx, summ_entry in enumerate(active_entries):
-                        if (entry_id_to_remove and summ_entry.get('id') == entry_id_to_remove) or \
-                           (not entry_id_to_remove and summ_entry.get('url') == url_to_remove):
-                            active_entries.pop(idx); break
-            
-            msg_to_user = f"▶️ กำลังจะเล่นเพลงแรกจากเพลย์ลิสต์ **'{playlist_title}'** ({len(playlist_entries_summary)} เพลง)..." if is_playlist else f"✅ เพิ่มเข้าคิว: **{first_song_info['title']}**"
+            if playlist_feed: player.playlist_feeds.append(playlist_feed) # หน้าถัดไปจะถูกดึงเมื่อคิวเหลือน้อยกว่า PLAYLIST_PAGE_WATERMARK
+            msg_to_user = f"▶️ กำลังจะเล่นเพลงแรกจากเพลย์ลิสต์ **'{playlist_title}'** ({playlist_total or len(playlist_entries_summary)} เพลง)..." if is_playlist else f"✅ เพิ่มเข้าคิว: **{first_song_info['title']}**"
             if not silent_mode:
                 if processing_msg: await processing_msg.edit(content=msg_to_user)
-                else: await text_channel.send(msg_to_user, delete_after=20 if is_playlist else 10)
+                else: await send_temporary(self.bot, text_channel, msg_to_user, delete_after=20 if is_playlist else 10)
             
             await self._call_panel_update(guild_id)
-            if not current_vc.is_playing() and not current_vc.is_paused(): await self._play_next(guild_id, text_channel, silent_mode)
-            
-            if is_playlist and self.active_playlist_summaries.get(guild_id) and self.active_playlist_summaries[guild_id]['entries']:
-                new_processing_task = self.bot.loop.create_task(self._process_playlist_entries_background(guild_id, member, text_channel, playlist_title, silent_mode))
-                self.playlist_processing_tasks[guild_id] = new_processing_task
-            elif is_playlist: 
-                 if guild_id in self.active_playlist_summaries: del self.active_playlist_summaries[guild_id]
-                 await self._call_panel_update(guild_id)
+            if not current_vc.is_playing() and not current_vc.is_paused():
+                await self._play_next(guild_id, text_channel, silent_mode)
+                if player.current_song is first_song_info and current_vc.is_playing(): self._record_time_to_first_audio(url_kind, time.perf_counter() - requested_at)
+            self._refill_lookahead(guild_id)
+            if mix_url: self.bot.loop.create_task(self._enqueue_mix_remainder(player, mix_url, first_song_to_play_data.get('id'), member))
 
         except yt_dlp.utils.DownloadError as e:
             # ... (error handling เหมือนเดิม) ...
@@ -404,16 +769,14 @@ class MusicCog(commands.Cog, name="MusicCog"):
             err_msg = f"YTDL Error: {relevant_error}"
             if not silent_mode:
                 if processing_msg: await processing_msg.edit(content=err_msg)
-                else: await text_channel.send(err_msg, delete_after=10)
-            if guild_id in self.active_playlist_summaries: del self.active_playlist_summaries[guild_id]; await self._call_panel_update(guild_id)
+                else: await send_temporary(self.bot, text_channel, err_msg, delete_after=10)
         except Exception as e:
             # ... (error handling เหมือนเดิม) ...
             err_msg = f"เกิดข้อผิดพลาดทั่วไป: {type(e).__name__} - {e}"
             if not silent_mode:
                 if processing_msg: await processing_msg.edit(content=err_msg)
-                else: await text_channel.send(err_msg, delete_after=10)
+                else: await send_temporary(self.bot, text_channel, err_msg, delete_after=10)
             print(f"Generic error in _process_and_play_query for guild {guild_id} on query '{query}': {e}"); traceback.print_exc()
-            if guild_id in self.active_playlist_summaries: del self.active_playlist_summaries[guild_id]; await self._call_panel_update(guild_id)
 
     # ... (โค้ด Listener on_voice_state_update และ Commands อื่นๆ ทั้งหมดเหมือนเดิมจาก request_25) ...
     @commands.Cog.listener()
@@ -422,15 +785,12 @@ class MusicCog(commands.Cog, name="MusicCog"):
         if member.id == self.bot.user.id:
             if before.channel and not after.channel: self._cleanup_guild_data(guild_id); return
             elif after.channel:
-                self.voice_clients[guild_id] = vc
-                if self.auto_leave_tasks.get(guild_id) and not self.auto_leave_tasks[guild_id].done():
-                    self.auto_leave_tasks[guild_id].cancel(); 
-                    if guild_id in self.auto_leave_tasks: del self.auto_leave_tasks[guild_id]
+                player = self._get_player(guild_id); player.voice_client = vc; player.cancel_auto_leave()
                 await self._call_panel_update(guild_id)
         if vc and vc.is_connected() and before.channel == vc.channel:
             if len(vc.channel.members) == 1 and vc.channel.members[0] == self.bot.user:
-                queue = self._get_song_queue(guild_id)
-                if not vc.is_playing() and not vc.is_paused() and not queue and self.loop_mode.get(guild_id, LoopMode.NONE) == LoopMode.NONE :
+                player = self.players.get(guild_id); queue = player.queue if player else []
+                if not vc.is_playing() and not vc.is_paused() and not queue and (not player or player.loop_mode == LoopMode.NONE) :
                     await self._schedule_auto_leave(member.guild, delay=60, reason="alone_and_idle")
     
     # --- COMMANDS ---
@@ -438,7 +798,7 @@ class MusicCog(commands.Cog, name="MusicCog"):
     async def play(self, ctx: commands.Context, *, query: str = None):
         if not ctx.author.voice or not ctx.author.voice.channel: return await ctx.send("คุณต้องอยู่ในช่องเสียงก่อน")
         voice_channel = ctx.author.voice.channel; guild_id = ctx.guild.id
-        current_vc = self.voice_clients.get(guild_id)
+        current_vc = self._voice_client(guild_id)
         if query is None:
             queue = self._get_song_queue(guild_id)
             if current_vc and current_vc.is_connected():
@@ -452,7 +812,7 @@ class MusicCog(commands.Cog, name="MusicCog"):
 
     async def add_to_queue_from_panel(self, guild: discord.Guild, member: discord.Member, text_channel_for_reply: discord.TextChannel, query: str):
         if not member.voice or not member.voice.channel:
-            try: await text_channel_for_reply.send(f"{member.mention} คุณต้องอยู่ในช่องเสียงก่อนสั่งเพลงจากช่องนี้", delete_after=10)
+            try: await send_temporary(self.bot, text_channel_for_reply, f"{member.mention} คุณต้องอยู่ในช่องเสียงก่อนสั่งเพลงจากช่องนี้", delete_after=10)
             except discord.HTTPException: pass; return
         voice_channel = member.voice.channel
         print(f"Panel request: User {member.display_name}, Query: {query} in guild {guild.id}")
@@ -461,158 +821,136 @@ class MusicCog(commands.Cog, name="MusicCog"):
     @commands.command(name="join", help="ให้บอทเข้าร่วมช่องเสียงที่คุณอยู่")
     async def join(self, ctx: commands.Context):
         if not ctx.author.voice or not ctx.author.voice.channel: return await ctx.send(f"{ctx.author.name} ไม่ได้อยู่ในช่องเสียงใดๆ")
-        channel = ctx.author.voice.channel; guild_id = ctx.guild.id; current_vc = self.voice_clients.get(guild_id)
+        channel = ctx.author.voice.channel; guild_id = ctx.guild.id; player = self._get_player(guild_id); current_vc = player.voice_client
         if current_vc and current_vc.is_connected():
-            if current_vc.channel == channel: return await ctx.send("บอทอยู่ในช่องเสียงนี้แล้ว", delete_after=10)
-            try: await current_vc.move_to(channel); self.voice_clients[guild_id] = current_vc
-            except asyncio.TimeoutError: return await ctx.send("การย้ายช่องหมดเวลา", delete_after=10)
-            await ctx.send(f"ย้ายไปที่ช่อง: {channel.name}", delete_after=10)
+            if current_vc.channel == channel: return await send_temporary(self.bot, ctx, "บอทอยู่ในช่องเสียงนี้แล้ว", delete_after=10)
+            try: await current_vc.move_to(channel); player.voice_client = current_vc
+            except asyncio.TimeoutError: return await send_temporary(self.bot, ctx, "การย้ายช่องหมดเวลา", delete_after=10)
+            await send_temporary(self.bot, ctx, f"ย้ายไปที่ช่อง: {channel.name}", delete_after=10)
         else:
-            try: vc = await channel.connect(); self.voice_clients[guild_id] = vc; await ctx.send(f"เข้าร่วมช่อง: {channel.name}", delete_after=10)
-            except asyncio.TimeoutError: return await ctx.send("การเข้าร่วมช่องหมดเวลา", delete_after=10)
-            except Exception as e: return await ctx.send(f"เกิดข้อผิดพลาดในการเข้าร่วมช่องเสียง: {e}", delete_after=10)
-        if self.auto_leave_tasks.get(guild_id) and not self.auto_leave_tasks[guild_id].done():
-            self.auto_leave_tasks[guild_id].cancel(); 
-            if guild_id in self.auto_leave_tasks: del self.auto_leave_tasks[guild_id]
+            try: vc = await channel.connect(); player.voice_client = vc; await send_temporary(self.bot, ctx, f"เข้าร่วมช่อง: {channel.name}", delete_after=10)
+            except asyncio.TimeoutError: return await send_temporary(self.bot, ctx, "การเข้าร่วมช่องหมดเวลา", delete_after=10)
+            except Exception as e: return await send_temporary(self.bot, ctx, f"เกิดข้อผิดพลาดในการเข้าร่วมช่องเสียง: {e}", delete_after=10)
+        player.cancel_auto_leave()
         await self._call_panel_update(guild_id)
 
     @commands.command(name="leave", aliases=['disconnect', 'dc'], help="ให้บอทออกจากช่องเสียง")
     async def leave(self, ctx: commands.Context):
-        guild_id = ctx.guild.id; vc = self.voice_clients.get(guild_id)
+        guild_id = ctx.guild.id; player = self.players.get(guild_id); vc = player.voice_client if player else None
         if vc and vc.is_connected():
             if vc.is_playing() or vc.is_paused(): vc.stop()
-            if self.playlist_processing_tasks.get(guild_id) and not self.playlist_processing_tasks[guild_id].done(): self.playlist_processing_tasks[guild_id].cancel()
-            if self.auto_leave_tasks.get(guild_id) and not self.auto_leave_tasks[guild_id].done(): self.auto_leave_tasks[guild_id].cancel()
-            await vc.disconnect(); await ctx.send("ออกจากช่องเสียงแล้ว", delete_after=10)
-        else: await ctx.send("บอทไม่ได้อยู่ในช่องเสียงใดๆ", delete_after=10)
+            player.cancel_lookahead(); self._cancel_prefetch(player); player.cancel_auto_leave()
+            await vc.disconnect(); await send_temporary(self.bot, ctx, "ออกจากช่องเสียงแล้ว", delete_after=10)
+        else: await send_temporary(self.bot, ctx, "บอทไม่ได้อยู่ในช่องเสียงใดๆ", delete_after=10)
 
     async def player_pause(self, guild_id: int):
-        vc = self.voice_clients.get(guild_id)
+        vc = self._voice_client(guild_id)
         if vc and vc.is_playing(): vc.pause(); await self._call_panel_update(guild_id); return "⏸️ หยุดเพลงชั่วคราวแล้ว"
         return "ไม่มีเพลงกำลังเล่นอยู่"
     @commands.command(name="pause", help="หยุดเล่นเพลงชั่วคราว")
-    async def pause(self, ctx: commands.Context): msg = await self.player_pause(ctx.guild.id); await ctx.send(msg, delete_after=10)
+    async def pause(self, ctx: commands.Context): msg = await self.player_pause(ctx.guild.id); await send_temporary(self.bot, ctx, msg, delete_after=10)
 
     async def player_resume(self, guild_id: int):
-        vc = self.voice_clients.get(guild_id)
+        player = self.players.get(guild_id); vc = player.voice_client if player else None
         if vc and vc.is_paused():
-            if self.auto_leave_tasks.get(guild_id) and not self.auto_leave_tasks[guild_id].done():
-                self.auto_leave_tasks[guild_id].cancel()
-                if guild_id in self.auto_leave_tasks: del self.auto_leave_tasks[guild_id]
+            player.cancel_auto_leave()
             vc.resume(); await self._call_panel_update(guild_id); return "▶️ เล่นเพลงต่อแล้ว"
         return "ไม่มีเพลงที่หยุดพักไว้"
     @commands.command(name="resume", help="เล่นเพลงต่อจากที่หยุดไว้")
-    async def resume(self, ctx: commands.Context): msg = await self.player_resume(ctx.guild.id); await ctx.send(msg, delete_after=10)
+    async def resume(self, ctx: commands.Context): msg = await self.player_resume(ctx.guild.id); await send_temporary(self.bot, ctx, msg, delete_after=10)
 
     async def player_stop(self, guild_id: int):
-        vc = self.voice_clients.get(guild_id)
+        player = self.players.get(guild_id); vc = player.voice_client if player else None
         if vc and vc.is_connected():
+            player.queue.clear(); player.drop_playlist_feeds(); player.current_song = None # ล้างก่อน stop() เพื่อไม่ให้ after callback เล่นเพลงถัดไป
             if vc.is_playing() or vc.is_paused(): vc.stop()
-            if guild_id in self.song_queue: self.song_queue[guild_id].clear()
-            self.current_song[guild_id] = None
-            if self.playlist_processing_tasks.get(guild_id) and not self.playlist_processing_tasks[guild_id].done(): self.playlist_processing_tasks[guild_id].cancel()
-            if guild_id in self.active_playlist_summaries: del self.active_playlist_summaries[guild_id]
-            self.loop_mode[guild_id] = LoopMode.NONE
+            player.cancel_lookahead(); self._cancel_prefetch(player)
+            player.loop_mode = LoopMode.NONE
             await self._call_panel_update(guild_id)
             guild = self.bot.get_guild(guild_id)
             if guild: await self._schedule_auto_leave(guild, delay=60, reason="stopped_via_panel")
             return "⏹️ หยุดเล่นเพลงและล้างคิวแล้ว"
         return "บอทไม่ได้อยู่ในช่องเสียง"
     @commands.command(name="stop", help="หยุดเล่นเพลงและล้างคิว")
-    async def stop(self, ctx: commands.Context): msg = await self.player_stop(ctx.guild.id); await ctx.send(msg, delete_after=10)
+    async def stop(self, ctx: commands.Context): msg = await self.player_stop(ctx.guild.id); await send_temporary(self.bot, ctx, msg, delete_after=10)
 
     async def player_skip(self, guild_id: int):
-        vc = self.voice_clients.get(guild_id)
+        player = self.players.get(guild_id); vc = player.voice_client if player else None
         if vc and vc.is_connected() and (vc.is_playing() or vc.is_paused()):
-            if self.auto_leave_tasks.get(guild_id) and not self.auto_leave_tasks[guild_id].done():
-                self.auto_leave_tasks[guild_id].cancel()
-                if guild_id in self.auto_leave_tasks: del self.auto_leave_tasks[guild_id]
-            skipped_song_title = self.current_song.get(guild_id, {}).get('title', 'เพลงปัจจุบัน')
+            player.cancel_auto_leave()
+            skipped_song_title = (player.current_song or {}).get('title', 'เพลงปัจจุบัน')
             vc.stop() 
             return f"⏭️ ข้ามเพลง: **{skipped_song_title}**"
         return "ไม่มีเพลงกำลังเล่นอยู่ที่จะข้ามได้"
     @commands.command(name="skip", aliases=['s'], help="ข้ามไปยังเพลงถัดไปในคิว")
-    async def skip(self, ctx: commands.Context): msg = await self.player_skip(ctx.guild.id); await ctx.send(msg, delete_after=10)
+    async def skip(self, ctx: commands.Context): msg = await self.player_skip(ctx.guild.id); await send_temporary(self.bot, ctx, msg, delete_after=10)
+
+    @commands.command(name="seek", help="เลื่อนไปยังตำแหน่งในเพลง (เช่น 1:30, 90, +15, -10)")
+    async def seek(self, ctx: commands.Context, position: str):
+        relative = position.startswith(('+', '-')); seconds = _parse_timestamp(position[1:] if relative else position)
+        if seconds is None: return await send_temporary(self.bot, ctx, "รูปแบบเวลาไม่ถูกต้อง ใช้ เช่น `1:30`, `90`, `+15` หรือ `-10`", delete_after=10)
+        msg = await self.player_seek(ctx.guild.id, -seconds if position.startswith('-') else seconds, relative=relative)
+        await send_temporary(self.bot, ctx, msg, delete_after=10)
 
     @commands.command(name="loop", aliases=['l'], help="เปลี่ยนโหมดการเล่นวน (ปิด -> เพลงเดียว -> ทั้งคิว)")
     async def loop(self, ctx: commands.Context):
         _ , new_mode_text = await self.player_toggle_loop(ctx.guild.id)
-        await ctx.send(f"🔁 {new_mode_text}", delete_after=10)
+        await send_temporary(self.bot, ctx, f"🔁 {new_mode_text}", delete_after=10)
 
     async def player_toggle_loop(self, guild_id: int) -> tuple[int, str]:
-        current_mode = self.loop_mode.get(guild_id, LoopMode.NONE)
+        player = self._get_player(guild_id); current_mode = player.loop_mode
         if current_mode == LoopMode.NONE: new_mode = LoopMode.SONG
         elif current_mode == LoopMode.SONG: new_mode = LoopMode.QUEUE
         else: new_mode = LoopMode.NONE
-        self.loop_mode[guild_id] = new_mode
+        player.loop_mode = new_mode; self._reset_prefetch(player)
         print(f"Guild {guild_id} loop mode set to {LoopMode.TEXT[new_mode]}")
         await self._call_panel_update(guild_id)
         return new_mode, f"โหมดเล่นวน: {LoopMode.TEXT[new_mode]}"
 
     async def player_toggle_mute(self, guild_id: int) -> tuple[bool, str]:
-        vc = self.voice_clients.get(guild_id)
-        if guild_id not in self.guild_volumes: self.guild_volumes[guild_id] = {'current': 0.7}
-        current_mute_state = self.is_guild_muted.get(guild_id, False); new_mute_state = not current_mute_state
-        self.is_guild_muted[guild_id] = new_mute_state; volume_to_apply_after_toggle = 0.0
-        if vc and vc.source and hasattr(vc.source, 'volume'):
-            if new_mute_state: self.guild_volumes[guild_id]['before_mute_volume'] = vc.source.volume; volume_to_apply_after_toggle = 0.0
-            else: volume_to_apply_after_toggle = self.guild_volumes[guild_id].get('before_mute_volume', self.guild_volumes[guild_id].get('current',0.7))
-            vc.source.volume = volume_to_apply_after_toggle
-        elif new_mute_state: self.guild_volumes[guild_id]['before_mute_volume'] = self.guild_volumes[guild_id].get('current', 0.7)
+        player = self._get_player(guild_id)
+        new_mute_state = not player.muted; player.muted = new_mute_state
+        if new_mute_state: player.before_mute_volume = player.volume
+        self._apply_volume(player)
         print(f"Guild {guild_id} mute state set to {new_mute_state}")
         await self._call_panel_update(guild_id)
         return new_mute_state, "🔇 ปิดเสียงแล้ว" if new_mute_state else "🔊 เปิดเสียงแล้ว"
 
     async def player_adjust_volume(self, guild_id: int, adjustment_percentage: int) -> tuple[int, str]:
-        vc = self.voice_clients.get(guild_id)
-        if guild_id not in self.guild_volumes: self.guild_volumes[guild_id] = {'current': 0.7}
-        current_logical_volume = self.guild_volumes[guild_id].get('current', 0.7)
+        player = self._get_player(guild_id)
+        current_logical_volume = player.volume
         new_logical_volume = current_logical_volume + (adjustment_percentage / 100.0)
-        new_logical_volume = max(0.0, min(2.0, new_logical_volume))
-        self.guild_volumes[guild_id]['current'] = new_logical_volume; volume_to_apply = new_logical_volume
-        if self.is_guild_muted.get(guild_id, False):
-            self.guild_volumes[guild_id]['before_mute_volume'] = new_logical_volume; volume_to_apply = 0.0
-        if vc and vc.source and hasattr(vc.source, 'volume'): vc.source.volume = volume_to_apply
+        new_logical_volume = round(max(0.0, min(2.0, new_logical_volume)), 2) # ปัดเศษ float ให้ 0.7 + 3*0.1 เท่ากับ 1.0 จริง (ใช้ตัดสินโหมด passthrough)
+        player.volume = new_logical_volume
+        if player.muted: player.before_mute_volume = new_logical_volume
+        volume_to_apply = player.applied_volume; self._apply_volume(player)
         new_vol_percent = int(new_logical_volume * 100)
-        vol_text = f"🔊 ความดัง: {new_vol_percent}%" if not self.is_guild_muted.get(guild_id,False) else f"🔇 ปิดเสียง (ความดังที่ตั้งค่าไว้: {new_vol_percent}%)"
+        vol_text = f"🔊 ความดัง: {new_vol_percent}%" if not player.muted else f"🔇 ปิดเสียง (ความดังที่ตั้งค่าไว้: {new_vol_percent}%)"
         print(f"Guild {guild_id} logical volume set to {new_vol_percent}%, applied {int(volume_to_apply*100)}%")
         await self._call_panel_update(guild_id); return new_vol_percent, vol_text
 
     @commands.command(name="queue", aliases=['q'], help="แสดงรายการเพลงในคิว")
     async def queue_command(self, ctx: commands.Context):
-        guild_id = ctx.guild.id; processed_song_queue = self._get_song_queue(guild_id); current_song_data = self.current_song.get(guild_id)
+        guild_id = ctx.guild.id; player = self.players.get(guild_id)
+        processed_song_queue = player.queue if player else []; current_song_data = player.current_song if player else None
         current_song_field_text = None
         if current_song_data: current_song_field_text = f"**``{current_song_data.get('title', 'N/A')}``**"
-        all_display_entries = []
-        for i, song_info in enumerate(processed_song_queue):
-            title = song_info.get('title', 'N/A'); 
-            if len(title) > 60: title = title[:57] + "..."
-            webpage_url = song_info.get('webpage_url', None)
-            all_display_entries.append(f"`{i + 1}.` [{title}]({webpage_url})" if webpage_url and webpage_url != '#' else f"`{i + 1}.` {title}")
-        next_song_number = len(all_display_entries) + 1
-        active_summary_data = self.active_playlist_summaries.get(guild_id)
-        if active_summary_data and active_summary_data['entries']:
-            for summary_info in active_summary_data['entries']:
-                title = summary_info.get('title', 'เพลงกำลังโหลดชื่อ...'); 
-                if len(title) > 50: title = title[:47] + "..."
-                pending_webpage_url = summary_info.get('url', summary_info.get('webpage_url', None))
-                entry_text = f"`{next_song_number}.` {title} `(กำลังโหลด...)`"
-                if pending_webpage_url and pending_webpage_url != '#': entry_text = f"`{next_song_number}.` [{title}]({pending_webpage_url}) `(กำลังโหลด...)`"
-                all_display_entries.append(entry_text); next_song_number +=1
-        if not all_display_entries and not current_song_data: return await ctx.send("คิวเพลงว่างเปล่า และไม่มีเพลงกำลังเล่น")
+        queue_length = len(processed_song_queue); all_display_entries = self.queue_pages.page(processed_song_queue, 0, 20) # แสดงแค่ 20 รายการแรก
+        if not queue_length and not current_song_data: return await ctx.send("คิวเพลงว่างเปล่า และไม่มีเพลงกำลังเล่น")
         embed = discord.Embed(title="รายการเพลง (คิว) 🎵", color=discord.Color.purple())
         if current_song_field_text: embed.add_field(name="กำลังเล่น 🎶", value=current_song_field_text, inline=False)
         else: embed.add_field(name="กำลังเล่น 🎶", value="ขณะนี้ไม่มีเพลงกำลังเล่น", inline=False)
         if not all_display_entries: embed.add_field(name="ในคิว ⏳", value="ว่าง", inline=False)
         else:
-            display_text = "\n".join(all_display_entries[:20])
-            if len(all_display_entries) > 20: display_text += f"\n...และอีก {len(all_display_entries) - 20} เพลง"
+            display_text = "\n".join(all_display_entries)
+            if queue_length > 20: display_text += f"\n...และอีก {queue_length - 20} เพลง"
             embed.add_field(name="ในคิว ⏳", value=display_text if display_text else "ว่าง", inline=False)
-        embed.set_footer(text=f"มีทั้งหมด {len(all_display_entries)} รายการในคิว | ใช้ปุ่ม Queue ใน Panel เพื่อดูแบบแบ่งหน้า"); await ctx.send(embed=embed)
+        total_duration_text = f" ({_format_duration(processed_song_queue.total_duration)})" if queue_length else ""
+        embed.set_footer(text=f"มีทั้งหมด {queue_length} รายการในคิว{total_duration_text} | ใช้ปุ่ม Queue ใน Panel เพื่อดูแบบแบ่งหน้า"); await ctx.send(embed=embed)
 
     @commands.command(name="nowplaying", aliases=['np'], help="แสดงเพลงที่กำลังเล่นอยู่")
     async def nowplaying(self, ctx: commands.Context):
-        current = self.current_song.get(ctx.guild.id)
+        player = self.players.get(ctx.guild.id); current = player.current_song if player else None
         if current:
             embed = discord.Embed(title="กำลังเล่น 🎶", description=f"**``{current.get('title','N/A')}``**", color=discord.Color.green())
             requester_obj = current.get('requester')
@@ -621,25 +959,118 @@ class MusicCog(commands.Cog, name="MusicCog"):
             if current.get('duration', 0) > 0:
                 m, s = divmod(current['duration'], 60); h, m = divmod(m, 60)
                 duration_str = (f"{h:d}:{m:02d}:{s:02d}" if h else f"{m:02d}:{s:02d}")
+                position = self._current_position(player)
+                if position is not None: duration_str = f"{_format_duration(position)} / {duration_str}"
                 embed.add_field(name="Time", value=duration_str, inline=True)
-            current_guild_volume = self.guild_volumes.get(ctx.guild.id, {}).get('current', 0.7)
-            volume_display = f"``{int(current_guild_volume * 100)}%``"
-            if self.is_guild_muted.get(ctx.guild.id, False): volume_display = "``Muted (0%)``"
+            volume_display = f"``{int(player.volume * 100)}%``"
+            if player.muted: volume_display = "``Muted (0%)``"
             embed.add_field(name="Volume", value=volume_display, inline=True)
             await ctx.send(embed=embed)
         else: await ctx.send("ไม่มีเพลงกำลังเล่นอยู่")
 
     @commands.command(name="clear", aliases=['clr'], help="ล้างคิวเพลงทั้งหมด")
     async def clear(self, ctx: commands.Context):
-        guild_id = ctx.guild.id; queue = self._get_song_queue(guild_id); items_cleared = False
-        if queue: queue.clear(); items_cleared = True
-        if self.playlist_processing_tasks.get(guild_id) and not self.playlist_processing_tasks[guild_id].done():
-            self.playlist_processing_tasks[guild_id].cancel(); items_cleared = True
-        if guild_id in self.active_playlist_summaries: del self.active_playlist_summaries[guild_id]; items_cleared = True
-        if items_cleared: await ctx.send("🧹 ล้างคิวเพลงทั้งหมดและยกเลิกการโหลดเพลย์ลิสต์แล้ว", delete_after=10)
-        else: await ctx.send("คิวเพลงว่างอยู่แล้ว", delete_after=10)
+        guild_id = ctx.guild.id; player = self.players.get(guild_id); items_cleared = False
+        if player:
+            if player.queue or player.playlist_feeds: player.queue.clear(); player.drop_playlist_feeds(); items_cleared = True
+            player.cancel_lookahead(); self._reset_prefetch(player)
+        if items_cleared: await send_temporary(self.bot, ctx, "🧹 ล้างคิวเพลงทั้งหมดแล้ว", delete_after=10)
+        else: await send_temporary(self.bot, ctx, "คิวเพลงว่างอยู่แล้ว", delete_after=10)
         await self._call_panel_update(guild_id)
 
+    async def _on_queue_reordered(self, player: GuildPlayer):
+        # เพลงถัดไปอาจเปลี่ยน: เตรียม source / resolve ล่วงหน้าใหม่ตามลำดับคิวปัจจุบัน
+        self._reset_prefetch(player); self._refill_lookahead(player.guild_id)
+        await self._call_panel_update(player.guild_id)
+
+    def _estimate_wait(self, player: GuildPlayer, index: int) -> int:
+        # เวลาที่เหลือของเพลงปัจจุบัน (โดยประมาณ) + ผลรวม duration ของเพลงก่อนหน้า index ในคิว
+        remaining = 0; current = player.current_song; position = self._current_position(player)
+        if current and position is not None: remaining = max(0, int((current.get('duration') or 0) - position))
+        return remaining + player.queue.duration_before(index)
+
+    @commands.command(name="remove", aliases=['rm'], help="ลบเพลงออกจากคิวตามลำดับ")
+    async def remove(self, ctx: commands.Context, position: int):
+        player = self.players.get(ctx.guild.id)
+        if not player or not 1 <= position <= len(player.queue): return await send_temporary(self.bot, ctx, "ไม่มีเพลงลำดับนี้ในคิว", delete_after=10)
+        removed = player.queue.pop(position - 1)
+        await send_temporary(self.bot, ctx, f"🗑️ ลบออกจากคิว: **{removed.get('title', 'N/A')}**", delete_after=10)
+        await self._on_queue_reordered(player)
+
+    @commands.command(name="move", aliases=['mv'], help="ย้ายเพลงในคิวไปยังลำดับใหม่")
+    async def move(self, ctx: commands.Context, from_position: int, to_position: int):
+        player = self.players.get(ctx.guild.id); queue_length = len(player.queue) if player else 0
+        if not 1 <= from_position <= queue_length or not 1 <= to_position <= queue_length: return await send_temporary(self.bot, ctx, f"ลำดับต้องอยู่ระหว่าง 1 ถึง {queue_length}", delete_after=10)
+        moved = player.queue.move(from_position - 1, to_position - 1)
+        await send_temporary(self.bot, ctx, f"↕️ ย้าย **{moved.get('title', 'N/A')}** ไปลำดับที่ {to_position}", delete_after=10)
+        await self._on_queue_reordered(player)
+
+    @commands.command(name="shuffle", aliases=['sh'], help="สุ่มลำดับเพลงในคิว")
+    async def shuffle(self, ctx: commands.Context):
+        player = self.players.get(ctx.guild.id)
+        if not player or len(player.queue) < 2: return await send_temporary(self.bot, ctx, "มีเพลงในคิวไม่พอให้สุ่ม", delete_after=10)
+        player.queue.shuffle()
+        await send_temporary(self.bot, ctx, f"🔀 สุ่มลำดับเพลงในคิวแล้ว ({len(player.queue)} เพลง)", delete_after=10)
+        await self._on_queue_reordered(player)
+
+    @commands.command(name="eta", help="ดูว่าอีกนานแค่ไหนจะถึงเพลงของคุณ (หรือเพลงลำดับที่ระบุ)")
+    async def eta(self, ctx: commands.Context, position: int = None):
+        player = self.players.get(ctx.guild.id)
+        if not player or not player.queue: return await send_temporary(self.bot, ctx, "คิวเพลงว่างเปล่า", delete_after=10)
+        if position is None:
+            index = player.queue.index_where(lambda song: getattr(song.get('requester'), 'id', None) == ctx.author.id)
+            if index is None: return await send_temporary(self.bot, ctx, "คุณไม่มีเพลงอยู่ในคิว", delete_after=10)
+        elif 1 <= position <= len(player.queue): index = position - 1
+        else: return await send_temporary(self.bot, ctx, "ไม่มีเพลงลำดับนี้ในคิว", delete_after=10)
+        song = player.queue[index]
+        await send_temporary(self.bot, ctx, f"⏳ **{song.get('title', 'N/A')}** (ลำดับที่ {index + 1}) จะเล่นในอีกประมาณ {_format_duration(self._estimate_wait(player, index))}", delete_after=20)
+
+    def _collect_stats(self) -> dict:
+        cache_stats = self.extraction_cache.stats(); music_panel_cog = self.bot.get_cog("MusicPanelCog"); janitor_cog = self.bot.get_cog("MessageJanitorCog")
+        player_bytes = sum(player.memory_footprint() for player in self.players.values())
+        return {
+            "Guild players": {'players': len(self.players), 'connected': sum(1 for p in self.players.values() if p.voice_client),
+                              'bytes': player_bytes, 'avg_bytes': player_bytes // len(self.players) if self.players else 0},
+            "Extraction pool": self.extraction_pool.stats(),
+            "Panel updates": music_panel_cog.panel_update_stats() if music_panel_cog else {},
+            "Panel restore": music_panel_cog.panel_restore_stats() if music_panel_cog else {},
+            "Guild settings store": music_panel_cog.settings_stats() if music_panel_cog else {},
+            "Message janitor": janitor_cog.stats() if janitor_cog else {},
+            "Playback mode": self._playback_mode_stats(),
+            "Loop replay": self._replay_stats(),
+            "Seek / resume": {'resume_attempts_per_track': STREAM_RESUME_ATTEMPTS, **{k: v for k, v in self.position_stats.items() if k != 'seek_total_ms'},
+                              'avg_seek_ms': round(self.position_stats['seek_total_ms'] / self.position_stats['seeks']) if self.position_stats['seeks'] else None},
+            "Audio cache": self.audio_cache.stats() if self.audio_cache else {'enabled': False},
+            "Format selection": {codec: f"n={n} avg_score={total / n:.1f}" for codec, (n, total) in self.format_stats.items()},
+            "Gapless prefetch": {'lead_seconds': PREFETCH_LEAD_SECONDS, 'primed_now': sum(1 for p in self.players.values() if p.primed), **self.prefetch_stats},
+            "Just-in-time resolution": {'lookahead_window': STREAM_LOOKAHEAD, 'in_flight': len(self.pending_resolves), **self.jit_stats},
+            "Playlist paging": {'page_size': PLAYLIST_PAGE_SIZE, 'watermark': PLAYLIST_PAGE_WATERMARK, 'active_feeds': sum(len(p.playlist_feeds) for p in self.players.values()), **self.playlist_page_stats},
+            "Time to first audio": {kind: f"n={st['count']} avg={st['total_ms'] / st['count']:.0f}ms last={st['last_ms']:.0f}ms" for kind, st in self.ttfa_stats.items()},
+            "Queue pages": self.queue_pages.stats(),
+            "Extraction cache (query → id)": cache_stats['query'],
+            "Extraction cache (id → stream)": cache_stats['stream'],
+        }
+
+    @commands.command(name="musicstats", hidden=True, help="แสดงสถิติภายในของระบบเพลง (สำหรับผู้ดูแลบอท)")
+    @commands.is_owner()
+    async def music_stats(self, ctx: commands.Context):
+        embed = discord.Embed(title="Music System Stats 📊", color=discord.Color.dark_teal())
+        for section_name, section_stats in self._collect_stats().items():
+            lines = "\n".join(f"{k}: {v}" for k, v in section_stats.items())
+            embed.add_field(name=section_name, value=f"```{lines or '-'}```", inline=False)
+        await ctx.send(embed=embed)
+
+    @commands.command(name="audiocache", hidden=True, help="แสดงเพลงที่เก็บไว้ในแคชไฟล์เสียงบนดิสก์ (สำหรับผู้ดูแลบอท)")
+    @commands.is_owner()
+    async def audio_cache_command(self, ctx: commands.Context):
+        if not self.audio_cache: return await ctx.send("แคชไฟล์เสียงปิดอยู่ (ตั้งค่า AUDIO_CACHE_MAX_MB เพื่อเปิดใช้งาน)")
+        stats = self.audio_cache.stats()
+        embed = discord.Embed(title="Audio Cache 💾", color=discord.Color.dark_teal(),
+                              description=f"{stats['entries']} เพลง, {stats['bytes'] / 1048576:.1f} / {stats['budget_bytes'] / 1048576:.0f} MB · hits {stats['hits']} · fills {stats['fills']} (failed {stats['fill_failures']}) · evicted {stats['evictions']}")
+        top = sorted(self.audio_cache.entries.items(), key=lambda item: item[1].get('hits', 0), reverse=True)[:10]
+        lines = "\n".join(f"{entry.get('hits', 0):>4} × {(entry.get('title') or key)[:50]} ({entry['size'] / 1048576:.1f} MB)" for key, entry in top)
+        embed.add_field(name="เล่นจากแคชบ่อยที่สุด", value=f"```{lines or '-'}```", inline=False)
+        await ctx.send(embed=embed)
 
 async def setup(bot: commands.Bot):
     await bot.add_cog(MusicCog(bot))
\ No newline at end of file
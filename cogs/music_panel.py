@@ -1,12 +1,16 @@
 import discord
 from discord import app_commands
 from discord.ext import commands
-import json
 import os
 import datetime
 import traceback
 import math
 import asyncio
+import time
+
+from jukebox.scheduler import PanelUpdateScheduler, RequestPacer
+from jukebox.expiry import send_temporary
+from jukebox.settings_store import GuildSettingsStore
 
 # Import LoopMode จาก music_cog.py
 try:
@@ -19,34 +23,15 @@ except ImportError:
 
 # --- Settings for Data Persistence ---
 SETTINGS_DIR = "data"
-SETTINGS_FILE = os.path.join(SETTINGS_DIR, "music_panel_settings.json")
+SETTINGS_FILE = os.path.join(SETTINGS_DIR, "music_panel_settings.json") # รูปแบบเดิม: ย้ายเข้า SQLite อัตโนมัติครั้งแรกที่เปิด
+SETTINGS_DB = os.path.join(SETTINGS_DIR, "music_panel_settings.db")
 
 # --- ตั้งค่า URL รูปภาพเริ่มต้นโดยตรงในโค้ด ---
-DEFAULT_PANEL_IMAGE_URL = "https://cdn.discordapp.com/attachments/1140325634200064050/1143267146097492049/rimuru-tempest.gif?ex=6834c280&is=68337100&hm=99b5a92745ee04b7944e2424696c61b1ef40cf029e62411e52c0c28601e37d9e&"
-
-def load_guild_settings():
-    # ... (โค้ด load_guild_settings เหมือนเดิม จาก request_22) ...
-    if not os.path.exists(SETTINGS_DIR):
-        try: os.makedirs(SETTINGS_DIR); print(f"[Settings] Created directory '{SETTINGS_DIR}'.")
-        except OSError as e: print(f"[Settings] Error creating directory '{SETTINGS_DIR}': {e}. Returning empty settings."); return {}
-    if not os.path.exists(SETTINGS_FILE): print(f"[Settings] File '{SETTINGS_FILE}' not found. Returning empty settings."); return {}
-    try:
-        with open(SETTINGS_FILE, "r", encoding="utf-8") as f: content = f.read()
-        if not content.strip(): print(f"[Settings] File '{SETTINGS_FILE}' is empty. Returning empty settings."); return {}
-        loaded_settings = json.loads(content)
-        if not isinstance(loaded_settings, dict): print(f"[Settings] Content of '{SETTINGS_FILE}' is not a dict. Returning empty."); return {}
-        return loaded_settings
-    except json.JSONDecodeError: print(f"[Settings] Error decoding JSON from '{SETTINGS_FILE}'. Returning empty."); return {}
-    except FileNotFoundError: print(f"[Settings] FileNotFoundError for '{SETTINGS_FILE}'. Returning empty."); return {}
-    except Exception as e: print(f"[Settings] Unexpected error loading '{SETTINGS_FILE}': {e}. Returning empty."); traceback.print_exc(); return {}
-
-def save_guild_settings(settings):
-    # ... (โค้ด save_guild_settings เหมือนเดิม จาก request_22) ...
-    os.makedirs(SETTINGS_DIR, exist_ok=True)
-    try:
-        with open(SETTINGS_FILE, "w", encoding="utf-8") as f: json.dump(settings, f, indent=4)
-    except Exception as e: print(f"[Settings] CRITICAL: Failed to save settings to '{SETTINGS_FILE}': {e}"); traceback.print_exc()
+PANEL_UPDATE_MIN_INTERVAL = float(os.getenv("PANEL_UPDATE_MIN_INTERVAL", 1.5)) # แก้ไข panel ได้อย่างมากครั้งเดียวต่อช่วงเวลานี้ (ต่อ guild)
+PANEL_RESTORE_CONCURRENCY = int(os.getenv("PANEL_RESTORE_CONCURRENCY", 10)) # จำนวน fetch_message ที่ค้างพร้อมกันได้ตอนเริ่มบอท
+PANEL_RESTORE_RATE = float(os.getenv("PANEL_RESTORE_RATE", 40)) # request/วินาที ตอนกู้ panel (ต่ำกว่า global limit 50/s ของ Discord)
 
+DEFAULT_PANEL_IMAGE_URL = "https://cdn.discordapp.com/attachments/1140325634200064050/1143267146097492049/rimuru-tempest.gif?ex=6834c280&is=68337100&hm=99b5a92745ee04b7944e2424696c61b1ef40cf029e62411e52c0c28601e37d9e&"
 
 class MusicControllerView(discord.ui.View):
     # ... (โค้ด MusicControllerView ทั้งหมดเหมือนเดิม จาก request_24) ...
@@ -86,21 +71,20 @@ class MusicControllerView(discord.ui.View):
             for item in self.children:
                 if isinstance(item, discord.ui.Button) and item.style != discord.ButtonStyle.link: item.disabled = True
             return
-        guild_id = self.guild_id; vc = self.music_cog.voice_clients.get(guild_id)
-        current_song = self.music_cog.current_song.get(guild_id); queue = self.music_cog._get_song_queue(guild_id)
-        pending_summaries = self.music_cog.active_playlist_summaries.get(guild_id, {}).get('entries', [])
+        guild_id = self.guild_id; player = self.music_cog.players.get(guild_id)
+        vc = player.voice_client if player else None; current_song = player.current_song if player else None; queue = player.queue if player else []
         is_playing = bool(vc and vc.is_connected() and vc.is_playing()); is_paused = bool(vc and vc.is_connected() and vc.is_paused())
-        is_playing_or_paused = is_playing or is_paused; has_queue_or_current_or_pending = bool(current_song or queue or pending_summaries)
+        is_playing_or_paused = is_playing or is_paused; has_queue_or_current_or_pending = bool(current_song or queue)
         can_interact_with_player = bool(vc and vc.is_connected())
         if is_playing: self.play_pause_btn.emoji = "⏸️"; self.play_pause_btn.disabled = not can_interact_with_player
         elif is_paused: self.play_pause_btn.emoji = "▶️"; self.play_pause_btn.disabled = not can_interact_with_player
         elif has_queue_or_current_or_pending : self.play_pause_btn.emoji = "▶️"; self.play_pause_btn.disabled = not can_interact_with_player
         else: self.play_pause_btn.emoji = "⏯️"; self.play_pause_btn.disabled = True
-        self.skip_btn.disabled = not (is_playing_or_paused or (has_queue_or_current_or_pending and (len(queue) > 0 or len(pending_summaries) > 0) ))
+        self.skip_btn.disabled = not (is_playing_or_paused or len(queue) > 0)
         self.stop_btn.disabled = not is_playing_or_paused
-        current_loop = self.music_cog.loop_mode.get(guild_id, LoopMode.NONE) 
+        current_loop = player.loop_mode if player else LoopMode.NONE
         self.loop_btn.label = f"Loop: {LoopMode.TEXT[current_loop]}"; self.loop_btn.disabled = not can_interact_with_player
-        is_muted = self.music_cog.is_guild_muted.get(guild_id, False)
+        is_muted = bool(player and player.muted)
         self.mute_btn.emoji = "🔇" if is_muted else "🔊"; self.mute_btn.label = "Unmute" if is_muted else "Mute"; self.mute_btn.disabled = not can_interact_with_player
         self.vol_up_btn.disabled = not can_interact_with_player or is_muted; self.vol_down_btn.disabled = not can_interact_with_player or is_muted
         self.queue_btn.disabled = False
@@ -109,28 +93,31 @@ class MusicControllerView(discord.ui.View):
         if not self.music_cog:
             if not interaction.response.is_done(): await interaction.response.send_message("ระบบเพลงยังไม่พร้อม.", ephemeral=True, delete_after=7)
             return
-        if not interaction.response.is_done(): await interaction.response.defer(ephemeral=True)
         try:
             result = await music_cog_method(*args, **kwargs)
             final_message = default_ephemeral_message
             if isinstance(result, tuple) and len(result) == 2 and isinstance(result[1], str): final_message = result[1]
             elif isinstance(result, str): final_message = result
-            await interaction.followup.send(final_message, ephemeral=True)
+            # ตอบ interaction ด้วยการแก้ panel โดยตรง (รอบเดียว); ถ้า panel ไม่เปลี่ยนค่อยตอบเป็นข้อความ ephemeral
+            if not interaction.response.is_done() and self.panel_cog and await self.panel_cog.apply_panel_interaction(interaction, self): return
+            if interaction.response.is_done(): await interaction.followup.send(final_message, ephemeral=True)
+            else: await interaction.response.send_message(final_message, ephemeral=True)
+            if self.panel_cog: self.panel_cog.record_click_latency('ephemeral_reply', interaction)
         except Exception as e:
             print(f"Error performing music action '{music_cog_method.__name__}' from panel: {e}"); traceback.print_exc()
-            await interaction.followup.send(f"เกิดข้อผิดพลาด: {e}", ephemeral=True)
+            if interaction.response.is_done(): await interaction.followup.send(f"เกิดข้อผิดพลาด: {e}", ephemeral=True)
+            else: await interaction.response.send_message(f"เกิดข้อผิดพลาด: {e}", ephemeral=True)
 
     async def play_pause_callback(self, interaction: discord.Interaction): # ... (เหมือนเดิม)
         if not self.music_cog: return await interaction.response.send_message("ระบบเพลงไม่พร้อม", ephemeral=True, delete_after=7)
         vc = interaction.guild.voice_client
-        if not interaction.response.is_done(): await interaction.response.defer(ephemeral=True)
         if vc and vc.is_playing(): await self._handle_panel_action(interaction, self.music_cog.player_pause, self.guild_id, default_ephemeral_message="⏸️ หยุดเพลงชั่วคราวแล้ว")
         else:
             if vc and vc.is_paused(): await self._handle_panel_action(interaction, self.music_cog.player_resume, self.guild_id, default_ephemeral_message="▶️ เล่นเพลงต่อแล้ว")
-            elif self.music_cog._get_song_queue(self.guild_id) or self.music_cog.active_playlist_summaries.get(self.guild_id, {}).get('entries', []):
-                 await interaction.followup.send("▶️ กำลังเริ่มเล่นเพลงจากคิว...", ephemeral=True)
+            elif self.music_cog._get_song_queue(self.guild_id):
+                 await interaction.response.send_message("▶️ กำลังเริ่มเล่นเพลงจากคิว...", ephemeral=True) # อาจต้องรอ resolve เพลงแรก จึงตอบก่อน
                  await self.music_cog._play_next(self.guild_id, interaction.channel, silent_mode=True)
-            else: await interaction.followup.send("ไม่มีเพลงในคิวแล้วค่ะ", ephemeral=True)
+            else: await interaction.response.send_message("ไม่มีเพลงในคิวแล้วค่ะ", ephemeral=True)
     
     async def skip_callback(self, interaction: discord.Interaction): await self._handle_panel_action(interaction, self.music_cog.player_skip, self.guild_id)
     async def stop_callback(self, interaction: discord.Interaction): await self._handle_panel_action(interaction, self.music_cog.player_stop, self.guild_id)
@@ -159,7 +146,7 @@ class EphemeralQueueView(discord.ui.View):
     def __init__(self, original_interaction: discord.Interaction, music_cog_ref, guild_id: int, songs_per_page: int = 10):
         super().__init__(timeout=120.0)
         self.original_interaction = original_interaction; self.music_cog = music_cog_ref; self.guild_id = guild_id
-        self.songs_per_page = songs_per_page; self.current_page_index = 0; self.all_display_entries = []; self.total_pages = 1
+        self.songs_per_page = songs_per_page; self.current_page_index = 0; self.queue_length = 0; self.total_pages = 1
         self.message: discord.WebhookMessage = None
         self.first_page_eph_btn = discord.ui.Button(label="⏪", style=discord.ButtonStyle.secondary)
         self.prev_eph_btn = discord.ui.Button(label="⬅️", style=discord.ButtonStyle.primary)
@@ -171,36 +158,25 @@ class EphemeralQueueView(discord.ui.View):
         self.add_item(self.first_page_eph_btn); self.add_item(self.prev_eph_btn); self.add_item(self.page_eph_label)
         self.add_item(self.next_eph_btn); self.add_item(self.last_page_eph_btn)
     def _get_current_queue_data(self):
-        processed_queue = self.music_cog._get_song_queue(self.guild_id); current_song = self.music_cog.current_song.get(self.guild_id)
-        pending_summaries = self.music_cog.active_playlist_summaries.get(self.guild_id, {}).get('entries', []); display_entries = []
-        idx = 1
-        for song_info in processed_queue:
-            title = song_info.get('title', 'N/A'); 
-            if len(title) > 50: title = title[:47] + "..."
-            webpage_url = song_info.get('webpage_url', '#')
-            display_entries.append(f"`{idx}.` [{title}]({webpage_url})"); idx += 1
-        for summary in pending_summaries:
-            title = summary.get('title', 'เพลงกำลังโหลด...'); 
-            if len(title) > 50: title = title[:47] + "..."
-            pending_webpage_url = summary.get('url', summary.get('webpage_url','#'))
-            display_entries.append(f"`{idx}.` [{title}]({pending_webpage_url}) `(กำลังโหลด...)`"); idx += 1
-        self.all_display_entries = display_entries
-        self.total_pages = math.ceil(len(self.all_display_entries) / self.songs_per_page) if self.all_display_entries else 1
-        return current_song
+        player = self.music_cog.players.get(self.guild_id)
+        processed_queue = player.queue if player else []; current_song = player.current_song if player else None
+        self.queue_length = len(processed_queue)
+        self.total_pages = math.ceil(self.queue_length / self.songs_per_page) if self.queue_length else 1
+        self.current_page_index = min(self.current_page_index, self.total_pages - 1) # คิวอาจสั้นลงระหว่างเปิดดู
+        return current_song, processed_queue
     def _update_buttons_state(self):
         self.first_page_eph_btn.disabled = self.current_page_index == 0; self.prev_eph_btn.disabled = self.current_page_index == 0
         self.next_eph_btn.disabled = self.current_page_index >= self.total_pages - 1; self.last_page_eph_btn.disabled = self.current_page_index >= self.total_pages - 1
         self.page_eph_label.label = f"หน้า {self.current_page_index + 1}/{self.total_pages}"
     def _create_ephemeral_queue_embed(self):
-        current_song = self._get_current_queue_data(); self._update_buttons_state()
+        current_song, processed_queue = self._get_current_queue_data(); self._update_buttons_state()
         embed = discord.Embed(title="คิวเพลงปัจจุบัน 📜 (Ephemeral)", color=discord.Color.blue())
         if current_song: embed.add_field(name="🎶 กำลังเล่น", value=f"**``{current_song.get('title', 'N/A')}``**", inline=False)
-        if not self.all_display_entries: embed.description = "คิวเพลงว่างเปล่า"
+        if not self.queue_length: embed.description = "คิวเพลงว่างเปล่า"
         else:
-            start_index = self.current_page_index * self.songs_per_page; end_index = start_index + self.songs_per_page
-            page_entries = self.all_display_entries[start_index:end_index]
+            page_entries = self.music_cog.queue_pages.page(processed_queue, self.current_page_index, self.songs_per_page) # render เฉพาะหน้านี้ (มี cache ตาม version ของคิว)
             embed.description = "\n".join(page_entries) if page_entries else "หน้านี้ว่างเปล่า"
-            footer_text = f"มีทั้งหมด {len(self.all_display_entries)} รายการ"
+            footer_text = f"มีทั้งหมด {self.queue_length} รายการ"
             if self.total_pages > 1: footer_text += f" | หน้า {self.current_page_index + 1}/{self.total_pages}"
             embed.set_footer(text=footer_text)
         return embed
@@ -230,54 +206,133 @@ class EphemeralQueueView(discord.ui.View):
 class MusicPanelCog(commands.Cog, name="MusicPanelCog"):
     def __init__(self, bot: commands.Bot): # ... (เหมือนเดิม)
         self.bot = bot; self.music_cog = None
-        loaded_settings = load_guild_settings()
-        if loaded_settings is None: self.guild_settings = {}
-        else: self.guild_settings = loaded_settings
+        self.panel_updates = PanelUpdateScheduler(self.update_music_panel, min_interval=PANEL_UPDATE_MIN_INTERVAL)
+        self.panel_messages = {} # guild_id -> discord.PartialMessage ของ panel (แก้ไขได้เลยโดยไม่ต้อง fetch_message)
+        self.panel_fingerprints = {} # guild_id -> fingerprint ของสถานะที่แสดงอยู่บน panel ล่าสุด
+        self.panel_views = {} # guild_id -> MusicControllerView ตัวเดียวที่ลงทะเบียนไว้กับ bot (แก้สถานะปุ่มในตัวเดิม)
+        self.panel_edit_stats = {'edited': 0, 'skipped_unchanged': 0, 'edited_via_interaction': 0}
+        self.click_latency = {} # response path -> [count, total_ms, last_ms]
+        self.restore_stats = {} # ผลการกู้ panel ตอนเริ่มบอทครั้งล่าสุด
+        self.settings = GuildSettingsStore(SETTINGS_DB, legacy_json_path=SETTINGS_FILE) # โหลดทีละ guild เมื่อใช้ เขียนเป็น batch นอก event loop
         self.bot.loop.create_task(self.ensure_views_are_loaded_after_ready())
 
-    async def ensure_views_are_loaded_after_ready(self): # ... (เหมือนเดิม)
+    async def ensure_views_are_loaded_after_ready(self):
         await self.bot.wait_until_ready()
         self.music_cog = self.bot.get_cog("MusicCog")
         if not self.music_cog: print("!!! CRITICAL: MusicCog not found by MusicPanelCog after bot is ready."); return
-        settings_copy = list(self.guild_settings.items()); changed_settings = False
-        for guild_id_str, settings in settings_copy:
-            guild = self.bot.get_guild(int(guild_id_str))
-            if not guild:
-                if guild_id_str in self.guild_settings: del self.guild_settings[guild_id_str]; changed_settings = True; continue
-            msg_id = settings.get("music_panel_message_id"); channel_id = settings.get("music_channel_id")
-            if msg_id and channel_id:
-                try:
-                    channel = guild.get_channel(channel_id)
-                    if channel and isinstance(channel, discord.TextChannel):
-                        try:
-                            # await channel.fetch_message(msg_id) # Consider removing if causing startup delays
-                            view = MusicControllerView(self.music_cog, self, guild.id); view.message_id = msg_id
-                            view.update_button_states()
-                            self.bot.add_view(view, message_id=msg_id)
-                            print(f"Re-added/Verified MusicControllerView for message {msg_id} in guild {guild_id_str}")
-                        except discord.NotFound:
-                            print(f"Panel message {msg_id} not found in channel {channel_id} (guild {guild_id_str}). Clearing setting.")
-                            if guild_id_str in self.guild_settings and "music_panel_message_id" in self.guild_settings[guild_id_str]:
-                                del self.guild_settings[guild_id_str]["music_panel_message_id"]; changed_settings = True
-                        except discord.Forbidden: print(f"Forbidden to fetch message {msg_id} in channel {channel_id} (guild {guild_id_str}).")
-                        except Exception as e_fetch: print(f"Error fetching/re-adding view for message {msg_id} in guild {guild_id_str}: {e_fetch}")
-                    else: 
-                        print(f"Music channel {channel_id} not found or not TextChannel in guild {guild_id_str}. Clearing settings.")
-                        if guild_id_str in self.guild_settings: del self.guild_settings[guild_id_str]; changed_settings = True
-                except Exception as e: print(f"Generic error re-adding view for guild {guild_id_str}: {e}")
-        if changed_settings: save_guild_settings(self.guild_settings)
-
-
-    def get_guild_setting(self, guild_id: int, key: str, default=None): # ... (เหมือนเดิม)
-        return self.guild_settings.get(str(guild_id), {}).get(key, default)
-    def set_guild_setting(self, guild_id: int, key: str, value): # ... (เหมือนเดิม)
-        guild_id_str = str(guild_id)
-        if guild_id_str not in self.guild_settings: self.guild_settings[guild_id_str] = {}
-        self.guild_settings[guild_id_str][key] = value; save_guild_settings(self.guild_settings)
+        started_at = time.perf_counter(); guild_ids = await self.settings.guild_ids_with("music_channel_id")
+        in_flight = asyncio.Semaphore(PANEL_RESTORE_CONCURRENCY); pacer = RequestPacer(PANEL_RESTORE_RATE)
+        with self.settings.deferred(): # ไม่ให้ flush อัตโนมัติระหว่างตรวจ: รายการที่ตายแล้วทั้งหมดถูกลบใน flush เดียวด้านล่าง
+            results = await asyncio.gather(*(self._restore_panel(guild_id, in_flight, pacer) for guild_id in guild_ids), return_exceptions=True)
+        outcomes = {}
+        for guild_id, result in zip(guild_ids, results):
+            if isinstance(result, BaseException): print(f"[PANEL_RESTORE {guild_id}] Error restoring panel: {result}"); result = 'failed'
+            outcomes[result] = outcomes.get(result, 0) + 1
+        pruned_rows = await self.settings.flush() # ธุรกรรมเดียว
+        elapsed = time.perf_counter() - started_at
+        self.restore_stats = {'guilds': len(guild_ids), **outcomes, 'pruned_rows': pruned_rows, 'seconds': round(elapsed, 2), 'paced_wait_s': round(pacer.waited, 2), 'rate_limited': pacer.rate_limited}
+        print(f"[PANEL_RESTORE] Restored panels for {len(guild_ids)} guild(s) in {elapsed:.2f}s, pruned {pruned_rows} setting change(s) in one write: " + ", ".join(f"{k}={v}" for k, v in outcomes.items()))
+
+    async def _restore_panel(self, guild_id: int, in_flight: asyncio.Semaphore, pacer: RequestPacer) -> str:
+        settings = await self.settings.guild(guild_id)
+        guild = self.bot.get_guild(guild_id)
+        if not guild: self.settings.delete_guild(guild_id); return 'guild_gone'
+        msg_id = settings.get("music_panel_message_id"); channel_id = settings.get("music_channel_id")
+        if not msg_id: return 'no_panel'
+        channel = guild.get_channel(channel_id)
+        if not isinstance(channel, discord.TextChannel):
+            print(f"[PANEL_RESTORE {guild_id}] Music channel {channel_id} not found or not TextChannel. Clearing settings.")
+            self.settings.delete_guild(guild_id); return 'channel_gone'
+        async with in_flight: # จำกัดจำนวน request ที่ค้างอยู่พร้อมกัน + เว้นจังหวะตาม rate limit
+            for attempt in range(3):
+                await pacer.wait()
+                try: await channel.fetch_message(msg_id); break
+                except discord.NotFound:
+                    print(f"[PANEL_RESTORE {guild_id}] Panel message {msg_id} no longer exists. Clearing setting.")
+                    self.settings.set(guild_id, "music_panel_message_id", None); return 'message_gone'
+                except discord.Forbidden: break # ดูข้อความไม่ได้ แต่ panel น่าจะยังอยู่: ลงทะเบียน view ไว้ก่อน
+                except discord.RateLimited as e: pacer.penalize(e.retry_after)
+                except discord.HTTPException as e:
+                    if e.status != 429: print(f"[PANEL_RESTORE {guild_id}] Could not verify panel message {msg_id}: {e}"); break
+                    pacer.penalize(getattr(e, 'retry_after', None))
+        self._get_panel_view(guild.id, msg_id); self._cache_panel_message(guild.id, channel, msg_id)
+        return 'restored'
+
+    def _get_panel_view(self, guild_id: int, message_id: int) -> "MusicControllerView":
+        view = self.panel_views.get(guild_id)
+        if view is not None and view.message_id == message_id and not view.is_finished(): view.update_button_states(); return view
+        self._drop_panel_view(guild_id)
+        view = MusicControllerView(self.music_cog, self, guild_id); view.message_id = message_id
+        self.bot.add_view(view, message_id=message_id); self.panel_views[guild_id] = view
+        return view
+
+    def _drop_panel_view(self, guild_id: int):
+        view = self.panel_views.pop(guild_id, None)
+        if view is not None: view.stop() # stop() ถอด view ออกจาก view store ของ bot ด้วย
+
+    def _cache_panel_message(self, guild_id: int, channel: discord.TextChannel, message_id: int):
+        panel_message = channel.get_partial_message(message_id); self.panel_messages[guild_id] = panel_message
+        return panel_message
+
+    def _get_panel_message(self, guild_id: int, channel: discord.TextChannel, message_id: int):
+        panel_message = self.panel_messages.get(guild_id)
+        if panel_message is None or panel_message.id != message_id or panel_message.channel.id != channel.id:
+            panel_message = self._cache_panel_message(guild_id, channel, message_id)
+        return panel_message
+
+    def panel_fingerprint(self, guild: discord.Guild, view: "MusicControllerView") -> tuple:
+        # ทุกอย่างที่มองเห็นบน panel (ยกเว้น timestamp): ถ้าเท่าเดิมก็ไม่ต้องแก้ไขข้อความ
+        player = self.music_cog.players.get(guild.id) if self.music_cog else None
+        song = player.current_song if player else None; vc = guild.voice_client
+        song_state = None
+        if song:
+            requester = song.get('requester')
+            song_state = (song.get('title'), song.get('duration'), song.get('thumbnail'), getattr(requester, 'id', None),
+                          int(player.volume * 100), player.muted, vc.channel.id if vc and vc.channel else None)
+        buttons = tuple((item.custom_id, item.disabled, str(item.emoji) if item.emoji else None, item.label) for item in view.children if isinstance(item, discord.ui.Button))
+        return (song_state, len(player.queue) if player else 0, buttons)
+
+    async def apply_panel_interaction(self, interaction: discord.Interaction, view: "MusicControllerView") -> bool:
+        # แก้ panel ใน response ของการกดปุ่มเลย; คืน False ถ้าไม่มีอะไรเปลี่ยน (ผู้เรียกจะตอบเป็นข้อความแทน)
+        guild = interaction.guild
+        if not interaction.message or interaction.message.id != await self.get_guild_setting(guild.id, "music_panel_message_id"): return False
+        view.update_button_states(); fingerprint = self.panel_fingerprint(guild, view)
+        previous = self.panel_fingerprints.get(guild.id)
+        if previous == fingerprint: return False
+        embed = await self.create_embed_panel(guild)
+        if not embed: return False
+        self.panel_fingerprints[guild.id] = fingerprint # ตั้งก่อน await เพื่อให้ scheduler ข้ามการแก้ไขซ้ำที่ถูกขอไว้ระหว่างนี้
+        try: await interaction.response.edit_message(embed=embed, view=view)
+        except discord.HTTPException as e:
+            if self.panel_fingerprints.get(guild.id) == fingerprint: self.panel_fingerprints[guild.id] = previous
+            print(f"Panel interaction edit failed for guild {guild.id}: {e}"); self.request_panel_update(guild.id)
+            return False
+        self.panel_edit_stats['edited_via_interaction'] += 1; self.record_click_latency('edit_message', interaction)
+        return True
+
+    def record_click_latency(self, path: str, interaction: discord.Interaction):
+        # เวลาตั้งแต่ผู้ใช้กดปุ่ม (interaction.created_at) จนได้รับคำตอบที่มองเห็นได้
+        elapsed_ms = (discord.utils.utcnow() - interaction.created_at).total_seconds() * 1000
+        stats = self.click_latency.setdefault(path, [0, 0.0, 0.0]); stats[0] += 1; stats[1] += elapsed_ms; stats[2] = elapsed_ms
+
+    def panel_update_stats(self) -> dict:
+        latency = {f"click_{path}": f"n={n} avg={total / n:.0f}ms last={last:.0f}ms" for path, (n, total, last) in self.click_latency.items()}
+        return {**self.panel_updates.stats(), **self.panel_edit_stats, 'views': len(self.panel_views), **latency}
+
+    def panel_restore_stats(self) -> dict:
+        return dict(self.restore_stats)
+
+    def settings_stats(self) -> dict:
+        return self.settings.stats()
+
+    async def get_guild_setting(self, guild_id: int, key: str, default=None): # โหลดจาก SQLite นอก event loop ครั้งแรก จากนั้นอ่านจากหน่วยความจำ
+        return await self.settings.get(guild_id, key, default)
+    def set_guild_setting(self, guild_id: int, key: str, value): # None = ลบค่า; บันทึกลงดิสก์แบบ batch ภายหลัง
+        self.settings.set(guild_id, key, value)
 
     async def create_embed_panel(self, guild: discord.Guild): # *** แก้ไขตามคำขอ ***
         if not self.music_cog: print(f"PanelCog: MusicCog not ready for guild {guild.id}"); return None
-        guild_id = guild.id; current_song_data = self.music_cog.current_song.get(guild_id)
+        guild_id = guild.id; player = self.music_cog.players.get(guild_id); current_song_data = player.current_song if player else None
         # ใช้ DEFAULT_PANEL_IMAGE_URL ที่ hardcode ไว้ในไฟล์นี้เสมอสำหรับ default
         panel_image_url = DEFAULT_PANEL_IMAGE_URL
         if current_song_data and current_song_data.get('thumbnail'): panel_image_url = current_song_data['thumbnail']
@@ -288,8 +343,8 @@ class MusicPanelCog(commands.Cog, name="MusicPanelCog"):
         # --------------------
         current_time_utc = datetime.datetime.now(datetime.timezone.utc)
         embed.set_footer(text=footer_text, icon_url=self.bot.user.avatar.url if self.bot.user.avatar else None); embed.timestamp = current_time_utc
-        queue = self.music_cog._get_song_queue(guild_id); active_summaries = self.music_cog.active_playlist_summaries.get(guild_id, {}).get('entries', [])
-        queue_count_display = len(queue) + len(active_summaries)
+        queue = player.queue if player else []
+        queue_count_display = len(queue)
         
         vc = guild.voice_client
 
@@ -299,13 +354,17 @@ class MusicPanelCog(commands.Cog, name="MusicPanelCog"):
             total_duration_str = str(datetime.timedelta(seconds=int(duration_seconds))).split('.')[0] if duration_seconds > 0 else "Live"
             if total_duration_str.startswith("0:") and len(total_duration_str) > 4 : total_duration_str = total_duration_str[2:]
             elif not total_duration_str.startswith("0:") and len(total_duration_str) > 5 : pass
+            playback_position = self.music_cog.playback_position(guild_id) if duration_seconds > 0 else None
+            if playback_position: # ตำแหน่ง ณ ตอนแก้ไข panel (ไม่อยู่ใน fingerprint จึงไม่ทำให้ต้องแก้ไขเพิ่ม)
+                position_str = str(datetime.timedelta(seconds=int(playback_position[0])))
+                total_duration_str = f"{position_str[2:] if position_str.startswith('0:') else position_str} / {total_duration_str}"
             
             requester_obj = current_song_data.get('requester')
             requester_display = requester_obj.mention if isinstance(requester_obj, (discord.Member, discord.User)) else "N/A"
             
-            volume_percent_val = int(self.music_cog.guild_volumes.get(guild_id, {}).get('current', 0.7) * 100)
+            volume_percent_val = int(player.volume * 100)
             volume_display = f"``{volume_percent_val}%``"
-            if self.music_cog.is_guild_muted.get(guild_id, False): volume_display = "``Muted (0%)``"
+            if player.muted: volume_display = "``Muted (0%)``"
 
             voice_channel_mention = vc.channel.mention if vc and vc.channel else "N/A" # <--- ใช้ mention
 
@@ -333,7 +392,7 @@ class MusicPanelCog(commands.Cog, name="MusicPanelCog"):
         if not self.music_cog: print(f"[SETUP DEBUG {guild_id_str}] MusicCog not ready."); return await interaction.followup.send("MusicCog ยังไม่พร้อม.", ephemeral=True)
         
         channel_name = "🎵jukebox-slime"; print(f"[SETUP DEBUG {guild_id_str}] Target channel name: {channel_name}")
-        existing_channel_id = self.get_guild_setting(guild.id, "music_channel_id")
+        existing_channel_id = await self.get_guild_setting(guild.id, "music_channel_id")
         music_channel: discord.TextChannel = guild.get_channel(existing_channel_id) if existing_channel_id else None
         
         if music_channel and music_channel.name != channel_name :
@@ -353,12 +412,12 @@ class MusicPanelCog(commands.Cog, name="MusicPanelCog"):
         # ไม่มีการตั้งค่า default_panel_image_url ใน guild_settings อีกต่อไป เพราะจะใช้ค่า hardcode
         # print(f"[SETUP DEBUG {guild_id_str}] Default panel image URL will be from hardcoded value.")
         
-        old_panel_id = self.get_guild_setting(guild.id, "music_panel_message_id")
+        old_panel_id = await self.get_guild_setting(guild.id, "music_panel_message_id")
         if old_panel_id: # ... (ส่วนลบ panel เก่า เหมือนเดิม) ...
             print(f"[SETUP DEBUG {guild_id_str}] Attempting to delete old panel: {old_panel_id}")
             try:
-                old_msg = await asyncio.wait_for(music_channel.fetch_message(old_panel_id), timeout=5.0)
-                await old_msg.delete(); print(f"[SETUP DEBUG {guild_id_str}] Old panel deleted.")
+                await asyncio.wait_for(self._get_panel_message(guild.id, music_channel, old_panel_id).delete(), timeout=5.0) # ลบผ่าน partial message ไม่ต้อง fetch ก่อน
+                print(f"[SETUP DEBUG {guild_id_str}] Old panel deleted.")
             except asyncio.TimeoutError: print(f"[SETUP DEBUG {guild_id_str}] Timeout deleting old panel.")
             except (discord.NotFound, discord.Forbidden): print(f"[SETUP DEBUG {guild_id_str}] Old panel not found or no perm to delete.")
             except Exception as e_del: print(f"[SETUP DEBUG {guild_id_str}] Error deleting old panel: {e_del}")
@@ -366,14 +425,16 @@ class MusicPanelCog(commands.Cog, name="MusicPanelCog"):
         print(f"[SETUP DEBUG {guild_id_str}] Creating new embed panel...")
         try: # ... (ส่วนส่ง panel ใหม่ เหมือนเดิม + แก้ไขการส่ง followup) ...
             embed_to_send = await self.create_embed_panel(guild); print(f"[SETUP DEBUG {guild_id_str}] Embed created: {'Yes' if embed_to_send else 'No'}")
+            self._drop_panel_view(guild.id) # panel เก่าถูกลบไปแล้ว
             view_to_send = MusicControllerView(self.music_cog, self, guild.id); print(f"[SETUP DEBUG {guild_id_str}] View created.")
             view_to_send.update_button_states(); print(f"[SETUP DEBUG {guild_id_str}] View buttons updated.")
             if embed_to_send:
                 print(f"[SETUP DEBUG {guild_id_str}] Sending panel message to {music_channel.name}...")
                 panel_message = await music_channel.send(content=None, embed=embed_to_send, view=view_to_send)
                 print(f"[SETUP DEBUG {guild_id_str}] Panel message sent, ID: {panel_message.id}")
-                self.set_guild_setting(guild.id, "music_panel_message_id", panel_message.id)
-                view_to_send.message_id = panel_message.id; self.bot.add_view(view_to_send, message_id=panel_message.id)
+                self.set_guild_setting(guild.id, "music_panel_message_id", panel_message.id); self._cache_panel_message(guild.id, music_channel, panel_message.id)
+                self.panel_fingerprints[guild.id] = self.panel_fingerprint(guild, view_to_send)
+                view_to_send.message_id = panel_message.id; self.bot.add_view(view_to_send, message_id=panel_message.id); self.panel_views[guild.id] = view_to_send
                 final_followup_message = f"Music Control Panel ถูกสร้าง/อัปเดตในช่อง {music_channel.mention} แล้ว."
                 await interaction.followup.send(final_followup_message, ephemeral=True)
                 print(f"[SETUP DEBUG {guild_id_str}] Followup sent.")
@@ -388,49 +449,67 @@ class MusicPanelCog(commands.Cog, name="MusicPanelCog"):
                  try: await interaction.followup.send(final_error_message, ephemeral=True)
                  except discord.HTTPException: print(f"[SETUP DEBUG {guild_id_str}] Failed to send error followup after exception.")
 
-    async def update_music_panel(self, guild_id: int): # ... (เหมือนเดิม) ...
+    def cog_unload(self):
+        self.panel_updates.shutdown()
+        for guild_id in list(self.panel_views): self._drop_panel_view(guild_id)
+        self.settings.close()
+
+    def request_panel_update(self, guild_id: int):
+        # รวมคำขอที่มาถี่ๆ ให้เหลือการแก้ไขข้อความเดียวต่อ PANEL_UPDATE_MIN_INTERVAL และแสดงสถานะล่าสุดเสมอ
+        self.panel_updates.request(guild_id)
+
+    async def update_music_panel(self, guild_id: int): # เรียกผ่าน request_panel_update (scheduler) ไม่ใช่เรียกตรง
         if not self.music_cog: print(f"UpdatePanel: MusicCog not ready for guild {guild_id}"); return
         guild = self.bot.get_guild(guild_id); 
         if not guild: print(f"UpdatePanel: Guild {guild_id} not found"); return
-        channel_id = self.get_guild_setting(guild_id, "music_channel_id"); message_id = self.get_guild_setting(guild_id, "music_panel_message_id")
+        channel_id = await self.get_guild_setting(guild_id, "music_channel_id"); message_id = await self.get_guild_setting(guild_id, "music_panel_message_id")
         if not channel_id or not message_id: print(f"UpdatePanel: Panel not setup for guild {guild_id}"); return
         music_channel = guild.get_channel(channel_id)
-        if not music_channel: print(f"UpdatePanel: Music channel {channel_id} not found for guild {guild_id}"); return
+        if not music_channel: print(f"UpdatePanel: Music channel {channel_id} not found for guild {guild_id}"); self.panel_messages.pop(guild_id, None); return
         try:
-            panel_message = await music_channel.fetch_message(message_id)
+            panel_message = self._get_panel_message(guild_id, music_channel, message_id) # ไม่ต้อง fetch ก่อนแก้ไข
+            panel_view = self._get_panel_view(guild_id, panel_message.id) # view เดิม สถานะปุ่มอัปเดตแล้ว
+            fingerprint = self.panel_fingerprint(guild, panel_view)
+            if self.panel_fingerprints.get(guild_id) == fingerprint: self.panel_edit_stats['skipped_unchanged'] += 1; return
             new_embed = await self.create_embed_panel(guild)
-            new_view = MusicControllerView(self.music_cog, self, guild_id)
-            new_view.message_id = panel_message.id; new_view.update_button_states()
             if new_embed:
-                await panel_message.edit(content=None, embed=new_embed, view=new_view)
-                self.bot.add_view(new_view, message_id=panel_message.id) 
+                await panel_message.edit(content=None, embed=new_embed, view=panel_view)
+                self.panel_fingerprints[guild_id] = fingerprint; self.panel_edit_stats['edited'] += 1
         except discord.NotFound:
             print(f"Music panel message (ID: {message_id}) not found in guild {guild_id}. Clearing setting.")
+            self.panel_messages.pop(guild_id, None); self.panel_fingerprints.pop(guild_id, None); self._drop_panel_view(guild_id)
             self.set_guild_setting(guild_id, "music_panel_message_id", None) # Clear only message_id
-            save_guild_settings(self.guild_settings) # Save the change
         except discord.Forbidden: print(f"Bot lacks permissions to edit the music panel in guild {guild_id}.")
+        except discord.RateLimited: raise # ให้ scheduler นับและหน่วงเวลา
+        except discord.HTTPException as e:
+            if e.status == 429: raise
+            print(f"Error updating music panel for guild {guild_id}: {e}")
         except Exception as e: print(f"Error updating music panel for guild {guild_id}: {e}")
 
 
     @commands.Cog.listener()
     async def on_message(self, message: discord.Message): # ... (เหมือนเดิม) ...
         if message.author.bot or not message.guild: return
-        guild_id = message.guild.id; music_channel_id = self.get_guild_setting(guild_id, "music_channel_id")
+        guild_id = message.guild.id; music_channel_id = await self.get_guild_setting(guild_id, "music_channel_id")
         if not music_channel_id or message.channel.id != music_channel_id: return
+        await self._delete_user_message(message) # ไม่รอการลบ: เริ่มประมวลผลคำขอได้ทันที
         if not self.music_cog:
-            try: await message.delete(); await message.channel.send("ระบบเพลงยังไม่พร้อม.", delete_after=7)
+            try: await send_temporary(self.bot, message.channel, "ระบบเพลงยังไม่พร้อม.", delete_after=7)
             except discord.HTTPException: pass; return
         query = message.content.strip()
-        try: await message.delete()
-        except discord.HTTPException: pass
         if not query: return
         if not message.author.voice or not message.author.voice.channel:
-            try: await message.channel.send(f"{message.author.mention} คุณต้องอยู่ในช่องเสียงเพื่อเพิ่มเพลงค่ะ!", delete_after=10)
+            try: await send_temporary(self.bot, message.channel, f"{message.author.mention} คุณต้องอยู่ในช่องเสียงเพื่อเพิ่มเพลงค่ะ!", delete_after=10)
             except discord.HTTPException: pass; return
         print(f"MusicPanelCog: Detected query '{query}' in music channel for guild {guild_id} by {message.author.name}")
         try: await self.music_cog.add_to_queue_from_panel(message.guild, message.author, message.channel, query)
         except Exception as e: print(f"Error calling add_to_queue_from_panel from MusicPanelCog: {e}"); traceback.print_exc()
 
+    async def _delete_user_message(self, message: discord.Message):
+        janitor = self.bot.get_cog("MessageJanitorCog")
+        if janitor: janitor.delete_soon(message) # รวมเป็น bulk delete ต่อช่อง
+        else: await message.delete(delay=0) # delay= ให้ discord.py ลบใน task แยก (ไม่รอ, ไม่โยน error)
+
 async def setup(bot: commands.Bot):
     if not bot.get_cog("MusicCog"):
         print("MusicPanelCog: MusicCog is not loaded. Music Panel may not function correctly until MusicCog is available.")
@@ -0,0 +1,3 @@
+# jukebox/__init__.py
+# Helper modules ที่ใช้ร่วมกันระหว่าง cogs ของระบบเพลง (ไม่ใช่ Cog จึงไม่ได้อยู่ในโฟลเดอร์ cogs/
+# เพราะ main.py จะพยายามโหลดทุกไฟล์ .py ในนั้นเป็น extension)
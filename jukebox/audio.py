@@ -0,0 +1,66 @@
+# jukebox/audio.py
+# AudioSource helpers used by MusicCog's playback path.
+import discord
+
+
+class PrimedAudioSource(discord.AudioSource):
+    """FFmpeg source that was opened ahead of time and already produced its first frame.
+
+    Opening the next track in the last seconds of the current one hides FFmpeg
+    startup, the HTTP connect and the first buffer fill behind playback; the
+    frame read while priming is handed out on the first read() so nothing is lost.
+    """
+
+    def __init__(self, source: discord.AudioSource, first_frame: bytes):
+        self.source = source; self._first_frame = first_frame
+
+    def read(self) -> bytes:
+        if self._first_frame is not None:
+            frame = self._first_frame; self._first_frame = None
+            return frame
+        return self.source.read()
+
+    def is_opus(self) -> bool:
+        return self.source.is_opus()
+
+    def cleanup(self):
+        self._first_frame = None; self.source.cleanup()
+
+
+FRAME_SECONDS = 0.02  # discord.py reads one 20 ms frame per read(), PCM or Opus
+
+
+class FrameCountingSource(discord.AudioSource):
+    """Outermost source handed to the voice client; counts frames to know the playback position.
+
+    The position is what lets MusicCog reopen the same track at the same point:
+    to leave Opus passthrough when the volume changes, to seek, and to resume a
+    stream that dropped mid-track. `ended` tells a source that ran out apart from
+    one that was stopped (skip/stop never see the final empty read).
+    """
+
+    def __init__(self, source: discord.AudioSource, start_seconds: float = 0.0):
+        self.source = source; self.start_seconds = start_seconds; self.frames = 0; self.ended = False
+
+    @property
+    def position(self) -> float:
+        return self.start_seconds + self.frames * FRAME_SECONDS
+
+    def read(self) -> bytes:
+        data = self.source.read()
+        if data: self.frames += 1
+        else: self.ended = True
+        return data
+
+    def is_opus(self) -> bool:
+        return self.source.is_opus()
+
+    def cleanup(self):
+        self.source.cleanup()
+
+
+def read_after(source: discord.AudioSource, skip: int) -> bytes:
+    """Drop `skip` frames and return the next one (blocking); b'' if the source ran out."""
+    for _ in range(skip):
+        if not source.read(): return b''
+    return source.read()
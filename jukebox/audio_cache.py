@@ -0,0 +1,207 @@
+# jukebox/audio_cache.py
+# Optional on-disk cache of the compressed audio of tracks that keep getting played.
+# A track is downloaded in the background once it has been played `min_plays`
+# times; later plays read the local file instead of re-streaming from the origin,
+# and no longer depend on a signed stream URL that expires. Files are evicted
+# least-recently-played first to stay within the byte budget.
+#
+#   python -m jukebox.audio_cache list                      # what is cached
+#   python -m jukebox.audio_cache warm <file> --id <video id> [--title ...] [--acodec opus]
+#   python -m jukebox.audio_cache evict <video id>
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import shutil
+import time
+from collections import OrderedDict
+
+DOWNLOAD_CHUNK_BYTES = 8 * 1024 * 1024  # ranged requests; googlevideo throttles long single reads
+MAX_TRACKED_PLAYS = 5000  # play counters kept for not-yet-cached tracks (least recently played dropped first)
+_EXTENSIONS = (('opus', 'webm'), ('vorbis', 'webm'), ('mp4a', 'm4a'), ('aac', 'm4a'), ('mp3', 'mp3'))
+
+
+def cache_key(song: dict):
+    """Stable key for a song: its video id, else a hash of its page URL (None if neither is known)."""
+    if song.get('id'): return str(song['id'])
+    page_url = song.get('webpage_url')
+    return hashlib.sha1(page_url.encode()).hexdigest()[:16] if page_url else None
+
+
+def _extension(acodec: str) -> str:
+    acodec = (acodec or '').lower()
+    return next((ext for prefix, ext in _EXTENSIONS if acodec.startswith(prefix)), 'audio')
+
+
+class AudioDiskCache:
+    def __init__(self, directory: str, max_bytes: int, min_plays: int = 3, max_track_bytes: int = None, max_tracked_plays: int = MAX_TRACKED_PLAYS):
+        self.directory = directory; self.max_bytes = max_bytes; self.min_plays = max(1, min_plays)
+        self.max_track_bytes = max_track_bytes or max(1, max_bytes // 4); self.max_tracked_plays = max(1, max_tracked_plays)
+        self.index_path = os.path.join(directory, "index.json")
+        os.makedirs(directory, exist_ok=True)
+        self.entries = {}  # key -> {'file', 'size', 'acodec', 'title', 'added_at', 'last_used', 'hits'}
+        self.plays = OrderedDict()  # key -> plays counted so far (for keys not cached yet), least recently played first
+        self._filling = set(); self._index_dirty = False
+        self.hits = 0; self.fills = 0; self.fill_failures = 0; self.evictions = 0; self.bytes_downloaded = 0
+        self._load_index()
+
+    def _load_index(self):
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f: index = json.load(f)
+        except FileNotFoundError: return
+        except (OSError, json.JSONDecodeError) as e: print(f"[AUDIO_CACHE] Could not read '{self.index_path}', starting empty: {e}"); return
+        self.plays = OrderedDict(index.get('plays', {})); self._trim_plays()
+        for key, entry in index.get('entries', {}).items(): # ไฟล์ที่หายไปจากดิสก์ไม่นับ
+            if os.path.exists(os.path.join(self.directory, entry['file'])): self.entries[key] = entry
+
+    def _snapshot_index(self):
+        # serialize on the event loop thread; only the file write may run elsewhere
+        if not self._index_dirty: return None
+        self._index_dirty = False; self._trim_plays()
+        return json.dumps({'entries': self.entries, 'plays': self.plays}, ensure_ascii=False)
+
+    def _write_index(self, text: str):
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f: f.write(text)
+        os.replace(tmp_path, self.index_path)
+
+    def save_index(self):
+        text = self._snapshot_index()
+        if text is not None: self._write_index(text)
+
+    async def save_index_async(self):
+        text = self._snapshot_index()
+        if text is not None: await asyncio.get_running_loop().run_in_executor(None, self._write_index, text)
+
+    @property
+    def total_bytes(self) -> int:
+        return sum(entry['size'] for entry in self.entries.values())
+
+    def lookup(self, song: dict):
+        """Path of the cached audio for `song` (marks it as recently used), or None."""
+        key = cache_key(song); entry = self.entries.get(key) if key else None
+        if entry is None: return None
+        path = os.path.join(self.directory, entry['file'])
+        if not os.path.exists(path): del self.entries[key]; self._index_dirty = True; return None
+        entry['last_used'] = time.time(); entry['hits'] = entry.get('hits', 0) + 1; self.hits += 1; self._index_dirty = True
+        if not song.get('acodec'): song['acodec'] = entry.get('acodec') # ใช้ตัดสินโหมด passthrough ได้แม้เพลงยังไม่ resolve
+        return path
+
+    def contains(self, song: dict) -> bool:
+        key = cache_key(song)
+        return bool(key and key in self.entries)
+
+    def record_play(self, song: dict) -> bool:
+        """Count a play; True when the song just became worth caching and should be filled."""
+        key = cache_key(song)
+        if not key or key in self.entries or key in self._filling: return False
+        self.plays[key] = self.plays.pop(key, 0) + 1; self._index_dirty = True  # re-insert: most recently played last
+        count = self.plays[key]; self._trim_plays()
+        return count >= self.min_plays
+
+    def _trim_plays(self):
+        # นับเฉพาะเพลงที่เพิ่งเล่นไม่นานนี้ ไม่ให้ dict และ index.json โตไม่สิ้นสุด
+        while len(self.plays) > self.max_tracked_plays: self.plays.popitem(last=False); self._index_dirty = True
+
+    async def fill(self, song: dict, session):
+        """Download `song['stream_url']` into the cache with ranged GETs (aiohttp session)."""
+        key = cache_key(song); stream_url = song.get('stream_url')
+        if not key or not stream_url or key in self._filling or key in self.entries: return False
+        self._filling.add(key); file_name = f"{key}.{_extension(song.get('acodec'))}"; tmp_path = os.path.join(self.directory, file_name + ".part")
+        try:
+            size = await self._download(session, stream_url, tmp_path)
+            if size is None: self.fill_failures += 1; return False
+            os.replace(tmp_path, os.path.join(self.directory, file_name))
+            self._add_entry(key, file_name, size, song); self.fills += 1; self.bytes_downloaded += size
+            print(f"[AUDIO_CACHE] Cached '{song.get('title')}' ({size / 1048576:.1f} MB), total {self.total_bytes / 1048576:.1f} MB")
+            return True
+        except Exception as e: self.fill_failures += 1; print(f"[AUDIO_CACHE] Failed to cache '{song.get('title')}': {e}"); return False
+        finally:
+            self._filling.discard(key)
+            if os.path.exists(tmp_path): os.remove(tmp_path)
+            await self.save_index_async()
+
+    async def _download(self, session, url: str, tmp_path: str):
+        # ไฟล์ถูกเปิด/เขียน/ปิดใน thread pool: event loop (ที่ส่งเสียงให้ทุก guild) ไม่ต้องรอดิสก์
+        loop = asyncio.get_running_loop(); written = 0; total = None
+        f = await loop.run_in_executor(None, open, tmp_path, "wb")
+        try:
+            while total is None or written < total:
+                requested = min(DOWNLOAD_CHUNK_BYTES, total - written) if total else DOWNLOAD_CHUNK_BYTES; received = 0
+                headers = {'Range': f"bytes={written}-{written + requested - 1}"}
+                async with session.get(url, headers=headers) as response:
+                    if response.status == 416 and total is None and written: break # ขนาดไม่ทราบและพอดีกับ range ก่อนหน้า: ถึงท้ายไฟล์แล้ว
+                    if response.status not in (200, 206): print(f"[AUDIO_CACHE] HTTP {response.status} while downloading"); return None
+                    content_range = response.headers.get('Content-Range', '') # bytes a-b/total
+                    if response.status == 200: total = int(response.headers.get('Content-Length') or 0) or None # ไม่รองรับ Range: ได้ทั้งไฟล์ในครั้งเดียว
+                    elif '/' in content_range and not content_range.endswith('/*'): total = int(content_range.rsplit('/', 1)[1])
+                    async for chunk in response.content.iter_chunked(256 * 1024):
+                        written += len(chunk); received += len(chunk)
+                        if written > self.max_track_bytes: print(f"[AUDIO_CACHE] Track is larger than {self.max_track_bytes} bytes, not caching"); return None
+                        await loop.run_in_executor(None, f.write, chunk)
+                if response.status == 200 or not received: break # ทั้งไฟล์มาในครั้งเดียว / ไม่มีข้อมูลเพิ่มแล้ว
+                if total is None and received < requested: break # ไม่ทราบขนาดรวม (bytes a-b/* หรือไม่มี header): range ที่สั้นกว่าที่ขอคือท้ายไฟล์
+        finally: await loop.run_in_executor(None, f.close)
+        if total is not None and written != total: print(f"[AUDIO_CACHE] Download stopped at {written} of {total} bytes, not caching"); return None # ไม่เก็บไฟล์ที่ขาด
+        return written or None
+
+    def warm(self, key: str, source_path: str, title: str = None, acodec: str = None) -> str:
+        """Copy a local audio file into the cache under `key` (offline testing / pre-seeding)."""
+        file_name = f"{key}.{_extension(acodec) if acodec else os.path.splitext(source_path)[1].lstrip('.') or 'audio'}"
+        shutil.copyfile(source_path, os.path.join(self.directory, file_name))
+        self._add_entry(key, file_name, os.path.getsize(source_path), {'title': title or os.path.basename(source_path), 'acodec': acodec})
+        self.save_index()
+        return file_name
+
+    def _add_entry(self, key: str, file_name: str, size: int, song: dict):
+        now = time.time()
+        self.entries[key] = {'file': file_name, 'size': size, 'acodec': song.get('acodec'), 'title': song.get('title'), 'added_at': now, 'last_used': now, 'hits': 0}
+        self.plays.pop(key, None); self._index_dirty = True
+        self._evict_to_budget(keep=key)
+
+    def _evict_to_budget(self, keep: str = None):
+        total = self.total_bytes
+        for key, entry in sorted(self.entries.items(), key=lambda item: item[1]['last_used']): # LRU ก่อน
+            if total <= self.max_bytes: break
+            if key == keep: continue
+            self.evict(key); total -= entry['size']
+
+    def evict(self, key: str) -> bool:
+        entry = self.entries.pop(key, None)
+        if entry is None: return False
+        try: os.remove(os.path.join(self.directory, entry['file']))
+        except FileNotFoundError: pass
+        self.evictions += 1; self._index_dirty = True
+        return True
+
+    def stats(self) -> dict:
+        return {'entries': len(self.entries), 'bytes': self.total_bytes, 'budget_bytes': self.max_bytes, 'min_plays': self.min_plays,
+                'hits': self.hits, 'fills': self.fills, 'filling': len(self._filling), 'fill_failures': self.fill_failures,
+                'evictions': self.evictions, 'downloaded_bytes': self.bytes_downloaded, 'tracked_plays': len(self.plays)}
+
+
+def _main():
+    parser = argparse.ArgumentParser(prog="python -m jukebox.audio_cache", description="Inspect or pre-fill the on-disk audio cache.")
+    parser.add_argument("--dir", default=os.getenv("AUDIO_CACHE_DIR", os.path.join("data", "audio_cache")))
+    parser.add_argument("--max-mb", type=int, default=int(os.getenv("AUDIO_CACHE_MAX_MB", 0)) or 1024)
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list", help="list cached tracks, most recently played first")
+    warm = commands.add_parser("warm", help="add a local audio file to the cache")
+    warm.add_argument("file"); warm.add_argument("--id", required=True, help="video id the bot will look the track up by")
+    warm.add_argument("--title"); warm.add_argument("--acodec", help="e.g. opus (lets the bot use Opus passthrough for it)")
+    evict = commands.add_parser("evict", help="remove a track from the cache"); evict.add_argument("id")
+    args = parser.parse_args()
+    cache = AudioDiskCache(args.dir, args.max_mb * 1024 * 1024)
+    if args.command == "list":
+        for key, entry in sorted(cache.entries.items(), key=lambda item: item[1]['last_used'], reverse=True):
+            print(f"{key:<16} {entry['size'] / 1048576:8.1f} MB  hits={entry.get('hits', 0):<5} {entry.get('acodec') or '-':<10} {entry.get('title') or ''}")
+        print(f"{len(cache.entries)} track(s), {cache.total_bytes / 1048576:.1f} / {cache.max_bytes / 1048576:.0f} MB")
+    elif args.command == "warm": print(f"Cached '{args.file}' as {cache.warm(args.id, args.file, args.title, args.acodec)}")
+    elif args.command == "evict":
+        removed = cache.evict(args.id); cache.save_index()
+        print("Evicted" if removed else "Not cached", args.id)
+
+
+if __name__ == "__main__":
+    _main()
@@ -0,0 +1,145 @@
+# jukebox/cache.py
+# Two-tier extraction cache in front of yt-dlp:
+#   tier 1: search query / page URL  -> video key   (cheap, long TTL)
+#   tier 2: video key -> compact stream record     (TTL from the signed URL's expire=)
+import re
+import time
+from collections import OrderedDict
+
+QUERY_TTL_SECONDS = 6 * 3600        # query -> id mapping rarely changes
+DEFAULT_STREAM_TTL_SECONDS = 30 * 60  # used when a stream URL carries no expire= hint
+STREAM_EXPIRY_MARGIN_SECONDS = 120  # don't hand out URLs that are about to die
+
+_EXPIRE_RE = re.compile(r"[?&/]expire[=/](\d+)")
+
+# Keys of an extracted info dict that MusicCog actually reads. Everything else
+# (http_headers, automatic_captions, heatmaps, ...) is dropped before caching.
+_SONG_KEYS = ('_type', 'id', 'extractor_key', 'title', 'url', 'webpage_url', 'original_url', 'duration',
+              'uploader', 'thumbnail', 'is_live', 'format_id', 'acodec', 'vcodec', 'abr', 'asr', 'ext')
+_FORMAT_KEYS = ('format_id', 'url', 'acodec', 'vcodec', 'abr', 'asr', 'tbr', 'ext', 'protocol')
+_ENTRY_KEYS = ('id', 'title', 'url', 'webpage_url', 'duration')
+_PLAYLIST_KEYS = ('_type', 'id', 'extractor_key', 'title', 'webpage_url', 'original_url', 'playlist_count')
+
+
+def stream_expiry(stream_url: str):
+    """Return the unix time encoded in a signed stream URL (expire=...), or None."""
+    if not stream_url: return None
+    match = _EXPIRE_RE.search(stream_url)
+    return int(match.group(1)) if match else None
+
+
+def estimate_size(obj) -> int:
+    """Cheap recursive byte estimate, good enough for a memory budget."""
+    if isinstance(obj, str): return 49 + len(obj)
+    if isinstance(obj, dict): return 64 + sum(estimate_size(k) + estimate_size(v) for k, v in obj.items())
+    if isinstance(obj, (list, tuple)): return 56 + sum(estimate_size(v) for v in obj)
+    return 28
+
+
+def compact_info(data: dict):
+    """Strip a yt-dlp info dict down to the fields the music cog uses."""
+    if not data: return data
+    if data.get('_type') == 'playlist':
+        entries = [e for e in (data.get('entries') or []) if e]
+        # ytsearch1: comes back as a one-entry "playlist" whose entry is already fully extracted
+        if len(entries) == 1 and entries[0].get('formats') and str(data.get('extractor_key', '')).endswith('Search'):
+            return compact_info(entries[0])
+        compact = {k: data[k] for k in _PLAYLIST_KEYS if k in data}
+        compact['entries'] = [{k: e[k] for k in _ENTRY_KEYS if k in e} for e in entries]
+        return compact
+    compact = {k: data[k] for k in _SONG_KEYS if k in data}
+    formats = [{k: f[k] for k in _FORMAT_KEYS if k in f} for f in (data.get('formats') or [])
+               if f.get('url') and f.get('acodec') and f.get('acodec') != 'none']
+    if formats: compact['formats'] = formats
+    thumbnails = data.get('thumbnails') or []
+    if thumbnails and thumbnails[-1].get('url'): compact['thumbnails'] = [{'url': thumbnails[-1]['url']}]
+    return compact
+
+
+def _record_stream_url(record: dict):
+    if record.get('url'): return record['url']
+    for f_data in record.get('formats', []):
+        if f_data.get('url'): return f_data['url']
+    return None
+
+
+class _LRUTier:
+    def __init__(self, name: str, max_entries: int, max_bytes: int = 0):
+        self.name = name; self.max_entries = max_entries; self.max_bytes = max_bytes
+        self._data = OrderedDict()  # key -> (value, expires_at, size)
+        self.bytes = 0; self.hits = 0; self.misses = 0; self.expired = 0; self.evictions = 0
+
+    def get(self, key, now: float):
+        item = self._data.get(key)
+        if item is None: self.misses += 1; return None
+        value, expires_at, _ = item
+        if expires_at <= now:
+            self._remove(key); self.expired += 1; self.misses += 1; return None
+        self._data.move_to_end(key); self.hits += 1
+        return value
+
+    def put(self, key, value, expires_at: float, size: int = 0):
+        if key in self._data: self._remove(key)
+        if self.max_bytes and size > self.max_bytes: return  # would evict everything else
+        self._data[key] = (value, expires_at, size); self.bytes += size
+        while len(self._data) > self.max_entries or (self.max_bytes and self.bytes > self.max_bytes):
+            oldest_key = next(iter(self._data)); self._remove(oldest_key); self.evictions += 1
+
+    def discard(self, key):
+        if key in self._data: self._remove(key)
+
+    def _remove(self, key):
+        _, _, size = self._data.pop(key); self.bytes -= size
+
+    def __len__(self): return len(self._data)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {'entries': len(self._data), 'bytes': self.bytes, 'hits': self.hits, 'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+                'expired': self.expired, 'evictions': self.evictions}
+
+
+class ExtractionCache:
+    """In-process cache for single-video extraction results. Playlist listings are not cached."""
+
+    def __init__(self, max_entries: int = 1024, max_bytes: int = 32 * 1024 * 1024):
+        self.queries = _LRUTier("query", max_entries * 4)
+        self.streams = _LRUTier("stream", max_entries, max_bytes)
+
+    @staticmethod
+    def key_for(query: str, ydl_opts: dict) -> str:
+        # noplaylist changes what the same URL resolves to (video vs. its playlist), so it is part of the key
+        prefix = '1|' if ydl_opts.get('noplaylist') else '0|'
+        default_search = ydl_opts.get('default_search') or ''
+        if default_search.startswith('ytsearch') and not query.startswith(('http://', 'https://', 'www.')):
+            return prefix + default_search + ' '.join(query.lower().split())
+        return prefix + query.strip()
+
+    @staticmethod
+    def video_key(record: dict):
+        if not record.get('id'): return None
+        return f"{record.get('extractor_key', '')}:{record['id']}"
+
+    def get(self, query: str, ydl_opts: dict):
+        now = time.time()
+        video_key = self.queries.get(self.key_for(query, ydl_opts), now)
+        if video_key is None: return None
+        return self.streams.get(video_key, now)
+
+    def put(self, query: str, ydl_opts: dict, record: dict):
+        if not record or record.get('_type') == 'playlist': return
+        video_key = self.video_key(record)
+        stream_url = _record_stream_url(record)
+        if not video_key or not stream_url: return
+        now = time.time()
+        expires_at = stream_expiry(stream_url)
+        expires_at = (expires_at - STREAM_EXPIRY_MARGIN_SECONDS) if expires_at else now + DEFAULT_STREAM_TTL_SECONDS
+        if expires_at <= now: return
+        self.streams.put(video_key, record, expires_at, estimate_size(record))
+        self.queries.put(self.key_for(query, ydl_opts), video_key, now + QUERY_TTL_SECONDS)
+        if record.get('webpage_url') and record['webpage_url'] != query:  # a later play-by-URL of the same video hits too
+            self.queries.put(self.key_for(record['webpage_url'], ydl_opts), video_key, now + QUERY_TTL_SECONDS)
+
+    def stats(self) -> dict:
+        return {'query': self.queries.stats(), 'stream': self.streams.stats()}
@@ -0,0 +1,108 @@
+# jukebox/expiry.py
+# One heap of "delete this message at time T" entries for the whole bot, replacing a
+# sleeping task per send(..., delete_after=N). Entries are mirrored to SQLite in
+# batched writes so deletions still pending at shutdown happen after a restart.
+import asyncio
+import heapq
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+_SCHEMA = """CREATE TABLE IF NOT EXISTS message_expiry (
+    message_id INTEGER PRIMARY KEY,
+    channel_id INTEGER NOT NULL,
+    expires_at REAL NOT NULL
+)"""
+
+
+def _connect(db_path: str):
+    conn = sqlite3.connect(db_path, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL"); conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+class MessageExpiryQueue:
+    def __init__(self, db_path: str, flush_delay: float = 2.0):
+        self.db_path = db_path; self.flush_delay = flush_delay
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self._conn = _connect(db_path)  # used only from the writer thread after loading
+        with self._conn: self._conn.execute(_SCHEMA)
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="expiry-db")
+        self._heap = []  # (expires_at, message_id, channel_id); stale entries are skipped lazily
+        self._entries = {}  # message_id -> (expires_at, channel_id), the live schedule
+        self._dirty = {}  # message_id -> (channel_id, expires_at) to upsert, or None to delete
+        self._flush_handle = None
+        self.scheduled = 0; self.expired = 0; self.cancelled = 0; self.flushes = 0; self.flush_errors = 0
+        rows = self._conn.execute("SELECT message_id, channel_id, expires_at FROM message_expiry").fetchall()
+        for message_id, channel_id, expires_at in rows: self._entries[message_id] = (expires_at, channel_id); self._heap.append((expires_at, message_id, channel_id))
+        heapq.heapify(self._heap); self.restored = len(rows)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def add(self, channel_id: int, message_id: int, expires_at: float) -> bool:
+        """Schedule a deletion; True when it became the earliest one (the waiter should wake up)."""
+        self._entries[message_id] = (expires_at, channel_id); heapq.heappush(self._heap, (expires_at, message_id, channel_id))
+        self.scheduled += 1; self._mark(message_id, (channel_id, expires_at))
+        return self._heap[0][1] == message_id
+
+    def cancel(self, message_id: int):
+        if self._entries.pop(message_id, None) is not None: self.cancelled += 1; self._mark(message_id, None)
+
+    def next_due(self):
+        while self._heap and self._entries.get(self._heap[0][1], (None,))[0] != self._heap[0][0]: heapq.heappop(self._heap)  # drop stale heads
+        return self._heap[0][0] if self._heap else None
+
+    def pop_due(self, now: float) -> list:
+        due = []
+        while (next_due := self.next_due()) is not None and next_due <= now:
+            _, message_id, channel_id = heapq.heappop(self._heap); del self._entries[message_id]
+            due.append((channel_id, message_id)); self._mark(message_id, None)
+        self.expired += len(due)
+        return due
+
+    def _mark(self, message_id: int, value):
+        self._dirty[message_id] = value
+        if self._flush_handle is None: self._flush_handle = asyncio.get_running_loop().call_later(self.flush_delay, self._start_flush)
+
+    def _start_flush(self):
+        self._flush_handle = None; asyncio.get_running_loop().create_task(self.flush())
+
+    def _write_batch(self, batch: list):
+        with self._conn:  # one transaction per batch
+            self._conn.executemany("DELETE FROM message_expiry WHERE message_id = ?", [(mid,) for mid, value in batch if value is None])
+            self._conn.executemany("INSERT OR REPLACE INTO message_expiry (message_id, channel_id, expires_at) VALUES (?, ?, ?)",
+                                   [(mid, value[0], value[1]) for mid, value in batch if value is not None])
+        self.flushes += 1
+
+    async def flush(self):
+        if not self._dirty: return
+        batch = list(self._dirty.items()); self._dirty.clear()
+        try: await asyncio.get_running_loop().run_in_executor(self._executor, self._write_batch, batch)
+        except Exception as e:
+            self.flush_errors += 1; print(f"[EXPIRY] Failed to write {len(batch)} change(s) to '{self.db_path}': {e}")
+            for message_id, value in batch:
+                if message_id not in self._dirty: self._mark(message_id, value)  # retry later unless superseded
+
+    def close(self):
+        if self._flush_handle: self._flush_handle.cancel(); self._flush_handle = None
+        batch = list(self._dirty.items()); self._dirty.clear()
+        try:
+            if batch: self._executor.submit(self._write_batch, batch).result(timeout=10)
+        except Exception as e: print(f"[EXPIRY] Failed to write {len(batch)} change(s) on close: {e}")
+        self._executor.shutdown(wait=True); self._conn.close()
+
+    def stats(self) -> dict:
+        next_due = self.next_due()
+        return {'outstanding': len(self._entries), 'scheduled': self.scheduled, 'expired': self.expired, 'cancelled': self.cancelled,
+                'restored_on_start': self.restored, 'next_due_in_s': round(max(0.0, next_due - time.time()), 1) if next_due else None,
+                'pending_writes': len(self._dirty), 'flushes': self.flushes, 'flush_errors': self.flush_errors}
+
+
+async def send_temporary(bot, destination, content=None, *, delete_after=None, **kwargs):
+    """destination.send(...) whose message is deleted after `delete_after` seconds by the shared expiry queue."""
+    janitor = bot.get_cog("MessageJanitorCog")
+    if janitor is None or delete_after is None: return await destination.send(content, delete_after=delete_after, **kwargs)
+    message = await destination.send(content, **kwargs); janitor.expire_later(message, delete_after)
+    return message
@@ -0,0 +1,243 @@
+# jukebox/extractor.py
+# Dedicated yt-dlp extraction executor. Each worker thread keeps one long-lived
+# YoutubeDL per options profile, so the extractor registry / option parsing cost
+# is paid once per thread instead of once per lookup, and extraction bursts
+# don't queue behind (or in front of) discord.py's use of the default executor.
+#
+# ProcessExtractionPool is the optional out-of-process variant: extraction runs in
+# separate worker processes (no GIL contention with the gateway heartbeat or the
+# voice send thread) and only the compact record travels back over a Pipe.
+import asyncio
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import yt_dlp
+
+from jukebox.cache import compact_info
+
+
+_MISSING = object()
+
+
+def _extract_with(ydl, query: str, overrides: dict = None):
+    # per-call options (e.g. playlist_items for one page) are applied to the warm
+    # instance for this call only; instances are never shared between threads
+    if not overrides: return compact_info(ydl.extract_info(query, download=False))
+    saved = {key: ydl.params.get(key, _MISSING) for key in overrides}
+    ydl.params.update(overrides)
+    try: return compact_info(ydl.extract_info(query, download=False))
+    finally:
+        for key, value in saved.items():
+            if value is _MISSING: ydl.params.pop(key, None)
+            else: ydl.params[key] = value
+
+
+class ExtractionPool:
+    def __init__(self, profiles: dict, max_workers: int = 4):
+        self.profiles = profiles; self.max_workers = max_workers
+        self._profile_names = {id(opts): name for name, opts in profiles.items()}
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ytdl-extract")
+        self._local = threading.local(); self._lock = threading.Lock()
+        self.queued = 0; self.active = 0; self.completed = 0; self.failed = 0
+        self.instances_created = 0; self.total_wait_seconds = 0.0; self.total_run_seconds = 0.0
+
+    def profile_name(self, ydl_opts: dict):
+        return self._profile_names.get(id(ydl_opts))
+
+    @property
+    def queue_depth(self) -> int:
+        return self.queued
+
+    def _get_ydl(self, profile_name: str):
+        instances = getattr(self._local, 'instances', None)
+        if instances is None: instances = self._local.instances = {}
+        ydl = instances.get(profile_name)
+        if ydl is None:
+            ydl = instances[profile_name] = yt_dlp.YoutubeDL(dict(self.profiles[profile_name]))
+            with self._lock: self.instances_created += 1
+        return ydl
+
+    def _run(self, query: str, ydl_opts: dict, submitted_at: float, overrides: dict = None):
+        started_at = time.perf_counter()
+        with self._lock: self.queued -= 1; self.active += 1; self.total_wait_seconds += started_at - submitted_at
+        ok = False
+        try:
+            profile_name = self.profile_name(ydl_opts)
+            ydl = self._get_ydl(profile_name) if profile_name else yt_dlp.YoutubeDL(dict(ydl_opts))  # unknown options: one-off instance
+            data = _extract_with(ydl, query, overrides); ok = True
+            return data
+        finally:
+            with self._lock:
+                self.active -= 1; self.total_run_seconds += time.perf_counter() - started_at
+                if ok: self.completed += 1
+                else: self.failed += 1
+
+    async def extract(self, query: str, ydl_opts: dict, overrides: dict = None):
+        loop = asyncio.get_running_loop()
+        with self._lock: self.queued += 1
+        return await loop.run_in_executor(self._executor, self._run, query, ydl_opts, time.perf_counter(), overrides)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> dict:
+        finished = self.completed + self.failed
+        return {'mode': 'thread', 'workers': self.max_workers, 'queue_depth': self.queued, 'active': self.active,
+                'completed': self.completed, 'failed': self.failed, 'ydl_instances': self.instances_created,
+                'avg_wait_ms': round(self.total_wait_seconds * 1000 / finished, 1) if finished else 0.0,
+                'avg_run_ms': round(self.total_run_seconds * 1000 / finished, 1) if finished else 0.0}
+
+
+class ExtractionTimeout(Exception):
+    pass
+
+
+def _worker_main(conn, profiles: dict):
+    # Runs inside the worker process: one job at a time, one YoutubeDL per profile.
+    instances = {}
+    while True:
+        try: job = conn.recv()
+        except (EOFError, OSError): break
+        if job is None: break
+        profile_name, ydl_opts, query, overrides = job
+        try:
+            if profile_name:
+                ydl = instances.get(profile_name)
+                if ydl is None: ydl = instances[profile_name] = yt_dlp.YoutubeDL(dict(profiles[profile_name]))
+            else: ydl = yt_dlp.YoutubeDL(dict(ydl_opts))
+            result = (True, _extract_with(ydl, query, overrides))
+        except Exception as e:
+            # exceptions from yt-dlp carry tracebacks that don't pickle; send type name + message instead
+            result = (False, (type(e).__name__, str(e)))
+        try: conn.send(result)
+        except (EOFError, OSError): break
+    conn.close()
+
+
+def _rebuild_error(error_info):
+    type_name, message = error_info
+    if type_name == 'DownloadError': return yt_dlp.utils.DownloadError(message)
+    return RuntimeError(f"{type_name}: {message}")
+
+
+class _ExtractionWorker:
+    __slots__ = ('process', 'conn', 'jobs_done')
+
+    def __init__(self, process, conn):
+        self.process = process; self.conn = conn; self.jobs_done = 0
+
+
+class ProcessExtractionPool:
+    def __init__(self, profiles: dict, max_workers: int = 2, job_timeout: float = 60.0, max_jobs_per_worker: int = 200):
+        self.profiles = profiles; self.max_workers = max_workers
+        self.job_timeout = job_timeout; self.max_jobs_per_worker = max_jobs_per_worker
+        self._profile_names = {id(opts): name for name, opts in profiles.items()}
+        self._mp = multiprocessing.get_context("spawn")  # fork + threads (discord.py, voice) is not safe
+        self._io_executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ytdl-ipc")
+        self._idle = None; self._workers = set(); self._starting = 0; self._closed = False
+        self.queued = 0; self.active = 0; self.completed = 0; self.failed = 0
+        self.timeouts = 0; self.cancelled = 0; self.recycled = 0; self.spawned = 0; self.total_run_seconds = 0.0
+
+    def profile_name(self, ydl_opts: dict):
+        return self._profile_names.get(id(ydl_opts))
+
+    @property
+    def queue_depth(self) -> int:
+        return self.queued
+
+    def _start_process(self) -> _ExtractionWorker:
+        # blocking: a spawn-context child boots a fresh interpreter (tens to hundreds of ms)
+        parent_conn, child_conn = self._mp.Pipe()
+        process = self._mp.Process(target=_worker_main, args=(child_conn, self.profiles), name="ytdl-worker", daemon=True)
+        process.start(); child_conn.close()
+        return _ExtractionWorker(process, parent_conn)
+
+    async def _spawn(self, reserved: bool = False) -> _ExtractionWorker:
+        # counted in _starting before the first await so concurrent _acquire calls can't overshoot max_workers
+        if not reserved: self._starting += 1
+        try: worker = await asyncio.get_running_loop().run_in_executor(None, self._start_process)
+        finally: self._starting -= 1
+        if self._closed: self._kill(worker); raise RuntimeError("Extraction pool is shut down")
+        self._workers.add(worker); self.spawned += 1
+        return worker
+
+    def _replace(self):
+        # replacement for a killed/retired worker, started off the event loop and handed to the next waiter
+        self._starting += 1
+        async def _spawn_idle():
+            try: self._idle.put_nowait(await self._spawn(reserved=True))
+            except Exception as e: print(f"[YTDL_POOL] Could not start a replacement worker: {e}")
+        asyncio.get_running_loop().create_task(_spawn_idle())
+
+    def _kill(self, worker: _ExtractionWorker):
+        # terminating the process also unblocks the IPC thread waiting in conn.recv()
+        self._workers.discard(worker)
+        try: worker.process.terminate()
+        except Exception: pass
+        try: worker.conn.close()
+        except Exception: pass
+
+    def _retire(self, worker: _ExtractionWorker):
+        self._workers.discard(worker)
+        try: worker.conn.send(None); worker.conn.close()
+        except Exception: pass
+        def _reap(process=worker.process):
+            process.join(5)
+            if process.is_alive(): process.terminate()
+        self._io_executor.submit(_reap)
+
+    async def _acquire(self) -> _ExtractionWorker:
+        if self._idle is None: self._idle = asyncio.Queue()
+        if self._idle.empty() and len(self._workers) + self._starting < self.max_workers: return await self._spawn()
+        return await self._idle.get()
+
+    def _release(self, worker: _ExtractionWorker, healthy: bool):
+        if self._closed: self._kill(worker); return
+        if not healthy: self._kill(worker); self._replace()
+        elif worker.jobs_done >= self.max_jobs_per_worker: self._retire(worker); self.recycled += 1; self._replace()
+        else: self._idle.put_nowait(worker)
+
+    async def extract(self, query: str, ydl_opts: dict, overrides: dict = None):
+        if self._closed: raise RuntimeError("Extraction pool is shut down")
+        loop = asyncio.get_running_loop(); profile_name = self.profile_name(ydl_opts)
+        self.queued += 1
+        try: worker = await self._acquire()
+        finally: self.queued -= 1
+        self.active += 1; started_at = time.perf_counter(); healthy = False
+        try:
+            worker.conn.send((profile_name, None if profile_name else ydl_opts, query, overrides))
+            ok, payload = await asyncio.wait_for(loop.run_in_executor(self._io_executor, worker.conn.recv), self.job_timeout)
+            healthy = True; worker.jobs_done += 1
+        except asyncio.TimeoutError:
+            self.timeouts += 1; self.failed += 1
+            raise ExtractionTimeout(f"Extraction of '{query}' timed out after {self.job_timeout:.0f}s")
+        except asyncio.CancelledError:
+            self.cancelled += 1; raise
+        except (EOFError, OSError) as e:
+            self.failed += 1; raise RuntimeError(f"Extraction worker died while processing '{query}': {e}")
+        finally:
+            self.active -= 1; self.total_run_seconds += time.perf_counter() - started_at
+            self._release(worker, healthy)
+        if not ok: self.failed += 1; raise _rebuild_error(payload)
+        self.completed += 1
+        return payload
+
+    def shutdown(self):
+        self._closed = True
+        for worker in list(self._workers): self._kill(worker)
+        self._io_executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> dict:
+        finished = self.completed + self.failed
+        return {'mode': 'process', 'workers': f"{len(self._workers)}/{self.max_workers}", 'starting': self._starting, 'queue_depth': self.queued,
+                'active': self.active, 'completed': self.completed, 'failed': self.failed, 'timeouts': self.timeouts,
+                'cancelled': self.cancelled, 'recycled': self.recycled, 'spawned': self.spawned,
+                'avg_run_ms': round(self.total_run_seconds * 1000 / finished, 1) if finished else 0.0}
+
+
+def create_extraction_pool(profiles: dict, mode: str = "thread", max_workers: int = 4, job_timeout: float = 60.0, max_jobs_per_worker: int = 200):
+    if mode == "process":
+        return ProcessExtractionPool(profiles, max_workers=max_workers, job_timeout=job_timeout, max_jobs_per_worker=max_jobs_per_worker)
+    return ExtractionPool(profiles, max_workers=max_workers)
@@ -0,0 +1,40 @@
+# jukebox/formats.py
+# Picks the stream to play from yt-dlp's `formats` list. Every resolution path
+# scores formats the same way instead of taking the first one with audio, which
+# was often a high-bitrate or video-muxed stream that costs bandwidth and forces
+# a transcode.
+
+TARGET_SAMPLE_RATE = 48000  # Discord voice is 48 kHz; anything else is resampled
+DEFAULT_TARGET_KBPS = 64  # default bitrate of a Discord voice channel
+
+_CODEC_SCORES = (('opus', 40), ('vorbis', 15), ('mp4a', 10), ('aac', 10))  # Opus can be passed through as-is
+
+
+def _kbps(fmt: dict):
+    value = fmt.get('abr') or fmt.get('tbr')
+    try: return float(value) if value else None
+    except (TypeError, ValueError): return None
+
+
+def score_format(fmt: dict, target_kbps: float = DEFAULT_TARGET_KBPS):
+    """Score one yt-dlp format for voice playback; None if it has no playable audio."""
+    acodec = (fmt.get('acodec') or '').lower()
+    if not fmt.get('url') or acodec in ('', 'none'): return None
+    score = next((points for prefix, points in _CODEC_SCORES if acodec.startswith(prefix)), 0)
+    sample_rate = fmt.get('asr')
+    if sample_rate: score += 15 if sample_rate == TARGET_SAMPLE_RATE else 15 - min(15, abs(sample_rate - TARGET_SAMPLE_RATE) / 1000)
+    kbps = _kbps(fmt)
+    if kbps: # ใกล้ bitrate ของช่องเสียงที่สุดดีที่สุด; ต่ำกว่าเป้าหมายเสียคะแนนมากกว่าสูงกว่า (คุณภาพหาย)
+        ratio = kbps / target_kbps if target_kbps else 1.0
+        score += 20 * ratio if ratio < 1 else 20 - min(20, (ratio - 1) * 10)
+    score += 25 if fmt.get('vcodec') in (None, 'none') else -25 # muxed: ดาวน์โหลดวิดีโอทิ้งเปล่าๆ
+    return round(score, 2)
+
+
+def select_format(info: dict, target_kbps: float = DEFAULT_TARGET_KBPS):
+    """-> (format dict, score) of the best-scoring audio format in `info`, or (None, None)."""
+    best = None; best_score = None
+    for fmt in info.get('formats') or ():
+        score = score_format(fmt, target_kbps)
+        if score is not None and (best_score is None or score > best_score): best = fmt; best_score = score
+    return best, best_score
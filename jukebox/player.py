@@ -0,0 +1,78 @@
+# jukebox/player.py
+# Per-guild playback state. One GuildPlayer replaces the parallel dicts MusicCog
+# used to keep (voice client, queue, current song, loop mode, volume, tasks...),
+# so a guild costs one object that is dropped as a whole on disconnect.
+import sys
+
+from jukebox.cache import estimate_size
+from jukebox.queue import SongQueue
+
+
+class LoopMode:
+    NONE = 0; SONG = 1; QUEUE = 2
+    TEXT = {NONE: "ปิด", SONG: "เพลงเดียว", QUEUE: "ทั้งคิว"}
+
+
+DEFAULT_VOLUME = 0.7
+
+
+class GuildPlayer:
+    __slots__ = ('guild_id', 'voice_client', 'queue', 'current_song', 'loop_mode', 'volume', 'before_mute_volume', 'muted',
+                 'auto_leave_task', 'lookahead_task', 'prefetch_task', 'primed', 'starting_playback', 'position_source',
+                 'playlist_feeds', 'playlist_feed_task', 'source_switch_task', 'replay', 'resume_at', 'resume_attempts')
+
+    def __init__(self, guild_id: int):
+        self.guild_id = guild_id; self.voice_client = None; self.queue = SongQueue(); self.current_song = None
+        self.loop_mode = LoopMode.NONE; self.volume = DEFAULT_VOLUME; self.before_mute_volume = None; self.muted = False
+        self.auto_leave_task = None; self.lookahead_task = None; self.prefetch_task = None
+        self.primed = None  # (song_info, PrimedAudioSource) for the track that plays next
+        self.starting_playback = False  # _play_next is waiting for the head of the queue to resolve
+        self.position_source = None  # FrameCountingSource of current_song (playback position for ETA, seek, resume)
+        self.playlist_feeds = []  # playlists whose later pages are still to be fetched, oldest first
+        self.playlist_feed_task = None
+        self.source_switch_task = None  # reopening the current track in the other playback mode (passthrough <-> PCM)
+        self.replay = None  # FrameRecording of the current track, replayed instead of re-streamed by LoopMode.SONG
+        self.resume_at = None  # position to restart current_song at after its stream dropped mid-track
+        self.resume_attempts = 0  # resumes of current_song so far (capped so a broken stream can't loop forever)
+
+    @property
+    def applied_volume(self) -> float:
+        return 0.0 if self.muted else self.volume
+
+    def cancel_auto_leave(self):
+        if self.auto_leave_task and not self.auto_leave_task.done(): self.auto_leave_task.cancel()
+        self.auto_leave_task = None
+
+    def cancel_lookahead(self):
+        if self.lookahead_task and not self.lookahead_task.done(): self.lookahead_task.cancel()
+        self.lookahead_task = None
+
+    def drop_playlist_feeds(self):
+        if self.playlist_feed_task and not self.playlist_feed_task.done(): self.playlist_feed_task.cancel()
+        self.playlist_feed_task = None; self.playlist_feeds.clear()
+
+    def discard_primed(self) -> bool:
+        if not self.primed: return False
+        self.primed[1].cleanup(); self.primed = None
+        return True
+
+    def release(self):
+        # ปล่อยทุกอย่างที่ player ถืออยู่ (task, FFmpeg ที่เตรียมไว้, คิว) ตอนบอทออกจากช่องเสียง
+        self.cancel_auto_leave(); self.cancel_lookahead(); self.drop_playlist_feeds()
+        if self.prefetch_task and not self.prefetch_task.done(): self.prefetch_task.cancel()
+        self.prefetch_task = None; self.discard_primed()
+        if self.source_switch_task and not self.source_switch_task.done(): self.source_switch_task.cancel()
+        self.source_switch_task = None; self.discard_replay()
+        self.queue.clear(); self.current_song = None; self.position_source = None; self.resume_at = None; self.voice_client = None
+
+    def discard_replay(self) -> bool:
+        if self.replay is None: return False
+        self.replay.discard(); self.replay = None
+        return True
+
+    def memory_footprint(self) -> int:
+        """Approximate bytes held by this player: the object, its queue and the song dicts in it."""
+        size = sys.getsizeof(self) + sys.getsizeof(self.queue)
+        size += sum(estimate_size(song) for song in self.queue)
+        if self.current_song: size += estimate_size(self.current_song)
+        return size
@@ -0,0 +1,199 @@
+# jukebox/queue.py
+# Guild song queue backed by an implicit treap (balanced tree keyed by position).
+# Every node carries its subtree size and total duration, so indexing, remove,
+# move and "how long until track N" are O(log n) instead of list shifts and
+# linear sums, and a shuffle is one O(n) rebuild.
+import itertools
+import random
+
+_versions = itertools.count(1)  # shared so a version stamp never repeats across queues
+
+
+class _Node:
+    __slots__ = ('song', 'duration', 'priority', 'left', 'right', 'size', 'total')
+
+    def __init__(self, song: dict):
+        self.song = song; self.duration = _duration_of(song); self.priority = random.random()
+        self.left = None; self.right = None; self.size = 1; self.total = self.duration
+
+
+def _duration_of(song: dict) -> int:
+    try: return max(0, int(song.get('duration') or 0))
+    except (TypeError, ValueError): return 0
+
+
+def _size(node) -> int:
+    return node.size if node else 0
+
+
+def _total(node) -> int:
+    return node.total if node else 0
+
+
+def _update(node):
+    node.size = 1 + _size(node.left) + _size(node.right)
+    node.total = node.duration + _total(node.left) + _total(node.right)
+
+
+def _merge(left, right):
+    if not left: return right
+    if not right: return left
+    if left.priority > right.priority:
+        left.right = _merge(left.right, right); _update(left)
+        return left
+    right.left = _merge(left, right.left); _update(right)
+    return right
+
+
+def _split(node, count: int):
+    # -> (first `count` nodes, the rest)
+    if not node: return None, None
+    if _size(node.left) >= count:
+        first, node.left = _split(node.left, count); _update(node)
+        return first, node
+    node.right, rest = _split(node.right, count - _size(node.left) - 1); _update(node)
+    return node, rest
+
+
+def _build(songs: list):
+    # O(n) build from an ordered list (Cartesian tree over random priorities)
+    stack = []
+    for song in songs:
+        node = _Node(song); last = None
+        while stack and stack[-1].priority < node.priority: last = stack.pop(); _update(last)
+        node.left = last
+        if stack: stack[-1].right = node
+        stack.append(node)
+    for node in reversed(stack): _update(node)
+    return stack[0] if stack else None
+
+
+class SongQueue:
+    """List-like song queue with O(log n) indexed operations and duration prefix sums."""
+
+    def __init__(self, songs=()):
+        self._root = _build(list(songs)); self.version = next(_versions)
+
+    def _changed(self):
+        self.version = next(_versions)
+
+    def __len__(self) -> int:
+        return _size(self._root)
+
+    def __bool__(self) -> bool:
+        return self._root is not None
+
+    def __iter__(self):
+        return self._iter_from(0)
+
+    def _iter_from(self, start: int):
+        stack = []; node = self._root
+        while node: # ลงไปหาโหนดที่ตำแหน่ง start โดยเก็บเส้นทางไว้สำหรับ in-order ต่อ
+            left_size = _size(node.left)
+            if start < left_size: stack.append(node); node = node.left
+            elif start == left_size: stack.append(node); break
+            else: start -= left_size + 1; node = node.right
+        while stack:
+            node = stack.pop(); yield node.song
+            node = node.right
+            while node: stack.append(node); node = node.left
+
+    def _normalize(self, index: int) -> int:
+        length = len(self)
+        if index < 0: index += length
+        if not 0 <= index < length: raise IndexError("queue index out of range")
+        return index
+
+    def _node_at(self, index: int):
+        node = self._root
+        while node:
+            left_size = _size(node.left)
+            if index < left_size: node = node.left
+            elif index == left_size: return node
+            else: index -= left_size + 1; node = node.right
+        raise IndexError("queue index out of range")
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1 or start >= stop: return list(self)[index]
+            return list(itertools.islice(self._iter_from(start), stop - start))
+        return self._node_at(self._normalize(index)).song
+
+    def __delitem__(self, index: int):
+        self.pop(index)
+
+    def append(self, song: dict):
+        self._root = _merge(self._root, _Node(song)); self._changed()
+
+    def appendleft(self, song: dict):
+        self._root = _merge(_Node(song), self._root); self._changed()
+
+    def extend(self, songs):
+        songs = list(songs)
+        if songs: self._root = _merge(self._root, _build(songs)); self._changed()
+
+    def insert(self, index: int, song: dict):
+        index = max(0, min(len(self), index + len(self) if index < 0 else index))
+        first, rest = _split(self._root, index)
+        self._root = _merge(_merge(first, _Node(song)), rest); self._changed()
+
+    def pop(self, index: int = -1) -> dict:
+        index = self._normalize(index)
+        first, rest = _split(self._root, index); node, rest = _split(rest, 1)
+        self._root = _merge(first, rest); self._changed()
+        return node.song
+
+    def popleft(self) -> dict:
+        return self.pop(0)
+
+    def move(self, src: int, dst: int) -> dict:
+        song = self.pop(src); self.insert(dst, song)
+        return song
+
+    def remove(self, song: dict, limit: int = None) -> bool:
+        # หาด้วย identity (dict ของเพลงเดียวกัน) ในช่วง limit ตัวแรก; ใช้กับช่วงหัวคิว
+        for idx, queued in enumerate(itertools.islice(self, limit)):
+            if queued is song: self.pop(idx); return True
+        return False
+
+    def index_where(self, predicate, start: int = 0):
+        for idx, song in enumerate(self._iter_from(start), start):
+            if predicate(song): return idx
+        return None
+
+    def refresh(self, song: dict, limit: int = None) -> bool:
+        # duration ของเพลงเปลี่ยนหลัง resolve: คำนวณผลรวมตามเส้นทางใหม่
+        for idx, queued in enumerate(itertools.islice(self, limit)):
+            if queued is song:
+                first, rest = _split(self._root, idx); node, rest = _split(rest, 1)
+                node.duration = _duration_of(song); _update(node)
+                self._root = _merge(_merge(first, node), rest); self._changed()
+                return True
+        return False
+
+    def shuffle(self, start: int = 0):
+        first, rest = _split(self._root, start)
+        songs = list(SongQueue._from_root(rest)); random.shuffle(songs)
+        self._root = _merge(first, _build(songs)); self._changed()
+
+    @staticmethod
+    def _from_root(root):
+        queue = SongQueue(); queue._root = root
+        return queue
+
+    def clear(self):
+        self._root = None; self._changed()
+
+    def duration_before(self, index: int) -> int:
+        """Total seconds of the songs ahead of position `index`."""
+        index = max(0, min(len(self), index)); node = self._root; total = 0
+        while node and index:
+            left_size = _size(node.left)
+            if index <= left_size: node = node.left
+            else: total += _total(node.left) + node.duration; index -= left_size + 1; node = node.right
+        return total
+
+    @property
+    def total_duration(self) -> int:
+        return _total(self._root)
@@ -0,0 +1,35 @@
+# jukebox/queue_pages.py
+# Shared renderer for queue listings (s!queue and the panel's ephemeral queue view).
+# Only the requested page slice is formatted, and rendered pages are cached under
+# the queue's version stamp, so paging through a huge queue formats 10 lines per
+# click and repeat views of an unchanged queue format nothing at all.
+from collections import OrderedDict
+
+
+def format_queue_line(position: int, song: dict, max_title: int = 50) -> str:
+    title = song.get('title') or 'N/A'
+    if len(title) > max_title: title = title[:max_title - 3] + "..."
+    webpage_url = song.get('webpage_url')
+    return f"`{position}.` [{title}]({webpage_url})" if webpage_url and webpage_url != '#' else f"`{position}.` {title}"
+
+
+class QueuePageRenderer:
+    def __init__(self, max_pages: int = 256):
+        self.max_pages = max_pages; self._pages = OrderedDict()  # (version, page_index, page_size) -> [lines]
+        self.hits = 0; self.misses = 0
+
+    def page(self, queue, page_index: int, page_size: int) -> list:
+        if not queue: return []
+        key = (queue.version, page_index, page_size)
+        lines = self._pages.get(key)
+        if lines is not None: self._pages.move_to_end(key); self.hits += 1; return lines
+        self.misses += 1; start = page_index * page_size
+        lines = [format_queue_line(start + i + 1, song) for i, song in enumerate(queue[start:start + page_size])]
+        self._pages[key] = lines
+        while len(self._pages) > self.max_pages: self._pages.popitem(last=False)  # pages of old versions age out
+        return lines
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {'cached_pages': len(self._pages), 'hits': self.hits, 'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0}
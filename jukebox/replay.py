@@ -0,0 +1,123 @@
+# jukebox/replay.py
+# Records the Opus packets of a track while it plays so LoopMode.SONG can play it
+# again from memory: no new FFmpeg process, no second download. Memory is capped
+# per guild and for the whole bot; a recording that doesn't fit moves to a
+# temporary file and keeps going from there.
+import struct
+import tempfile
+import threading
+from array import array
+
+import discord
+
+from jukebox.audio import FRAME_SECONDS
+
+_LENGTH = struct.Struct('<H')  # an Opus packet is at most 1275 bytes
+
+
+class ReplayBudget:
+    """Byte accounting shared by every guild's recording (called from audio threads)."""
+
+    def __init__(self, guild_cap: int, total_cap: int):
+        self.guild_cap = guild_cap; self.total_cap = total_cap
+        self.used = 0; self._by_guild = {}; self._lock = threading.Lock()
+
+    def try_reserve(self, guild_id: int, size: int) -> bool:
+        with self._lock:
+            guild_used = self._by_guild.get(guild_id, 0)
+            if guild_used + size > self.guild_cap or self.used + size > self.total_cap: return False
+            self._by_guild[guild_id] = guild_used + size; self.used += size
+            return True
+
+    def release(self, guild_id: int, size: int):
+        if not size: return
+        with self._lock:
+            remaining = self._by_guild.get(guild_id, 0) - size; self.used -= size
+            if remaining > 0: self._by_guild[guild_id] = remaining
+            else: self._by_guild.pop(guild_id, None)
+
+    def largest_guild(self) -> int:
+        with self._lock: return max(self._by_guild.values(), default=0)
+
+
+class FrameRecording:
+    def __init__(self, song: dict, guild_id: int, budget: ReplayBudget):
+        self.song = song; self.guild_id = guild_id; self.budget = budget
+        duration = song.get('duration') or 0
+        self.expected_frames = int(duration / FRAME_SECONDS) if duration else 0
+        self.frames = []; self.memory_bytes = 0; self.frame_count = 0
+        self.complete = False; self.spilled = False
+        self._file = None; self._offsets = None; self._lock = threading.Lock()
+
+    def add(self, packet: bytes):
+        with self._lock:
+            if self.complete: return
+            if self._file is None and self.budget.try_reserve(self.guild_id, len(packet)): self.frames.append(packet); self.memory_bytes += len(packet)
+            else:
+                if self._file is None: self._spill()
+                self._write(packet)
+            self.frame_count += 1
+
+    def _spill(self):
+        # เกิน cap: ย้ายเฟรมที่มีอยู่ลงไฟล์ชั่วคราว (ลบเองเมื่อปิด) แล้วบันทึกต่อในไฟล์
+        self._file = tempfile.TemporaryFile(prefix="jukebox-replay-"); self._offsets = array('Q'); self.spilled = True
+        for packet in self.frames: self._write(packet)
+        self.budget.release(self.guild_id, self.memory_bytes); self.frames = []; self.memory_bytes = 0
+
+    def _write(self, packet: bytes):
+        self._file.seek(0, 2); self._offsets.append(self._file.tell()); self._file.write(_LENGTH.pack(len(packet)) + packet)
+
+    def finish(self):
+        """The source hit end of stream; a recording cut short (stream error) is not replayable."""
+        with self._lock:
+            if self.complete: return
+            self.complete = self.frame_count > 0 and (not self.expected_frames or self.frame_count >= self.expected_frames - int(2 / FRAME_SECONDS))
+
+    def frame(self, index: int) -> bytes:
+        with self._lock:
+            if index >= self.frame_count: return b''  # discarded meanwhile
+            if self._file is None: return self.frames[index]
+            self._file.seek(self._offsets[index]); (length,) = _LENGTH.unpack(self._file.read(_LENGTH.size))
+            return self._file.read(length)
+
+    def discard(self):
+        with self._lock:
+            self.budget.release(self.guild_id, self.memory_bytes); self.frames = []; self.memory_bytes = 0
+            if self._file is not None: self._file.close(); self._file = None
+            self.complete = False; self.frame_count = 0
+
+
+class RecordingSource(discord.AudioSource):
+    """Passes frames through unchanged and records them as Opus (encoding PCM with `encoder`)."""
+
+    def __init__(self, source: discord.AudioSource, recording: FrameRecording, encoder=None):
+        self.source = source; self.recording = recording; self.encoder = encoder
+
+    def read(self) -> bytes:
+        data = self.source.read()
+        if data: self.recording.add(self.encoder.encode(data, self.encoder.SAMPLES_PER_FRAME) if self.encoder else data)
+        else: self.recording.finish()
+        return data
+
+    def is_opus(self) -> bool:
+        return self.source.is_opus()
+
+    def cleanup(self):
+        self.source.cleanup()
+
+
+class ReplaySource(discord.AudioSource):
+    """Plays a finished recording; Opus packets as-is, or decoded to PCM when the volume has to be applied."""
+
+    def __init__(self, recording: FrameRecording, start_frame: int = 0, decode: bool = False):
+        self.recording = recording; self.index = max(0, start_frame)
+        self.decoder = discord.opus.Decoder() if decode else None
+
+    def read(self) -> bytes:
+        packet = self.recording.frame(self.index)
+        if not packet: return b''
+        self.index += 1
+        return self.decoder.decode(packet) if self.decoder else packet
+
+    def is_opus(self) -> bool:
+        return self.decoder is None
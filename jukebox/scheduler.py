@@ -0,0 +1,80 @@
+# jukebox/scheduler.py
+# Per-guild coalescing scheduler for music panel edits. Any number of update
+# requests inside one interval collapse into a single edit, and the edit always
+# renders the state at the moment it is sent, never a stale snapshot.
+import asyncio
+import time
+import traceback
+
+import discord
+
+
+class PanelUpdateScheduler:
+    def __init__(self, send, min_interval: float = 1.5):
+        self._send = send; self.min_interval = min_interval
+        self._dirty = set(); self._tasks = {}
+        self.requested = 0; self.sent = 0; self.coalesced = 0; self.rate_limited = 0; self.failed = 0
+
+    def request(self, guild_id: int):
+        self.requested += 1
+        task = self._tasks.get(guild_id); running = task is not None and not task.done()
+        if running and guild_id in self._dirty: self.coalesced += 1; return  # an edit is already pending and will pick this up
+        self._dirty.add(guild_id)
+        if not running: self._tasks[guild_id] = asyncio.get_running_loop().create_task(self._run(guild_id))
+
+    async def _run(self, guild_id: int):
+        # the task lives until its guild's next edit is allowed, so the deadline is a local, not a per-guild dict
+        next_allowed = 0.0
+        try:
+            while True:
+                wait = next_allowed - time.monotonic()
+                if wait > 0: await asyncio.sleep(wait)  # requests arriving meanwhile only mark the guild dirty
+                if guild_id not in self._dirty: break
+                self._dirty.discard(guild_id)  # requests from here on need another edit
+                backoff = self.min_interval
+                try: await self._send(guild_id); self.sent += 1
+                except discord.RateLimited as e: backoff = self._on_rate_limited(guild_id, e.retry_after)
+                except discord.HTTPException as e:
+                    if e.status != 429: self.failed += 1; print(f"[PANEL_SCHED {guild_id}] Panel edit failed: {e}")
+                    else: backoff = self._on_rate_limited(guild_id, getattr(e, 'retry_after', None))
+                except Exception as e: self.failed += 1; print(f"[PANEL_SCHED {guild_id}] Panel edit failed: {e}"); traceback.print_exc()
+                next_allowed = time.monotonic() + backoff
+        finally:
+            if self._tasks.get(guild_id) is asyncio.current_task(): del self._tasks[guild_id]
+
+    def _on_rate_limited(self, guild_id: int, retry_after) -> float:
+        self.rate_limited += 1; self._dirty.add(guild_id)  # retry with whatever the state is by then
+        backoff = max(self.min_interval, float(retry_after or 0) or self.min_interval * 2)
+        print(f"[PANEL_SCHED {guild_id}] Rate limited, retrying in {backoff:.1f}s")
+        return backoff
+
+    def forget(self, guild_id: int):
+        task = self._tasks.pop(guild_id, None)
+        if task and not task.done(): task.cancel()
+        self._dirty.discard(guild_id)
+
+    def shutdown(self):
+        for guild_id in list(self._tasks): self.forget(guild_id)
+
+    def stats(self) -> dict:
+        return {'min_interval': self.min_interval, 'requested': self.requested, 'sent': self.sent, 'coalesced': self.coalesced,
+                'rate_limited': self.rate_limited, 'failed': self.failed, 'pending': len(self._dirty), 'active_guilds': len(self._tasks)}
+
+
+class RequestPacer:
+    """Spaces out request starts to at most `rate` per second; a 429 pushes every later start back."""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next_start = 0.0; self._lock = asyncio.Lock()
+        self.waited = 0.0; self.rate_limited = 0
+
+    async def wait(self):
+        async with self._lock:  # one slot at a time so bursts can't jump the queue
+            delay = self._next_start - time.monotonic()
+            if delay > 0: self.waited += delay; await asyncio.sleep(delay)
+            self._next_start = max(time.monotonic(), self._next_start) + self.interval
+
+    def penalize(self, retry_after):
+        self.rate_limited += 1
+        self._next_start = max(self._next_start, time.monotonic() + float(retry_after or 1.0))
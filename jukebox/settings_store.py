@@ -0,0 +1,178 @@
+# jukebox/settings_store.py
+# Per-guild settings in SQLite (WAL). Guilds are loaded on first use, changes are
+# applied to memory immediately and written as one batched transaction on a
+# dedicated thread shortly after. Reads run on that same thread, so the event loop
+# never waits on disk and a crash can only lose the last unflushed batch, never
+# the whole file.
+import asyncio
+import contextlib
+import json
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+_DELETED = object()
+
+_SCHEMA = """CREATE TABLE IF NOT EXISTS guild_settings (
+    guild_id INTEGER NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    PRIMARY KEY (guild_id, key)
+)"""
+_META_SCHEMA = "CREATE TABLE IF NOT EXISTS store_meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)"
+_MIGRATED_MARKER = "legacy_json_migrated"
+
+
+def _connect(db_path: str):
+    conn = sqlite3.connect(db_path, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL"); conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+class GuildSettingsStore:
+    def __init__(self, db_path: str, legacy_json_path: str = None, flush_delay: float = 0.5):
+        self.db_path = db_path; self.flush_delay = flush_delay
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self._conn = None  # opened on the db thread; every read and write runs there, in submission order
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="settings-db")
+        self._cache = {}  # guild_id -> {key: value}, loaded guilds only
+        self._overlay = {}  # guild_id -> {key: value | _DELETED} changed while the guild wasn't loaded
+        self._loading = {}  # guild_id -> future of the rows being read
+        self._dirty = {}  # (guild_id, key) -> value | _DELETED; key None = whole guild deleted
+        self._flush_handle = None; self._deferred = 0
+        self.guild_loads = 0; self.flushes = 0; self.rows_written = 0; self.flush_errors = 0; self.total_flush_seconds = 0.0
+        self._executor.submit(self._prepare, legacy_json_path)  # queued ahead of any read
+
+    def _db(self):
+        if self._conn is None: self._conn = _connect(self.db_path)
+        return self._conn
+
+    def _prepare(self, legacy_json_path: str):
+        conn = self._db()
+        with conn: conn.execute(_SCHEMA); conn.execute(_META_SCHEMA)
+        if legacy_json_path:
+            try: self._migrate_json(conn, legacy_json_path)
+            except Exception as e: print(f"[Settings] Migration from '{legacy_json_path}' failed: {e}")
+
+    def _migrate_json(self, conn, json_path: str):
+        # the JSON file may be tracked by git, so it is left in place; a marker row records that it was imported
+        if not os.path.exists(json_path) or conn.execute("SELECT 1 FROM store_meta WHERE key = ?", (_MIGRATED_MARKER,)).fetchone(): return
+        try:
+            with open(json_path, "r", encoding="utf-8") as f: legacy = json.loads(f.read() or "{}")
+        except (OSError, json.JSONDecodeError) as e: print(f"[Settings] Could not read legacy '{json_path}' for migration: {e}"); return
+        rows = [(int(guild_id), key, json.dumps(value)) for guild_id, settings in (legacy if isinstance(legacy, dict) else {}).items()
+                if isinstance(settings, dict) for key, value in settings.items() if value is not None]
+        with conn:  # rows and marker in one transaction
+            conn.executemany("INSERT OR IGNORE INTO guild_settings (guild_id, key, value) VALUES (?, ?, ?)", rows)  # never overwrite newer values
+            conn.execute("INSERT INTO store_meta (key, value) VALUES (?, ?)", (_MIGRATED_MARKER, json.dumps({'source': json_path, 'at': time.time()})))
+        print(f"[Settings] Migrated {len(legacy)} guild(s) ({len(rows)} values) from '{json_path}' to '{self.db_path}'")
+
+    def _read_guild(self, guild_id: int) -> list:
+        return self._db().execute("SELECT key, value FROM guild_settings WHERE guild_id = ?", (guild_id,)).fetchall()
+
+    async def _load(self, guild_id: int) -> dict:
+        settings = self._cache.get(guild_id)
+        if settings is not None: return settings
+        future = self._loading.get(guild_id)
+        if future is None:
+            future = self._loading[guild_id] = asyncio.get_running_loop().run_in_executor(self._executor, self._read_guild, guild_id)
+            future.add_done_callback(lambda f, guild_id=guild_id: self._loaded(guild_id, f))
+        await asyncio.shield(future)
+        return self._cache[guild_id]
+
+    def _loaded(self, guild_id: int, future):
+        self._loading.pop(guild_id, None)
+        if future.cancelled() or future.exception() is not None or guild_id in self._cache: return  # deleted meanwhile: already "loaded"
+        settings = {key: json.loads(value) for key, value in future.result()}
+        for key, value in self._overlay.pop(guild_id, {}).items():  # changes made before/while reading win over the rows read
+            if value is _DELETED: settings.pop(key, None)
+            else: settings[key] = value
+        self._cache[guild_id] = settings; self.guild_loads += 1
+
+    async def get(self, guild_id: int, key: str, default=None):
+        return (await self._load(guild_id)).get(key, default)
+
+    async def guild(self, guild_id: int) -> dict:
+        return dict(await self._load(guild_id))
+
+    def set(self, guild_id: int, key: str, value):
+        settings = self._cache.get(guild_id)
+        if settings is None: settings = self._overlay.setdefault(guild_id, {}); settings[key] = _DELETED if value is None else value  # applied on load
+        elif value is None: settings.pop(key, None)
+        else: settings[key] = value
+        self._mark((guild_id, key), _DELETED if value is None else value)
+
+    def delete_guild(self, guild_id: int):
+        self._cache[guild_id] = {}; self._overlay.pop(guild_id, None)  # stays "loaded" so a read before the flush can't see the old rows
+        for dirty_key in [k for k in self._dirty if k[0] == guild_id]: del self._dirty[dirty_key]
+        self._mark((guild_id, None), _DELETED)
+
+    def _guild_ids_with(self, key: str) -> set:
+        return {row[0] for row in self._db().execute("SELECT guild_id FROM guild_settings WHERE key = ?", (key,))}
+
+    async def guild_ids_with(self, key: str) -> list:
+        stored = await asyncio.get_running_loop().run_in_executor(self._executor, self._guild_ids_with, key)
+        for guild_id, settings in self._cache.items():  # loaded guilds: memory is authoritative (unflushed changes win over disk)
+            if key in settings: stored.add(guild_id)
+            else: stored.discard(guild_id)
+        for guild_id, changes in self._overlay.items():  # not loaded: only the keys that changed are known
+            if key in changes: (stored.discard if changes[key] is _DELETED else stored.add)(guild_id)
+        return sorted(stored)
+
+    @contextlib.contextmanager
+    def deferred(self):
+        """Hold back the automatic flush while many changes are made; the caller awaits flush() once afterwards."""
+        self._deferred += 1
+        try: yield
+        finally:
+            self._deferred -= 1
+            if not self._deferred and self._dirty: self._schedule_flush()  # in case the caller doesn't flush
+
+    def _mark(self, dirty_key, value):
+        self._dirty.pop(dirty_key, None); self._dirty[dirty_key] = value  # re-insert: batch keeps change order
+        if not self._deferred: self._schedule_flush()
+
+    def _schedule_flush(self):
+        if self._flush_handle is None: self._flush_handle = asyncio.get_running_loop().call_later(self.flush_delay, self._start_flush)
+
+    def _start_flush(self):
+        self._flush_handle = None
+        if not self._deferred: asyncio.get_running_loop().create_task(self.flush())  # timer set before deferred(): wait for its flush
+
+    def _write_batch(self, batch: list):
+        conn = self._db(); started_at = time.perf_counter()
+        with conn:  # one transaction per batch
+            for (guild_id, key), value in batch:
+                if key is None: conn.execute("DELETE FROM guild_settings WHERE guild_id = ?", (guild_id,))
+                elif value is _DELETED: conn.execute("DELETE FROM guild_settings WHERE guild_id = ? AND key = ?", (guild_id, key))
+                else: conn.execute("INSERT INTO guild_settings (guild_id, key, value) VALUES (?, ?, ?) ON CONFLICT(guild_id, key) DO UPDATE SET value = excluded.value",
+                                   (guild_id, key, json.dumps(value)))
+        self.flushes += 1; self.rows_written += len(batch); self.total_flush_seconds += time.perf_counter() - started_at
+
+    async def flush(self) -> int:
+        """Write every pending change in one transaction; returns the number of changes written."""
+        if self._flush_handle: self._flush_handle.cancel(); self._flush_handle = None
+        if not self._dirty: return 0
+        batch = list(self._dirty.items()); self._dirty.clear()
+        try: await asyncio.get_running_loop().run_in_executor(self._executor, self._write_batch, batch)
+        except Exception as e:
+            self.flush_errors += 1; print(f"[Settings] Failed to write {len(batch)} change(s) to '{self.db_path}': {e}")
+            for dirty_key, value in batch:
+                if dirty_key not in self._dirty: self._mark(dirty_key, value)  # retry later unless superseded
+            return 0
+        return len(batch)
+
+    def close(self):
+        if self._flush_handle: self._flush_handle.cancel(); self._flush_handle = None
+        batch = list(self._dirty.items()); self._dirty.clear()
+        try:
+            if batch: self._executor.submit(self._write_batch, batch).result(timeout=10)
+        except Exception as e: print(f"[Settings] Failed to write {len(batch)} change(s) on close: {e}")
+        self._executor.shutdown(wait=True)
+        if self._conn: self._conn.close()
+
+    def stats(self) -> dict:
+        return {'loaded_guilds': len(self._cache), 'loading': len(self._loading), 'pending_changes': len(self._dirty), 'guild_loads': self.guild_loads,
+                'flushes': self.flushes, 'rows_written': self.rows_written, 'flush_errors': self.flush_errors,
+                'avg_flush_ms': round(self.total_flush_seconds * 1000 / self.flushes, 2) if self.flushes else 0.0}
@@ -0,0 +1,48 @@
+# jukebox/urls.py
+# Classify a URL from its shape alone so MusicCog can pick the extraction path
+# up front instead of probing every URL as a possible playlist first.
+from urllib.parse import urlparse, parse_qs
+
+SINGLE = "single"; PLAYLIST = "playlist"; MIX = "mix"; UNKNOWN = "unknown"
+
+_YOUTUBE_HOSTS = ('youtube.com', 'www.youtube.com', 'm.youtube.com', 'music.youtube.com')
+_SHORT_HOSTS = ('youtu.be', 'www.youtu.be')
+_MIX_PREFIXES = ('RDMM', 'RDAMVM')  # "My Mix" / YouTube Music radio of the seed video
+_VIDEO_ID_LENGTH = 11
+
+
+def _parse(url: str):
+    if url.startswith('www.'): url = 'https://' + url
+    parsed = urlparse(url)
+    return parsed, (parsed.hostname or '').lower(), parse_qs(parsed.query)
+
+
+def _is_mix(list_id: str, seed_video_id: str) -> bool:
+    # Only radios generated from a seed video are endless mixes. Other RD ids, such as
+    # YouTube Music albums and charts (RDCLAK5uy_..., RDAMPL...), are finite playlists.
+    if not seed_video_id or not list_id.startswith('RD'): return False
+    return list_id.startswith(_MIX_PREFIXES) or len(list_id) == 2 + _VIDEO_ID_LENGTH  # RD + video id
+
+
+def classify_url(url: str) -> str:
+    """Return SINGLE, PLAYLIST, MIX or UNKNOWN for a URL, without any network access."""
+    parsed, host, params = _parse(url)
+    list_id = (params.get('list') or [''])[0]
+    if host in _SHORT_HOSTS:
+        if not list_id: return SINGLE
+        return MIX if _is_mix(list_id, parsed.path.strip('/')) else PLAYLIST
+    if host not in _YOUTUBE_HOSTS: return UNKNOWN
+    path = parsed.path.rstrip('/')
+    if _is_mix(list_id, (params.get('v') or [''])[0]): return MIX  # auto-generated radio/mix, seeded by v=
+    if path == '/playlist': return PLAYLIST if list_id else UNKNOWN
+    if path == '/watch' and params.get('v'): return PLAYLIST if list_id else SINGLE
+    if path.startswith(('/shorts/', '/live/', '/embed/')): return SINGLE
+    return UNKNOWN  # channels, /@handle, search pages... let yt-dlp decide
+
+
+def video_url(url: str):
+    """Plain watch URL of the video a (mix) URL is seeded with, or None."""
+    parsed, host, params = _parse(url)
+    if host in _SHORT_HOSTS: video_id = parsed.path.strip('/')
+    else: video_id = (params.get('v') or [''])[0]
+    return f"https://www.youtube.com/watch?v={video_id}" if video_id else None
@@ -15,6 +15,8 @@ from web_server import flask_app, web_log_handler, console_logs, MAX_LOG_LINES
 load_dotenv()
 TOKEN = os.getenv('DISCORD_TOKEN')
 FLASK_PORT = int(os.getenv("FLASK_PORT", 8080))
+# 429 ที่ต้องรอนานกว่านี้ให้ discord.py โยน RateLimited แทนการหลับรอเงียบๆ (panel scheduler / การกู้ panel จัดการเอง); discord.py ไม่รับค่าต่ำกว่า 30
+MAX_RATELIMIT_TIMEOUT = max(30.0, float(os.getenv("MAX_RATELIMIT_TIMEOUT", 30)))
 
 # --- ตั้งค่า Logging ---
 root_logger = logging.getLogger()
@@ -35,7 +37,7 @@ intents.guilds = True
 intents.voice_states = True
 intents.members = True
 
-bot = commands.Bot(command_prefix="s!", intents=intents, help_command=None)
+bot = commands.Bot(command_prefix="s!", intents=intents, help_command=None, max_ratelimit_timeout=MAX_RATELIMIT_TIMEOUT)
 
 @bot.event
 async def on_ready():